@@ -1,14 +1,20 @@
 from __future__ import annotations
 
 import os
+import re
 from pathlib import Path
 from dataclasses import dataclass
 from typing import Final
+from urllib.parse import urlsplit
 
 from dotenv import load_dotenv
 
 _TRUE_VALUES: Final[set[str]] = {"1", "true", "yes", "y", "on"}
 _FALSE_VALUES: Final[set[str]] = {"0", "false", "no", "n", "off"}
+_BOT_MODES: Final[set[str]] = {"polling", "webhook"}
+_STATE_BACKENDS: Final[set[str]] = {"memory", "redis"}
+# Telegram allows 1-256 characters A-Z, a-z, 0-9, _ and - in the secret token.
+_WEBHOOK_SECRET_RE: Final = re.compile(r"[A-Za-z0-9_-]{1,256}")
 
 
 @dataclass(frozen=True)
@@ -16,8 +22,27 @@ class Config:
     bot_token: str
     miniapp_url: str
     db_path: str
+    db_pool_size: int
+    db_write_batch_size: int
+    db_write_max_latency_ms: int
     webapp_url: str
     admin_chat_id: int
+    media_cache_dir: str | None
+    photo_manifest_path: str | None
+    photo_refresh_seconds: int
+    media_warmup: bool
+    media_warmup_concurrency: int
+    update_workers: int
+    bot_workers: int
+    bot_mode: str
+    webhook_url: str | None
+    webhook_path: str
+    webhook_host: str
+    webhook_port: int
+    webhook_secret: str | None
+    webhook_max_concurrency: int
+    webhook_drain_seconds: int
+    state_backend_url: str | None
     yookassa_shop_id: str | None
     yookassa_secret_key: str | None
     yookassa_return_url: str | None
@@ -65,8 +90,41 @@ def load_config() -> Config:
     bot_token = os.getenv("BOT_TOKEN")
     miniapp_url = os.getenv("MINIAPP_URL")
     db_path = os.getenv("DB_PATH") or str(repo_root / "bot.db")
+    db_pool_size = _parse_int(os.getenv("DB_POOL_SIZE"), "DB_POOL_SIZE", default=4)
+    db_write_batch_size = _parse_int(
+        os.getenv("DB_WRITE_BATCH_SIZE"), "DB_WRITE_BATCH_SIZE", default=64
+    )
+    db_write_max_latency_ms = _parse_int(
+        os.getenv("DB_WRITE_MAX_LATENCY_MS"), "DB_WRITE_MAX_LATENCY_MS", default=5
+    )
     webapp_url = os.getenv("WEBAPP_URL") or miniapp_url
     admin_chat_id = _parse_int(os.getenv("ADMIN_CHAT_ID"), "ADMIN_CHAT_ID")
+    media_cache_dir = os.getenv("MEDIA_CACHE_DIR") or None
+    photo_manifest_path = os.getenv("PHOTO_MANIFEST_PATH") or None
+    photo_refresh_seconds = _parse_int(
+        os.getenv("PHOTO_REFRESH_SECONDS"), "PHOTO_REFRESH_SECONDS", default=60
+    )
+    media_warmup = _parse_bool(os.getenv("MEDIA_WARMUP"), "MEDIA_WARMUP", default=True)
+    media_warmup_concurrency = _parse_int(
+        os.getenv("MEDIA_WARMUP_CONCURRENCY"), "MEDIA_WARMUP_CONCURRENCY", default=4
+    )
+    update_workers = _parse_int(os.getenv("UPDATE_WORKERS"), "UPDATE_WORKERS", default=64)
+    bot_workers = _parse_int(os.getenv("BOT_WORKERS"), "BOT_WORKERS", default=1)
+    bot_mode = (os.getenv("BOT_MODE") or "polling").strip().lower()
+    webhook_url = os.getenv("WEBHOOK_URL") or None
+    webhook_path = os.getenv("WEBHOOK_PATH")
+    if not webhook_path:
+        webhook_path = (urlsplit(webhook_url).path if webhook_url else "") or "/webhook"
+    webhook_host = os.getenv("WEBHOOK_HOST") or "127.0.0.1"
+    webhook_port = _parse_int(os.getenv("WEBHOOK_PORT"), "WEBHOOK_PORT", default=8080)
+    webhook_secret = os.getenv("WEBHOOK_SECRET") or None
+    webhook_max_concurrency = _parse_int(
+        os.getenv("WEBHOOK_MAX_CONCURRENCY"), "WEBHOOK_MAX_CONCURRENCY", default=64
+    )
+    webhook_drain_seconds = _parse_int(
+        os.getenv("WEBHOOK_DRAIN_SECONDS"), "WEBHOOK_DRAIN_SECONDS", default=10
+    )
+    state_backend_url = os.getenv("STATE_BACKEND_URL") or None
     yookassa_shop_id = os.getenv("YOOKASSA_SHOP_ID") or None
     yookassa_secret_key = os.getenv("YOOKASSA_SECRET_KEY") or None
     yookassa_return_url = os.getenv("YOOKASSA_RETURN_URL") or None
@@ -85,13 +143,61 @@ def load_config() -> Config:
         raise RuntimeError("WEBAPP_URL must be set")
     if not db_path:
         raise RuntimeError("DB_PATH must be set")
+    if db_pool_size < 1:
+        raise RuntimeError("DB_POOL_SIZE must be at least 1")
+    if db_write_batch_size < 1:
+        raise RuntimeError("DB_WRITE_BATCH_SIZE must be at least 1")
+    if media_warmup_concurrency < 1:
+        raise RuntimeError("MEDIA_WARMUP_CONCURRENCY must be at least 1")
+    if update_workers < 1:
+        raise RuntimeError("UPDATE_WORKERS must be at least 1")
+    if bot_workers < 1:
+        raise RuntimeError("BOT_WORKERS must be at least 1")
+    if bot_mode not in _BOT_MODES:
+        raise RuntimeError("BOT_MODE must be polling or webhook")
+    if bot_mode == "webhook":
+        if not webhook_url:
+            raise RuntimeError("WEBHOOK_URL must be set when BOT_MODE=webhook")
+        if not webhook_secret:
+            raise RuntimeError("WEBHOOK_SECRET must be set when BOT_MODE=webhook")
+    if webhook_secret and not _WEBHOOK_SECRET_RE.fullmatch(webhook_secret):
+        raise RuntimeError("WEBHOOK_SECRET may only contain A-Z, a-z, 0-9, _ and -")
+    if not webhook_path.startswith("/"):
+        raise RuntimeError("WEBHOOK_PATH must start with /")
+    if webhook_max_concurrency < 1:
+        raise RuntimeError("WEBHOOK_MAX_CONCURRENCY must be at least 1")
+    if state_backend_url:
+        scheme = urlsplit(state_backend_url).scheme
+        if scheme not in _STATE_BACKENDS:
+            raise RuntimeError("STATE_BACKEND_URL must start with memory:// or redis://")
+        if scheme == "memory" and bot_workers > 1:
+            raise RuntimeError("STATE_BACKEND_URL=memory:// cannot be shared by BOT_WORKERS")
 
     return Config(
         bot_token=bot_token,
         miniapp_url=miniapp_url,
         db_path=db_path,
+        db_pool_size=db_pool_size,
+        db_write_batch_size=db_write_batch_size,
+        db_write_max_latency_ms=db_write_max_latency_ms,
         webapp_url=webapp_url,
         admin_chat_id=admin_chat_id,
+        media_cache_dir=media_cache_dir,
+        photo_manifest_path=photo_manifest_path,
+        photo_refresh_seconds=photo_refresh_seconds,
+        media_warmup=media_warmup,
+        media_warmup_concurrency=media_warmup_concurrency,
+        update_workers=update_workers,
+        bot_workers=bot_workers,
+        bot_mode=bot_mode,
+        webhook_url=webhook_url,
+        webhook_path=webhook_path,
+        webhook_host=webhook_host,
+        webhook_port=webhook_port,
+        webhook_secret=webhook_secret,
+        webhook_max_concurrency=webhook_max_concurrency,
+        webhook_drain_seconds=webhook_drain_seconds,
+        state_backend_url=state_backend_url,
         yookassa_shop_id=yookassa_shop_id,
         yookassa_secret_key=yookassa_secret_key,
         yookassa_return_url=yookassa_return_url,
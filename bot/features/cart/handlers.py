@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import json
 import logging
+import uuid
 from html import escape
 from typing import Any
 
@@ -12,8 +13,15 @@ from aiogram.types import CallbackQuery, Message
 from bot.config import Config
 from bot.features.cart.keyboards import cart_keyboard, payment_check_keyboard, payment_keyboard
 from bot.features.menu.handlers import render_menu
+from bot.features.menu.render import forget_rendered, show_photo
 from bot.features.menu.state import MenuStateStore
-from bot.payments import configure_yookassa, create_payment_card, create_payment_sbp, get_payment_status
+from bot.payments import (
+    YooKassaError,
+    configure_yookassa,
+    create_payment_card,
+    create_payment_sbp,
+    get_payment_status,
+)
 from bot.storage.repos import (
     admin_payload_upsert,
     cart_add,
@@ -22,8 +30,8 @@ from bot.storage.repos import (
     cart_get_items,
     cart_snapshot,
     cart_total_price,
-    get_product_by_code,
-    get_product_by_id,
+    get_cart_view,
+    get_products_by_keys,
     order_create,
     order_create_webapp,
     order_exists_by_order_id,
@@ -34,7 +42,8 @@ from bot.storage.repos import (
     OrderItemInput,
 )
 from bot.utils.formatting import format_admin_order, format_cart
-from bot.utils.media import build_media, get_placeholder_photo
+from bot.utils.media import get_placeholder_photo
+from bot.utils.outbound import Priority, outbound_priority
 
 logger = logging.getLogger(__name__)
 
@@ -129,6 +138,9 @@ async def _recalculate_webapp_items(
     items: list[dict[str, Any]],
     client_total: int | None,
 ) -> tuple[list[OrderItemInput], int]:
+    products = await get_products_by_keys(
+        db_path, [str(item["item_id"]) for item in items if item.get("item_id")]
+    )
     recalculated: list[OrderItemInput] = []
     for item in items:
         item_id = item.get("item_id")
@@ -139,11 +151,7 @@ async def _recalculate_webapp_items(
         if qty is None or qty <= 0:
             raise ValueError(f"Некорректное количество для товара {item_id}.")
 
-        product = None
-        if str(item_id).isdigit():
-            product = await get_product_by_id(db_path, int(item_id))
-        if product is None:
-            product = await get_product_by_code(db_path, str(item_id))
+        product = products.get(str(item_id))
         if product is None:
             raise ValueError(f"Товар {item_id} не найден.")
 
@@ -207,34 +215,13 @@ async def _edit_or_send_cart(
     config: Config,
     menu_state: MenuStateStore,
 ) -> None:
-    items = await cart_get_items(config.db_path, user_id)
-    total = await cart_total_price(config.db_path, user_id)
-    caption = format_cart(items, total)
-    media = build_media(get_placeholder_photo(), caption)
-    keyboard = cart_keyboard(items)
+    view = await get_cart_view(config.db_path, user_id)
+    caption = format_cart(view.items, view.total_price)
+    keyboard = cart_keyboard(view.items)
 
     state = menu_state.get(user_id)
     state.in_cart = True
-    if state.message_id and state.chat_id == chat_id:
-        try:
-            await bot.edit_message_media(
-                chat_id=chat_id,
-                message_id=state.message_id,
-                media=media,
-                reply_markup=keyboard,
-            )
-            return
-        except (TelegramBadRequest, TelegramNotFound):
-            logger.warning("Cart message missing for user %s, sending new one", user_id)
-    sent = await bot.send_photo(
-        chat_id=chat_id,
-        photo=media.media,
-        caption=media.caption,
-        parse_mode="HTML",
-        reply_markup=keyboard,
-    )
-    state.message_id = sent.message_id
-    state.chat_id = chat_id
+    await show_photo(bot, chat_id, state, user_id, get_placeholder_photo(), caption, keyboard)
 
 
 @router.callback_query(F.data == "c:open")
@@ -244,8 +231,7 @@ async def open_cart_handler(
     menu_state: MenuStateStore,
 ) -> None:
     logger.info("Cart opened by user %s", query.from_user.id)
-    async with menu_state.get_lock(query.from_user.id):
-        await _edit_or_send_cart(query.bot, query.message.chat.id, query.from_user.id, config, menu_state)
+    await _edit_or_send_cart(query.bot, query.message.chat.id, query.from_user.id, config, menu_state)
     await query.answer()
 
 
@@ -256,13 +242,14 @@ async def cart_increment_handler(
     menu_state: MenuStateStore,
 ) -> None:
     product_id = int(query.data.split(":", 2)[2])
-    async with menu_state.get_lock(query.from_user.id):
-        await cart_add(config.db_path, query.from_user.id, product_id, qty=1)
-        state = menu_state.get(query.from_user.id)
-        if state.in_cart:
-            await _edit_or_send_cart(query.bot, query.message.chat.id, query.from_user.id, config, menu_state)
-        else:
-            await render_menu(query.bot, query.message.chat.id, query.from_user.id, config, menu_state)
+    cart = await cart_add(config.db_path, query.from_user.id, product_id, qty=1)
+    state = menu_state.get(query.from_user.id)
+    if state.in_cart:
+        await _edit_or_send_cart(query.bot, query.message.chat.id, query.from_user.id, config, menu_state)
+    else:
+        await render_menu(
+            query.bot, query.message.chat.id, query.from_user.id, config, menu_state, cart=cart
+        )
     await query.answer("Добавлено")
 
 
@@ -273,13 +260,14 @@ async def cart_decrement_handler(
     menu_state: MenuStateStore,
 ) -> None:
     product_id = int(query.data.split(":", 2)[2])
-    async with menu_state.get_lock(query.from_user.id):
-        await cart_decrement(config.db_path, query.from_user.id, product_id)
-        state = menu_state.get(query.from_user.id)
-        if state.in_cart:
-            await _edit_or_send_cart(query.bot, query.message.chat.id, query.from_user.id, config, menu_state)
-        else:
-            await render_menu(query.bot, query.message.chat.id, query.from_user.id, config, menu_state)
+    cart = await cart_decrement(config.db_path, query.from_user.id, product_id)
+    state = menu_state.get(query.from_user.id)
+    if state.in_cart:
+        await _edit_or_send_cart(query.bot, query.message.chat.id, query.from_user.id, config, menu_state)
+    else:
+        await render_menu(
+            query.bot, query.message.chat.id, query.from_user.id, config, menu_state, cart=cart
+        )
     await query.answer("Обновлено")
 
 
@@ -289,9 +277,8 @@ async def clear_cart_handler(
     config: Config,
     menu_state: MenuStateStore,
 ) -> None:
-    async with menu_state.get_lock(query.from_user.id):
-        await cart_clear(config.db_path, query.from_user.id)
-        await _edit_or_send_cart(query.bot, query.message.chat.id, query.from_user.id, config, menu_state)
+    await cart_clear(config.db_path, query.from_user.id)
+    await _edit_or_send_cart(query.bot, query.message.chat.id, query.from_user.id, config, menu_state)
     await query.answer("Корзина очищена")
 
 
@@ -301,24 +288,35 @@ async def back_to_menu_handler(
     config: Config,
     menu_state: MenuStateStore,
 ) -> None:
-    async with menu_state.get_lock(query.from_user.id):
-        await render_menu(query.bot, query.message.chat.id, query.from_user.id, config, menu_state)
+    await render_menu(query.bot, query.message.chat.id, query.from_user.id, config, menu_state)
     await query.answer()
 
 
 @router.callback_query(F.data == "c:checkout")
-async def checkout_handler(query: CallbackQuery, config: Config) -> None:
+async def checkout_handler(
+    query: CallbackQuery,
+    config: Config,
+    menu_state: MenuStateStore,
+) -> None:
     total = await cart_total_price(config.db_path, query.from_user.id)
     if total <= 0:
         await query.answer("Корзина пуста.", show_alert=True)
         return
     await query.message.edit_caption("Выберите способ оплаты:", reply_markup=payment_keyboard())
+    forget_rendered(menu_state.get(query.from_user.id), caption=True, keyboard=True)
     await query.answer()
 
 
 @router.callback_query(F.data.startswith("pay:"))
-async def payment_handler(query: CallbackQuery, config: Config) -> None:
+async def payment_handler(
+    query: CallbackQuery,
+    config: Config,
+    menu_state: MenuStateStore,
+) -> None:
     method = query.data.split(":", 1)[1]
+    if method not in ("card", "sbp"):
+        await query.answer("Неизвестный способ оплаты.", show_alert=True)
+        return
     items, total = await cart_snapshot(config.db_path, query.from_user.id)
     if total <= 0:
         await query.answer("Корзина пуста.", show_alert=True)
@@ -329,47 +327,59 @@ async def payment_handler(query: CallbackQuery, config: Config) -> None:
         return
 
     configure_yookassa(config)
-    order_id = await order_create(config.db_path, query.from_user.id, total, method)
+    forget_rendered(menu_state.get(query.from_user.id), caption=True, keyboard=True)
+    # Idempotence-Key for YooKassa: unique across databases and shops, and
+    # stored with the order so the same payment can be requested again.
+    payment_key = uuid.uuid4().hex
+    order_id = await order_create(config.db_path, query.from_user.id, total, method, payment_key)
     _log_structured("info", None, order_id, message="payment_initiated", method=method, total=total)
 
     description = f"Заказ #{order_id}"
-    if method == "card":
-        payment = create_payment_card(
-            order_id=order_id,
-            amount=total,
-            description=description,
-            return_url=config.yookassa_return_url,
-        )
-        await order_set_payment(config.db_path, order_id, payment.payment_id)
-        await query.message.edit_caption(
-            f"Оплата картой: {payment.confirmation_url}",
-            reply_markup=payment_check_keyboard(),
-        )
-        await query.answer()
-        return
-
-    if method == "sbp":
-        payment = create_payment_sbp(order_id=order_id, amount=total, description=description)
-        await order_set_payment(config.db_path, order_id, payment.payment_id)
-        await query.message.edit_caption(
-            f"СБП QR: {payment.confirmation_url}",
-            reply_markup=payment_check_keyboard(),
-        )
-        await query.answer()
+    try:
+        if method == "card":
+            payment = await create_payment_card(
+                order_id=order_id,
+                amount=total,
+                description=description,
+                idempotence_key=payment_key,
+                return_url=config.yookassa_return_url,
+            )
+        else:
+            payment = await create_payment_sbp(
+                order_id=order_id,
+                amount=total,
+                description=description,
+                idempotence_key=payment_key,
+            )
+    except YooKassaError:
+        _log_structured("error", None, order_id, message="payment_create_failed", method=method)
+        logger.exception("Failed to create payment")
+        await query.answer("Не удалось создать платеж. Попробуйте позже.", show_alert=True)
         return
 
-    await query.answer("Неизвестный способ оплаты.", show_alert=True)
+    await order_set_payment(config.db_path, order_id, payment.payment_id)
+    label = "Оплата картой" if method == "card" else "СБП QR"
+    await query.message.edit_caption(
+        f"{label}: {payment.confirmation_url}",
+        reply_markup=payment_check_keyboard(),
+    )
+    await query.answer()
 
 
 @router.callback_query(F.data == "payment:check")
-async def payment_check_handler(query: CallbackQuery, bot: Bot, config: Config) -> None:
+async def payment_check_handler(
+    query: CallbackQuery,
+    bot: Bot,
+    config: Config,
+    menu_state: MenuStateStore,
+) -> None:
     order = await order_get_latest(config.db_path, query.from_user.id)
     if not order or not order.payment_id:
         await query.answer("Нет активного платежа.", show_alert=True)
         return
 
     try:
-        status = get_payment_status(order.payment_id)
+        status = await get_payment_status(order.payment_id)
     except Exception:
         _log_structured("error", None, order.id, message="payment_check_failed")
         logger.exception("Failed to check payment")
@@ -377,6 +387,7 @@ async def payment_check_handler(query: CallbackQuery, bot: Bot, config: Config)
         return
 
     _log_structured("info", None, order.id, message="payment_status_checked", payment_status=status)
+    forget_rendered(menu_state.get(query.from_user.id), caption=True, keyboard=True)
     if status == "succeeded":
         await order_set_status(config.db_path, order.id, "paid")
         items = await cart_get_items(config.db_path, query.from_user.id)
@@ -384,7 +395,8 @@ async def payment_check_handler(query: CallbackQuery, bot: Bot, config: Config)
         await cart_clear(config.db_path, query.from_user.id)
         await query.message.edit_caption("Оплата успешна! Заказ принят.", reply_markup=None)
         admin_text = format_admin_order(query.from_user.id, items, total, order.payment_method or "-")
-        await bot.send_message(config.admin_chat_id, admin_text)
+        with outbound_priority(Priority.ADMIN):
+            await bot.send_message(config.admin_chat_id, admin_text)
         await query.answer()
         return
 
@@ -469,6 +481,7 @@ async def webapp_order_handler(message: Message, config: Config) -> None:
 
     await message.answer(confirmation)
     try:
-        await message.bot.send_message(config.admin_chat_id, confirmation)
+        with outbound_priority(Priority.ADMIN):
+            await message.bot.send_message(config.admin_chat_id, confirmation)
     except Exception:
         logger.exception("Failed to notify admin about webapp order")
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+from aiogram.types import Update
+
+from bot.features.menu.state import MenuState
+
+NAVIGATION_CALLBACKS = frozenset({"m:i:prev", "m:i:next", "m:p:prev", "m:p:next"})
+
+
+@dataclass(slots=True)
+class NavDelta:
+    """Net effect of one or more item/photo navigation clicks."""
+
+    items: int = 0
+    photos: int = 0
+    item_moved: bool = False
+
+    @classmethod
+    def item(cls, step: int) -> NavDelta:
+        return cls(items=step, item_moved=True)
+
+    @classmethod
+    def photo(cls, step: int) -> NavDelta:
+        return cls(photos=step)
+
+    def merge(self, later: NavDelta) -> None:
+        if later.item_moved:
+            # Switching items resets the photo, so earlier photo steps no longer count.
+            self.items += later.items
+            self.photos = later.photos
+            self.item_moved = True
+        else:
+            self.photos += later.photos
+
+    def apply(self, state: MenuState) -> None:
+        if self.item_moved:
+            state.item_index += self.items
+            state.photo_index = 0
+            state.show_details = False
+            state.categories_mode = False
+        state.photo_index += self.photos
+
+
+def is_navigation_update(update: Update) -> bool:
+    """Navigation clicks coalesce among themselves, so they may overlap each other."""
+    query = update.callback_query
+    return query is not None and query.data in NAVIGATION_CALLBACKS
+
+
+RenderNav = Callable[[NavDelta], Awaitable[None]]
+
+
+@dataclass(slots=True)
+class _Batch:
+    delta: NavDelta
+    render: RenderNav
+    done: asyncio.Future[None]
+
+
+class NavigationCoalescer:
+    """Latest-wins navigation: at most one render in flight per user.
+
+    Clicks arriving while a user's render runs are merged into one pending
+    delta; when the render finishes, a single render applies the sum. Every
+    merged caller waits for that render, so each callback is still answered.
+    """
+
+    def __init__(self) -> None:
+        # user_id -> clicks waiting for the in-flight render (None: nothing waiting).
+        self._active: dict[int, _Batch | None] = {}
+        self.clicks = 0
+        self.renders = 0
+        self.coalesced = 0
+
+    async def submit(self, user_id: int, delta: NavDelta, render: RenderNav) -> None:
+        self.clicks += 1
+        if user_id in self._active:
+            batch = self._active[user_id]
+            if batch is None:
+                loop = asyncio.get_running_loop()
+                batch = _Batch(delta=NavDelta(), render=render, done=loop.create_future())
+                self._active[user_id] = batch
+            else:
+                self.coalesced += 1
+            batch.delta.merge(delta)
+            # The newest click's callback renders the merged result.
+            batch.render = render
+            await asyncio.shield(batch.done)
+            return
+
+        self._active[user_id] = None
+        try:
+            self.renders += 1
+            await render(delta)
+        finally:
+            await self._drain(user_id)
+
+    async def _drain(self, user_id: int) -> None:
+        batch: _Batch | None = None
+        try:
+            while (batch := self._active.get(user_id)) is not None:
+                self._active[user_id] = None
+                self.renders += 1
+                try:
+                    await batch.render(batch.delta)
+                except Exception as exc:
+                    batch.done.set_exception(exc)
+                else:
+                    batch.done.set_result(None)
+        finally:
+            # Normally a no-op; on cancellation, release anyone still waiting.
+            pending = self._active.pop(user_id, None)
+            for waiting in (batch, pending):
+                if waiting is not None and not waiting.done.done():
+                    waiting.done.cancel()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "clicks": self.clicks,
+            "renders": self.renders,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._active),
+        }
+
+
+navigation = NavigationCoalescer()
@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+from collections import Counter
+from dataclasses import replace
+from pathlib import Path
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramNotFound
+from aiogram.types import InlineKeyboardMarkup, InputMediaPhoto, Message
+
+from bot.features.menu.state import MenuState, RenderFingerprint
+from bot.utils.images import image_pipeline
+from bot.utils.media import build_media, is_cached_media, is_stale_file_error, media_cache
+
+logger = logging.getLogger(__name__)
+
+# Counts of the Telegram call chosen for each render: send, media, caption, markup, skip.
+render_decisions: Counter[str] = Counter()
+
+
+def keyboard_fingerprint(keyboard: InlineKeyboardMarkup | None) -> int:
+    """Stable across restarts (unlike ``hash``), since fingerprints are persisted."""
+    if keyboard is None:
+        return 0
+    digest = hashlib.blake2b(keyboard.model_dump_json(exclude_none=True).encode(), digest_size=8)
+    return int.from_bytes(digest.digest(), "big", signed=True)
+
+
+def _is_not_modified(exc: Exception) -> bool:
+    return "message is not modified" in str(exc).lower()
+
+
+def forget_rendered(state: MenuState, caption: bool = False, keyboard: bool = False) -> None:
+    """Mark parts of the menu message as changed by something other than show_photo."""
+    if state.rendered is None:
+        return
+    state.rendered = replace(
+        state.rendered,
+        caption=None if caption else state.rendered.caption,
+        keyboard=None if keyboard else state.rendered.keyboard,
+    )
+
+
+def _decide(old: RenderFingerprint | None, new: RenderFingerprint) -> str:
+    if old is None or old.photo != new.photo:
+        return "media"
+    if old.caption != new.caption:
+        return "caption"
+    if old.keyboard != new.keyboard:
+        return "markup"
+    return "skip"
+
+
+async def show_photo(
+    bot: Bot,
+    chat_id: int,
+    state: MenuState,
+    user_id: int,
+    photo: Path,
+    caption: str,
+    keyboard: InlineKeyboardMarkup,
+) -> None:
+    """Bring the user's menu message to (photo, caption, keyboard) with the cheapest call.
+
+    The last rendered fingerprint is kept on ``state``: an unchanged photo
+    needs only a caption or reply-markup edit, and an identical render needs
+    no request at all. Anything else edits the media in place or sends a new
+    message, reusing a cached file_id when there is one.
+    """
+    new = RenderFingerprint(
+        photo=str(photo), caption=caption, keyboard=keyboard_fingerprint(keyboard)
+    )
+    has_message = bool(state.message_id) and state.chat_id == chat_id
+    decision = _decide(state.rendered if has_message else None, new)
+    state.rendered = None
+    if decision == "skip":
+        render_decisions["skip"] += 1
+        state.rendered = new
+        return
+    if decision in ("caption", "markup"):
+        try:
+            if decision == "caption":
+                await bot.edit_message_caption(
+                    chat_id=chat_id,
+                    message_id=state.message_id,
+                    caption=caption,
+                    parse_mode="HTML",
+                    reply_markup=keyboard,
+                )
+            else:
+                await bot.edit_message_reply_markup(
+                    chat_id=chat_id,
+                    message_id=state.message_id,
+                    reply_markup=keyboard,
+                )
+        except (TelegramBadRequest, TelegramNotFound) as exc:
+            if not _is_not_modified(exc):
+                logger.warning("Light edit failed for user %s, editing media", user_id)
+                await _show_media(bot, chat_id, state, user_id, photo, caption, keyboard)
+                state.rendered = new
+                return
+            decision = "skip"
+        render_decisions[decision] += 1
+        state.rendered = new
+        return
+    await _show_media(bot, chat_id, state, user_id, photo, caption, keyboard)
+    state.rendered = new
+
+
+async def _show_media(
+    bot: Bot,
+    chat_id: int,
+    state: MenuState,
+    user_id: int,
+    photo: Path,
+    caption: str,
+    keyboard: InlineKeyboardMarkup,
+) -> None:
+    # Placeholders arrive as source paths; cache under the file actually sent.
+    photo = image_pipeline.resolve(photo)
+    if not media_cache.contains(photo):
+        # With BOT_WORKERS > 1 another process may have uploaded it meanwhile.
+        await media_cache.fetch(photo)
+    media = build_media(photo, caption)
+    try:
+        result = await _edit_or_send_media(bot, chat_id, state, user_id, media, keyboard)
+    except TelegramBadRequest as exc:
+        if not is_cached_media(media) or not is_stale_file_error(exc):
+            raise
+        logger.warning("Cached file_id for %s rejected, uploading again", photo)
+        await media_cache.forget(photo)
+        media = build_media(photo, caption, use_cache=False)
+        result = await _edit_or_send_media(bot, chat_id, state, user_id, media, keyboard)
+    # None means a newer edit of the message replaced this one: no file_id of ours.
+    if result is not None and not is_cached_media(media):
+        await media_cache.remember(photo, result)
+
+
+async def _edit_or_send_media(
+    bot: Bot,
+    chat_id: int,
+    state: MenuState,
+    user_id: int,
+    media: InputMediaPhoto,
+    keyboard: InlineKeyboardMarkup,
+) -> Message | bool | None:
+    if state.message_id and state.chat_id == chat_id:
+        try:
+            result = await bot.edit_message_media(
+                chat_id=chat_id,
+                message_id=state.message_id,
+                media=media,
+                reply_markup=keyboard,
+            )
+            render_decisions["media"] += 1
+            return result
+        except (TelegramBadRequest, TelegramNotFound) as exc:
+            if _is_not_modified(exc):
+                render_decisions["skip"] += 1
+                return True
+            if is_cached_media(media) and is_stale_file_error(exc):
+                raise
+            logger.warning("Menu message missing for user %s, sending new one", user_id)
+    sent = await bot.send_photo(
+        chat_id=chat_id,
+        photo=media.media,
+        caption=media.caption,
+        parse_mode="HTML",
+        reply_markup=keyboard,
+    )
+    render_decisions["send"] += 1
+    state.message_id = sent.message_id
+    state.chat_id = chat_id
+    return sent
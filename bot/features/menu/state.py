@@ -1,10 +1,40 @@
 from __future__ import annotations
 
 import asyncio
-from dataclasses import dataclass
+import contextlib
+import json
+import logging
+import sys
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field, fields
+from typing import Any, Awaitable, Callable, Iterator
 
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
 
-@dataclass
+from bot.storage.kv import KVBackend
+from bot.storage.sessions import menu_state_load, menu_states_save
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_USERS = 100_000
+DEFAULT_IDLE_TTL = 24 * 60 * 60.0
+DEFAULT_FLUSH_INTERVAL = 2.0
+# Ordered dict slot plus the int key, roughly, on 64-bit CPython.
+_DICT_ENTRY_BYTES = 100
+
+
+@dataclass(frozen=True, slots=True)
+class RenderFingerprint:
+    """What the menu message currently shows; ``None`` parts are unknown."""
+
+    photo: str | None
+    caption: str | None
+    keyboard: int | None
+
+
+@dataclass(slots=True)
 class MenuState:
     message_id: int | None = None
     chat_id: int | None = None
@@ -16,17 +46,73 @@ class MenuState:
     awaiting_search: bool = False
     categories_mode: bool = False
     in_cart: bool = False
+    rendered: RenderFingerprint | None = None
+    touched_at: float = field(default=0.0, repr=False, compare=False)
 
 
 class MenuStateStore:
-    def __init__(self) -> None:
-        self._states: dict[int, MenuState] = {}
-        self._locks: dict[int, asyncio.Lock] = {}
+    """Per-user menu state, bounded by count (LRU) and idle time (TTL).
+
+    States are kept in access order, so both the least recently used and the
+    longest idle user sit at the front. A user with an update in progress
+    (see ``in_use``) is never evicted.
+    """
+
+    def __init__(
+        self,
+        max_users: int = DEFAULT_MAX_USERS,
+        idle_ttl: float = DEFAULT_IDLE_TTL,
+    ) -> None:
+        if max_users < 1:
+            raise ValueError("max_users must be at least 1")
+        self.max_users = max_users
+        self.idle_ttl = idle_ttl
+        self._states: OrderedDict[int, MenuState] = OrderedDict()
+        # user_id -> number of updates currently being handled for that user.
+        self._in_use: dict[int, int] = {}
+        self.created = 0
+        self.evicted_lru = 0
+        self.evicted_ttl = 0
+
+    def __len__(self) -> int:
+        return len(self._states)
 
     def get(self, user_id: int) -> MenuState:
-        if user_id not in self._states:
-            self._states[user_id] = MenuState()
-        return self._states[user_id]
+        state = self._states.get(user_id)
+        if state is None:
+            return self._adopt(user_id, MenuState())
+        self._states.move_to_end(user_id)
+        now = time.monotonic()
+        state.touched_at = now
+        self._evict(now)
+        return state
+
+    def _adopt(self, user_id: int, state: MenuState) -> MenuState:
+        now = time.monotonic()
+        state.touched_at = now
+        self._states[user_id] = state
+        self.created += 1
+        self._evict(now)
+        return state
+
+    def _evict(self, now: float) -> None:
+        skipped = 0
+        while self._states and skipped <= len(self._in_use):
+            user_id, state = next(iter(self._states.items()))
+            expired = now - state.touched_at > self.idle_ttl
+            if not expired and len(self._states) <= self.max_users:
+                return
+            if user_id in self._in_use:
+                # In use right now: treat as fresh rather than drop it mid-update.
+                state.touched_at = now
+                self._states.move_to_end(user_id)
+                skipped += 1
+                continue
+            del self._states[user_id]
+            if expired:
+                self.evicted_ttl += 1
+            else:
+                self.evicted_lru += 1
 
     def reset_filters(self, user_id: int) -> None:
         state = self.get(user_id)
@@ -37,7 +123,260 @@ class MenuStateStore:
         state.show_details = False
         state.categories_mode = False
 
-    def get_lock(self, user_id: int) -> asyncio.Lock:
-        if user_id not in self._locks:
-            self._locks[user_id] = asyncio.Lock()
-        return self._locks[user_id]
+    @contextlib.contextmanager
+    def in_use(self, user_id: int) -> Iterator[None]:
+        """Keep ``user_id``'s state from being evicted while an update is handled.
+
+        Ordering between a user's updates is up to the update executor.
+        """
+        self._in_use[user_id] = self._in_use.get(user_id, 0) + 1
+        try:
+            yield
+        finally:
+            remaining = self._in_use[user_id] - 1
+            if remaining:
+                self._in_use[user_id] = remaining
+            else:
+                del self._in_use[user_id]
+
+    def stats(self) -> dict[str, int | float]:
+        entry_bytes = sys.getsizeof(MenuState()) + _DICT_ENTRY_BYTES
+        return {
+            "users": len(self._states),
+            "max_users": self.max_users,
+            "idle_ttl": self.idle_ttl,
+            "created": self.created,
+            "evicted_lru": self.evicted_lru,
+            "evicted_ttl": self.evicted_ttl,
+            "in_use": len(self._in_use),
+            "approx_bytes": len(self._states) * entry_bytes,
+        }
+
+
+def _encode_state(state: MenuState) -> str:
+    data = {name: getattr(state, name) for name in _PERSISTED_FIELDS}
+    rendered = state.rendered
+    data["rendered"] = (
+        [rendered.photo, rendered.caption, rendered.keyboard] if rendered is not None else None
+    )
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def _decode_state(raw: str) -> MenuState:
+    data = json.loads(raw)
+    state = MenuState(**{name: data[name] for name in _PERSISTED_FIELDS if name in data})
+    rendered = data.get("rendered")
+    if rendered:
+        state.rendered = RenderFingerprint(*rendered)
+    return state
+
+
+_PERSISTED_FIELDS = tuple(
+    item.name for item in fields(MenuState) if item.name not in ("rendered", "touched_at")
+)
+
+
+class PersistentMenuStateStore(MenuStateStore):
+    """MenuStateStore backed by the ``menu_states`` table.
+
+    A user's state is read from SQLite the first time one of their updates
+    arrives (``load``, called by :class:`MenuStateMiddleware`). Every ``get``
+    marks the user dirty; dirty states are written in one batch every
+    ``flush_interval`` seconds and on close, so a restart keeps each user's
+    menu message, filters and cart-view mode.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        max_users: int = DEFAULT_MAX_USERS,
+        idle_ttl: float = DEFAULT_IDLE_TTL,
+    ) -> None:
+        super().__init__(max_users=max_users, idle_ttl=idle_ttl)
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        # Evicted states stay referenced here until flushed, so nothing is lost.
+        self._dirty: dict[int, MenuState] = {}
+        self._task: asyncio.Task[None] | None = None
+        self.loads = 0
+        self.flushes = 0
+        self.flushed_states = 0
+
+    def get(self, user_id: int) -> MenuState:
+        if user_id not in self._states and user_id in self._dirty:
+            # Evicted before its last change was flushed: take that copy back.
+            state = self._adopt(user_id, self._dirty[user_id])
+        else:
+            state = super().get(user_id)
+        self._dirty[user_id] = state
+        return state
+
+    async def load(self, user_id: int) -> None:
+        """Make sure ``user_id`` is in memory, reading the saved state if needed."""
+        if user_id in self._states:
+            return
+        state = self._dirty.get(user_id)
+        if state is None:
+            raw = await menu_state_load(self.db_path, user_id)
+            self.loads += 1
+            if user_id in self._states:
+                return
+            state = _decode_state(raw) if raw else MenuState()
+        self._adopt(user_id, state)
+
+    async def commit(self, user_id: int) -> None:
+        # Dirty states are flushed in batches by the background task.
+        return None
+
+    async def flush(self) -> int:
+        dirty, self._dirty = self._dirty, {}
+        if not dirty:
+            return 0
+        try:
+            await menu_states_save(
+                self.db_path, [(user_id, _encode_state(state)) for user_id, state in dirty.items()]
+            )
+        except Exception:
+            # Keep newer marks, put back the rest for the next attempt.
+            self._dirty = {**dirty, **self._dirty}
+            raise
+        self.flushes += 1
+        self.flushed_states += len(dirty)
+        return len(dirty)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Failed to flush %s menu states", len(self._dirty))
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="menu-state-flush")
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict[str, int | float]:
+        stats = super().stats()
+        stats.update(
+            dirty=len(self._dirty),
+            loads=self.loads,
+            flushes=self.flushes,
+            flushed_states=self.flushed_states,
+        )
+        return stats
+
+
+class KVMenuStateStore(MenuStateStore):
+    """MenuStateStore kept in a shared state backend (``bot.storage.kv``).
+
+    Any instance may handle a user's next update, so a state is held in
+    memory only while that user's updates are being handled: ``load`` reads
+    it, normally from the keys the update prefetched, and ``commit`` writes
+    it back with compare-and-set if it changed. A write that loses the race
+    to another instance is dropped and counted by the backend. Saved states
+    expire ``idle_ttl`` seconds after their last change.
+    """
+
+    def __init__(
+        self,
+        backend: KVBackend,
+        idle_ttl: float = DEFAULT_IDLE_TTL,
+        prefix: str = "menu:",
+    ) -> None:
+        super().__init__(idle_ttl=idle_ttl)
+        self.backend = backend
+        self.prefix = prefix
+        # user_id -> encoded state as last read or written, expected by the next write.
+        self._saved: dict[int, bytes | None] = {}
+        self.loads = 0
+        self.writes = 0
+
+    def key(self, user_id: int) -> str:
+        return f"{self.prefix}{user_id}"
+
+    def prefetch_keys(self, data: dict[str, Any]) -> list[str]:
+        user = data.get("event_from_user")
+        return [self.key(user.id)] if user is not None else []
+
+    async def load(self, user_id: int) -> None:
+        if user_id in self._states:
+            # Another update of this user is running and already has it.
+            return
+        raw = await self.backend.get(self.key(user_id))
+        self.loads += 1
+        if user_id in self._states:
+            return
+        self._saved[user_id] = raw
+        self._adopt(user_id, _decode_state(raw.decode()) if raw else MenuState())
+
+    async def commit(self, user_id: int) -> None:
+        state = self._states.get(user_id)
+        if state is None:
+            return
+        raw = _encode_state(state).encode()
+        saved = self._saved.get(user_id)
+        if raw == saved:
+            return
+        self.backend.pipeline().cas(self.key(user_id), saved, raw, self.idle_ttl).submit()
+        self._saved[user_id] = raw
+        self.writes += 1
+
+    @contextlib.contextmanager
+    def in_use(self, user_id: int) -> Iterator[None]:
+        try:
+            with super().in_use(user_id):
+                yield
+        finally:
+            if user_id not in self._in_use:
+                # The next update may land elsewhere; read it fresh then.
+                self._states.pop(user_id, None)
+                self._saved.pop(user_id, None)
+
+    def start(self) -> None:
+        return None
+
+    async def close(self) -> None:
+        # Writes go out with each update; the backend is closed by main.
+        return None
+
+    def stats(self) -> dict[str, int | float]:
+        stats = super().stats()
+        stats.update(loads=self.loads, writes=self.writes)
+        return stats
+
+
+class MenuStateMiddleware(BaseMiddleware):
+    """Outer update middleware: load the sender's menu state before handlers run.
+
+    The state is pinned in memory until the update has been handled, then
+    committed to the store.
+    """
+
+    def __init__(self, store: PersistentMenuStateStore | KVMenuStateStore) -> None:
+        self.store = store
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+        with self.store.in_use(user.id):
+            await self.store.load(user.id)
+            try:
+                return await handler(event, data)
+            finally:
+                await self.store.commit(user.id)
@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+import logging
+
+from aiogram import F, Router
+from aiogram.filters import Command
+from aiogram.types import CallbackQuery, Message
+
+from bot.config import Config
+from bot.features.orders.keyboards import order_history_keyboard
+from bot.storage.orders import order_history
+from bot.utils.formatting import format_order_history
+
+logger = logging.getLogger(__name__)
+
+router = Router()
+
+
+@router.message(Command("orders"))
+async def orders_command_handler(message: Message, config: Config) -> None:
+    logger.info("Order history opened by user %s", message.from_user.id)
+    page = await order_history(config.db_path, message.from_user.id)
+    await message.answer(
+        format_order_history(page),
+        reply_markup=order_history_keyboard(page.next_cursor),
+    )
+
+
+@router.callback_query(F.data.startswith("o:more:"))
+async def orders_more_handler(query: CallbackQuery, config: Config) -> None:
+    cursor = int(query.data.split(":", 2)[2])
+    page = await order_history(config.db_path, query.from_user.id, cursor=cursor)
+    if query.message:
+        await query.message.edit_reply_markup(reply_markup=None)
+        await query.message.answer(
+            format_order_history(page, first_page=False),
+            reply_markup=order_history_keyboard(page.next_cursor),
+        )
+    await query.answer()
@@ -0,0 +1,13 @@
+from __future__ import annotations
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+
+def order_history_keyboard(next_cursor: int | None) -> InlineKeyboardMarkup | None:
+    if next_cursor is None:
+        return None
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text="⬇️ Ещё заказы", callback_data=f"o:more:{next_cursor}")],
+        ]
+    )
@@ -1,28 +1,131 @@
 from __future__ import annotations
 
 import asyncio
+import contextlib
 import logging
+from pathlib import Path
+from typing import Any
 
 from aiogram import Bot, Dispatcher, Router
 from aiogram.enums import ParseMode
 from aiogram.filters import Command, CommandStart
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, Message
 
-from .config import load_config
+from .config import Config, load_config
+from .features.menu.navigation import is_navigation_update
+from .features.menu.state import KVMenuStateStore, MenuStateMiddleware, PersistentMenuStateStore
+from .features.orders.handlers import router as orders_router
+from .payments import close_yookassa
+from .storage.catalog import load_catalog
+from .storage.db import init_db
+from .storage.kv import KVBackend, KVSessionMiddleware, open_kv
+from .storage.pool import close_pools, configure_pools
+from .storage.sessions import KVStorage, SQLiteStorage
+from .storage.writer import close_write_queues, configure_write_queues
+from .supervisor import run_supervisor
+from .utils.executor import UpdateExecutor
+from .utils.images import configure_images, image_pipeline
+from .utils.media import media_cache, photo_manifest
+from .utils.outbound import outbound_scheduler
+from .utils.throttle import (
+    GLOBAL_BURST,
+    GLOBAL_RATE,
+    RateLimiter,
+    RateLimitMiddleware,
+    SharedRateLimitMiddleware,
+)
+from .utils.warmup import (
+    catalog_source_photos,
+    follow_photos,
+    refresh_photos,
+    warm_media_cache,
+    watch_photos,
+)
+from .webhook import run_webhook
 
 
-async def main() -> None:
+def configure_logging(prefix: str = "") -> None:
     logging.basicConfig(
         level=logging.INFO,
-        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+        format=f"%(asctime)s %(levelname)s {prefix}%(name)s: %(message)s",
     )
 
-    config = load_config()
 
-    bot = Bot(token=config.bot_token, parse_mode=ParseMode.HTML)
-    storage = MemoryStorage()
-    dp = Dispatcher(storage=storage)
+async def setup_storage(
+    config: Config,
+    migrate: bool = True,
+    owns_manifest: bool = True,
+) -> Path | None:
+    """Open the database, load the catalog and scan photos.
+
+    Returns the manifest path this process may write, if any.
+    """
+    configure_pools(config.db_pool_size)
+    configure_write_queues(config.db_write_batch_size, config.db_write_max_latency_ms / 1000)
+    configure_images(config.media_cache_dir)
+    if migrate:
+        await init_db(config.db_path)
+    await load_catalog(config.db_path)
+    manifest_path = Path(config.photo_manifest_path) if config.photo_manifest_path else None
+    if manifest_path is not None:
+        photo_manifest.load(manifest_path)
+        if not owns_manifest:
+            manifest_path = None
+    await refresh_photos(config.db_path, manifest_path)
+    await media_cache.load(config.db_path)
+    return manifest_path
+
+
+MenuStore = PersistentMenuStateStore | KVMenuStateStore
+
+
+def open_state(config: Config) -> tuple[KVBackend | None, MenuStore]:
+    """Shared state backend, if configured, and the menu state store on top of it."""
+    if config.state_backend_url is None:
+        return None, PersistentMenuStateStore(config.db_path)
+    kv = open_kv(config.state_backend_url)
+    return kv, KVMenuStateStore(kv)
+
+
+def build_dispatcher(
+    config: Config,
+    menu_state: MenuStore,
+    processes: int = 1,
+    kv: KVBackend | None = None,
+) -> Dispatcher:
+    kv_storage = KVStorage(kv) if kv is not None else None
+    storage = kv_storage or SQLiteStorage(config.db_path)
+    # The FSM middleware is registered below, after the rate limiter, so a throttled
+    # update never touches storage, and after the executor, so a user's updates
+    # read and write FSM data in arrival order.
+    dp = Dispatcher(storage=storage, config=config, menu_state=menu_state, disable_fsm=True)
+    # Each process sees only its share of the users, so it gets that share of the global budget.
+    limiter = RateLimiter(
+        global_rate=GLOBAL_RATE / processes, global_burst=GLOBAL_BURST / processes
+    )
+    dp.update.outer_middleware(RateLimitMiddleware(limiter))
+    dp.update.outer_middleware(
+        UpdateExecutor(config.update_workers, may_overlap=is_navigation_update)
+    )
+    if kv is not None:
+        shared_limiter = SharedRateLimitMiddleware(kv)
+        assert kv_storage is not None and isinstance(menu_state, KVMenuStateStore)
+
+        def fsm_keys(data: dict[str, Any]) -> tuple[str, ...]:
+            context = dp.fsm.resolve_event_context(data["bot"], data)
+            return kv_storage.keys(context.key) if context is not None else ()
+
+        dp.update.outer_middleware(
+            KVSessionMiddleware(
+                kv, [menu_state.prefetch_keys, shared_limiter.prefetch_keys, fsm_keys]
+            )
+        )
+        dp.update.outer_middleware(shared_limiter)
+        # After the session, so the FSM state is among the prefetched keys.
+        dp.update.outer_middleware(dp.fsm)
+    else:
+        dp.update.outer_middleware(dp.fsm)
+    dp.update.outer_middleware(MenuStateMiddleware(menu_state))
     router = Router()
 
     async def send_miniapp(message: Message) -> None:
@@ -45,12 +148,90 @@ async def main() -> None:
         await send_miniapp(message)
 
     dp.include_router(router)
+    dp.include_router(orders_router)
+    return dp
+
+
+async def prepare_media(
+    bot: Bot,
+    config: Config,
+    manifest_path: Path | None,
+    primary: bool = True,
+) -> None:
+    """Build derivatives, warm the file_id cache and watch for photo changes.
+
+    With BOT_WORKERS > 1 only the primary worker encodes, uploads and
+    watches; the others adopt what it produces.
+    """
+    sources = await catalog_source_photos(config.db_path)
+    if not primary:
+        await asyncio.to_thread(image_pipeline.adopt, sources)
+        if config.photo_refresh_seconds > 0:
+            await follow_photos(config.db_path, config.photo_refresh_seconds)
+        return
+    await image_pipeline.prepare(sources)
+    if config.media_warmup:
+        await warm_media_cache(
+            bot,
+            config.db_path,
+            config.admin_chat_id,
+            concurrency=config.media_warmup_concurrency,
+        )
+    if config.photo_refresh_seconds > 0:
+        await watch_photos(config.db_path, config.photo_refresh_seconds, manifest_path)
+
+
+async def shutdown(
+    media_task: asyncio.Task[None],
+    menu_state: MenuStore,
+    kv: KVBackend | None = None,
+) -> None:
+    if not media_task.done():
+        media_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await media_task
+    image_pipeline.close()
+    await outbound_scheduler.close()
+    await close_yookassa()
+    await menu_state.close()
+    if kv is not None:
+        await kv.close()
+    await close_write_queues()
+    await close_pools()
+
+
+async def main() -> None:
+    configure_logging()
+    config = load_config()
+    if config.bot_workers > 1:
+        await init_db(config.db_path)
+        # Built only to learn which update types the workers handle.
+        dp = build_dispatcher(config, PersistentMenuStateStore(config.db_path))
+        await run_supervisor(config, dp.resolve_used_update_types())
+        return
+
+    manifest_path = await setup_storage(config)
+    bot = Bot(token=config.bot_token, parse_mode=ParseMode.HTML)
+    bot.session.middleware(outbound_scheduler)
+    kv, menu_state = open_state(config)
+    dp = build_dispatcher(config, menu_state, kv=kv)
+    menu_state.start()
+    media_task = asyncio.create_task(
+        prepare_media(bot, config, manifest_path), name="media-prepare"
+    )
 
     try:
-        await dp.start_polling(bot)
+        if config.bot_mode == "webhook":
+            await run_webhook(bot, dp, config)
+        else:
+            # getUpdates is refused while a webhook is set, e.g. after switching modes.
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
     except Exception:
         logging.exception("Bot stopped unexpectedly")
         raise
+    finally:
+        await shutdown(media_task, menu_state, kv)
 
 
 if __name__ == "__main__":
@@ -1,13 +1,36 @@
 from __future__ import annotations
 
+import asyncio
+import logging
+import random
+import time
 from dataclasses import dataclass
 from decimal import Decimal
 from typing import Any
 
-from yookassa import Configuration, Payment
+import aiohttp
 
 from .config import Config
 
+logger = logging.getLogger(__name__)
+
+API_URL = "https://api.yookassa.ru/v3"
+DEFAULT_TIMEOUT = 10.0
+DEFAULT_RETRIES = 3
+MAX_CONNECTIONS = 16
+_BACKOFF = 0.5
+_MAX_BACKOFF = 5.0
+_RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class YooKassaError(Exception):
+    """YooKassa refused a request, or kept failing after all retries."""
+
+    def __init__(self, message: str, status: int | None = None, code: str | None = None) -> None:
+        super().__init__(message)
+        self.status = status
+        self.code = code
+
 
 @dataclass(frozen=True)
 class YooKassaPayment:
@@ -16,20 +39,207 @@ class YooKassaPayment:
     status: str
 
 
+@dataclass
+class _CallStats:
+    count: int = 0
+    failures: int = 0
+    retries: int = 0
+    total: float = 0.0
+    max: float = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+
+class YooKassaClient:
+    """YooKassa API over one aiohttp session with keep-alive connections.
+
+    Each attempt is limited to ``timeout`` seconds. Network errors, 429 and
+    5xx answers, and YooKassa's "202: still processing" are retried up to
+    ``retries`` times with backoff. Payment creation carries an
+    Idempotence-Key that stays the same across retries, so a retry never
+    creates a second payment.
+    """
+
+    def __init__(
+        self,
+        shop_id: str,
+        secret_key: str,
+        api_url: str = API_URL,
+        timeout: float = DEFAULT_TIMEOUT,
+        retries: int = DEFAULT_RETRIES,
+        max_connections: int = MAX_CONNECTIONS,
+    ) -> None:
+        self.shop_id = shop_id
+        self.secret_key = secret_key
+        self.api_url = api_url.rstrip("/")
+        self.timeout = timeout
+        self.retries = retries
+        self.max_connections = max_connections
+        self._session: aiohttp.ClientSession | None = None
+        self._stats: dict[str, _CallStats] = {}
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                auth=aiohttp.BasicAuth(self.shop_id, self.secret_key),
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                raise_for_status=False,
+            )
+        return self._session
+
+    async def _attempt(
+        self,
+        method: str,
+        path: str,
+        payload: dict[str, Any] | None,
+        headers: dict[str, str],
+    ) -> tuple[int, dict[str, Any], str | None]:
+        async with self._get_session().request(
+            method, f"{self.api_url}{path}", json=payload, headers=headers
+        ) as resp:
+            try:
+                body = await resp.json(content_type=None)
+            except ValueError:
+                body = None
+            retry_after = resp.headers.get("Retry-After")
+            return resp.status, body if isinstance(body, dict) else {}, retry_after
+
+    async def _request(
+        self,
+        name: str,
+        method: str,
+        path: str,
+        payload: dict[str, Any] | None = None,
+        idempotence_key: str | None = None,
+    ) -> dict[str, Any]:
+        stats = self._stats.setdefault(name, _CallStats())
+        headers = {"Idempotence-Key": idempotence_key} if idempotence_key else {}
+        started = time.monotonic()
+        attempt = 0
+        try:
+            while True:
+                delay = None
+                try:
+                    status, body, retry_after = await self._attempt(method, path, payload, headers)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+                    problem = f"{exc.__class__.__name__}: {exc}"
+                else:
+                    if status == 200:
+                        return body
+                    # 202: accepted but not done yet, so ask again with the same key.
+                    if status != 202 and status not in _RETRY_STATUSES:
+                        raise YooKassaError(
+                            body.get("description") or f"HTTP {status}",
+                            status=status,
+                            code=body.get("code"),
+                        )
+                    delay = _retry_delay(body, retry_after)
+                    problem = f"HTTP {status}"
+                if attempt >= self.retries:
+                    raise YooKassaError(f"{name} failed after {attempt + 1} attempts: {problem}")
+                if delay is None:
+                    delay = min(_MAX_BACKOFF, _BACKOFF * 2**attempt) * random.uniform(0.5, 1.0)
+                attempt += 1
+                stats.retries += 1
+                logger.warning("YooKassa %s: %s, retrying in %.1fs", name, problem, delay)
+                await asyncio.sleep(delay)
+        except Exception:
+            stats.failures += 1
+            raise
+        finally:
+            stats.add(time.monotonic() - started)
+
+    async def create_payment(self, payload: dict[str, Any], idempotence_key: str) -> dict[str, Any]:
+        body = await self._request(
+            "create_payment", "POST", "/payments", payload, idempotence_key=idempotence_key
+        )
+        return _check_payment(body)
+
+    async def get_payment(self, payment_id: str) -> dict[str, Any]:
+        body = await self._request("get_payment", "GET", f"/payments/{payment_id}")
+        return _check_payment(body)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            name: {
+                "count": call.count,
+                "failures": call.failures,
+                "retries": call.retries,
+                "avg_ms": call.total / call.count * 1000 if call.count else 0.0,
+                "max_ms": call.max * 1000,
+            }
+            for name, call in self._stats.items()
+        }
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+def _retry_delay(body: dict[str, Any], retry_after: str | None) -> float | None:
+    """Wait YooKassa asked for: ``retry_after`` ms in the body, else the Retry-After header."""
+    value = body.get("retry_after")
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and value >= 0:
+        return value / 1000
+    if retry_after and retry_after.isdigit():
+        return float(retry_after)
+    return None
+
+
+def _check_payment(body: dict[str, Any]) -> dict[str, Any]:
+    for field in ("id", "status"):
+        if not isinstance(body.get(field), str):
+            raise YooKassaError(f"Malformed YooKassa response: no payment {field}")
+    return body
+
+
+def _confirmation_url(payment: dict[str, Any], *fields: str) -> str:
+    confirmation = payment.get("confirmation")
+    if isinstance(confirmation, dict):
+        for field in fields:
+            value = confirmation.get(field)
+            if isinstance(value, str) and value:
+                return value
+    raise YooKassaError(f"Malformed YooKassa response: no {' or '.join(fields)}")
+
+
+_client: YooKassaClient | None = None
+
+
 def configure_yookassa(config: Config) -> None:
-    if config.yookassa_shop_id and config.yookassa_secret_key:
-        Configuration.account_id = config.yookassa_shop_id
-        Configuration.secret_key = config.yookassa_secret_key
+    global _client
+    if _client is None and config.yookassa_shop_id and config.yookassa_secret_key:
+        _client = YooKassaClient(config.yookassa_shop_id, config.yookassa_secret_key)
+
+
+def yookassa_client() -> YooKassaClient:
+    if _client is None:
+        raise RuntimeError("YooKassa is not configured")
+    return _client
+
+
+async def close_yookassa() -> None:
+    global _client
+    if _client is not None:
+        logger.info("YooKassa client stats: %s", _client.stats())
+        await _client.close()
+        _client = None
 
 
 def _build_amount(amount: int) -> dict[str, str]:
     return {"value": str(Decimal(amount)), "currency": "RUB"}
 
 
-def create_payment_card(
+async def create_payment_card(
     order_id: int,
     amount: int,
     description: str,
+    idempotence_key: str,
     return_url: str | None = None,
 ) -> YooKassaPayment:
     payload: dict[str, Any] = {
@@ -43,15 +253,17 @@ def create_payment_card(
         "metadata": {"order_id": str(order_id)},
         "payment_method_data": {"type": "bank_card"},
     }
-    payment = Payment.create(payload)
+    payment = await yookassa_client().create_payment(payload, idempotence_key)
     return YooKassaPayment(
-        payment_id=payment.id,
-        confirmation_url=payment.confirmation.confirmation_url,
-        status=payment.status,
+        payment_id=payment["id"],
+        confirmation_url=_confirmation_url(payment, "confirmation_url"),
+        status=payment["status"],
     )
 
 
-def create_payment_sbp(order_id: int, amount: int, description: str) -> YooKassaPayment:
+async def create_payment_sbp(
+    order_id: int, amount: int, description: str, idempotence_key: str
+) -> YooKassaPayment:
     payload: dict[str, Any] = {
         "amount": _build_amount(amount),
         "confirmation": {"type": "qr"},
@@ -60,17 +272,15 @@ def create_payment_sbp(order_id: int, amount: int, description: str) -> YooKassa
         "metadata": {"order_id": str(order_id)},
         "payment_method_data": {"type": "sbp"},
     }
-    payment = Payment.create(payload)
-    confirmation_url = getattr(payment.confirmation, "confirmation_url", None)
-    if not confirmation_url:
-        confirmation_url = payment.confirmation.get("confirmation_url")
+    payment = await yookassa_client().create_payment(payload, idempotence_key)
+    # QR confirmations carry the link to encode as confirmation_data.
     return YooKassaPayment(
-        payment_id=payment.id,
-        confirmation_url=confirmation_url,
-        status=payment.status,
+        payment_id=payment["id"],
+        confirmation_url=_confirmation_url(payment, "confirmation_url", "confirmation_data"),
+        status=payment["status"],
     )
 
 
-def get_payment_status(payment_id: str) -> str:
-    payment = Payment.find_one(payment_id)
-    return payment.status
+async def get_payment_status(payment_id: str) -> str:
+    payment = await yookassa_client().get_payment(payment_id)
+    return payment["status"]
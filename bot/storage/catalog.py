@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import logging
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping
+
+from .cache import LruCache
+from .models import Category, Product
+from .pool import get_pool
+from .rows import PRODUCT_COLUMNS, fetch_all, product_row
+from .search import search_product_ids
+
+logger = logging.getLogger(__name__)
+
+FILTERED_CACHE_SIZE = 256
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    """Immutable, indexed view of the products table.
+
+    A snapshot is never mutated; reloading builds a new one and swaps it in,
+    so readers holding the old object keep a consistent view.
+    """
+
+    generation: int
+    products: tuple[Product, ...]
+    by_id: Mapping[int, Product]
+    by_code: Mapping[str, Product]
+    by_category: Mapping[str, tuple[Product, ...]]
+    categories: tuple[Category, ...]
+    category_titles: Mapping[str, str]
+
+    @classmethod
+    def build(cls, products: list[Product], generation: int) -> CatalogSnapshot:
+        ordered = tuple(sorted(products, key=lambda product: product.id))
+        by_category: dict[str, list[Product]] = {}
+        titles: dict[tuple[str, str | None], None] = {}
+        for product in ordered:
+            if product.category is None:
+                continue
+            by_category.setdefault(product.category, []).append(product)
+            titles[(product.category, product.category_title)] = None
+        # Same order as SELECT DISTINCT category, category_title ... ORDER BY category_title.
+        pairs = sorted(titles, key=lambda pair: (pair[1] is not None, pair[1] or ""))
+        categories = tuple(Category(code=code, title=title or code) for code, title in pairs)
+        category_titles: dict[str, str] = {}
+        for category in categories:
+            category_titles.setdefault(category.code, category.title)
+        return cls(
+            generation=generation,
+            products=ordered,
+            by_id=MappingProxyType({product.id: product for product in ordered}),
+            by_code=MappingProxyType({product.code: product for product in ordered}),
+            by_category=MappingProxyType(
+                {code: tuple(items) for code, items in by_category.items()}
+            ),
+            categories=categories,
+            category_titles=MappingProxyType(category_titles),
+        )
+
+    def category_title(self, code: str) -> str:
+        return self.category_titles.get(code, code)
+
+
+_snapshots: dict[str, CatalogSnapshot] = {}
+_load_locks: dict[str, asyncio.Lock] = {}
+_generations = itertools.count(1)
+# (db_path, generation, category, search) -> filtered product list.
+filtered_cache: LruCache[tuple[str, int, str | None, str | None], tuple[Product, ...]] = LruCache(
+    FILTERED_CACHE_SIZE
+)
+
+
+async def load_catalog(db_path: str) -> CatalogSnapshot:
+    """Read all products and atomically replace the snapshot for ``db_path``."""
+    async with get_pool(db_path).reader() as conn:
+        products = await fetch_all(
+            conn, f"SELECT {PRODUCT_COLUMNS} FROM products ORDER BY id", (), product_row
+        )
+    snapshot = CatalogSnapshot.build(products, next(_generations))
+    _snapshots[db_path] = snapshot
+    logger.info(
+        "Catalog loaded: %s products, generation %s", len(snapshot.products), snapshot.generation
+    )
+    return snapshot
+
+
+async def get_catalog(db_path: str) -> CatalogSnapshot:
+    snapshot = _snapshots.get(db_path)
+    if snapshot is not None:
+        return snapshot
+    lock = _load_locks.setdefault(db_path, asyncio.Lock())
+    async with lock:
+        snapshot = _snapshots.get(db_path)
+        if snapshot is None:
+            snapshot = await load_catalog(db_path)
+        return snapshot
+
+
+async def find_products(
+    db_path: str,
+    category: str | None = None,
+    search: str | None = None,
+) -> tuple[Product, ...]:
+    """Products matching the filters: id order, or relevance order when searching."""
+    snapshot = await get_catalog(db_path)
+    if not category and not search:
+        return snapshot.products
+    key = (db_path, snapshot.generation, category or None, search or None)
+    cached = filtered_cache.get(key)
+    if cached is not None:
+        return cached
+    if search:
+        ranked = await search_product_ids(db_path, search)
+        products = tuple(
+            snapshot.by_id[product_id] for product_id in ranked if product_id in snapshot.by_id
+        )
+        if category:
+            products = tuple(product for product in products if product.category == category)
+    else:
+        products = snapshot.by_category.get(category, ())
+    filtered_cache.put(key, products)
+    return products
@@ -4,7 +4,15 @@ from datetime import datetime, timezone
 
 import aiosqlite
 
+from .cache import LruCache
 from .migrations import run_migrations
+from .pool import get_pool
+from .writer import write
+
+USER_CACHE_SIZE = 50_000
+
+# (db_path, tg_id) -> users.id; user rows are never deleted, so entries never go stale.
+user_id_cache: LruCache[tuple[str, int], int] = LruCache(USER_CACHE_SIZE)
 
 
 def _utc_now() -> str:
@@ -17,14 +25,28 @@ async def init_db(db_path: str) -> None:
 
 
 async def ensure_user(db_path: str, tg_id: int) -> int:
-    async with aiosqlite.connect(db_path) as conn:
-        await conn.execute(
-            "INSERT OR IGNORE INTO users (tg_id, created_at) VALUES (?, ?)",
-            (tg_id, _utc_now()),
-        )
-        await conn.commit()
+    """Resolve tg_id to users.id, inserting a row only for genuinely new users."""
+    key = (db_path, tg_id)
+    cached = user_id_cache.get(key)
+    if cached is not None:
+        return cached
+
+    async with get_pool(db_path).reader() as conn:
         async with conn.execute("SELECT id FROM users WHERE tg_id = ?", (tg_id,)) as cur:
             row = await cur.fetchone()
-        if not row:
-            raise RuntimeError("Failed to create or fetch user")
-        return int(row[0])
+    if not row:
+
+        async def apply(conn: aiosqlite.Connection) -> tuple | None:
+            await conn.execute(
+                "INSERT OR IGNORE INTO users (tg_id, created_at) VALUES (?, ?)",
+                (tg_id, _utc_now()),
+            )
+            async with conn.execute("SELECT id FROM users WHERE tg_id = ?", (tg_id,)) as cur:
+                return await cur.fetchone()
+
+        row = await write(db_path, apply)
+    if not row:
+        raise RuntimeError("Failed to create or fetch user")
+    user_id = int(row[0])
+    user_id_cache.put(key, user_id)
+    return user_id
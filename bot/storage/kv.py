@@ -0,0 +1,553 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import contextvars
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable, Sequence
+from urllib.parse import unquote, urlsplit
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 2.0
+_MEMORY_SWEEP_EVERY = 1024
+
+# ("get", key) | ("set", key, value, ttl) | ("delete", key) | ("cas", key, expected, value, ttl)
+# Values are bytes; ttl is seconds or None; expected None means "key must not exist".
+Op = tuple[Any, ...]
+KeysFor = Callable[[dict[str, Any]], Iterable[str]]
+
+
+class KVError(Exception):
+    """The state backend failed or could not be reached."""
+
+
+@dataclass(slots=True)
+class _Session:
+    backend: KVBackend
+    # Values known for this update: prefetched, read or written so far.
+    values: dict[str, bytes | None] = field(default_factory=dict)
+    # Writes held back until the update is done, sent together.
+    writes: list[Op] = field(default_factory=list)
+
+
+_session: contextvars.ContextVar[_Session | None] = contextvars.ContextVar(
+    "kv_session", default=None
+)
+
+
+def _to_bytes(value: bytes | str) -> bytes:
+    return value.encode() if isinstance(value, str) else value
+
+
+class Pipeline:
+    """Operations queued locally and sent in one round trip by ``execute``."""
+
+    def __init__(self, backend: KVBackend) -> None:
+        self.backend = backend
+        self.ops: list[Op] = []
+
+    def get(self, key: str) -> Pipeline:
+        self.ops.append(("get", key))
+        return self
+
+    def set(self, key: str, value: bytes | str, ttl: float | None = None) -> Pipeline:
+        self.ops.append(("set", key, _to_bytes(value), ttl))
+        return self
+
+    def delete(self, key: str) -> Pipeline:
+        self.ops.append(("delete", key))
+        return self
+
+    def cas(
+        self,
+        key: str,
+        expected: bytes | str | None,
+        value: bytes | str,
+        ttl: float | None = None,
+    ) -> Pipeline:
+        expected = _to_bytes(expected) if expected is not None else None
+        self.ops.append(("cas", key, expected, _to_bytes(value), ttl))
+        return self
+
+    async def execute(self) -> list[Any]:
+        ops, self.ops = self.ops, []
+        return await self.backend.execute(ops) if ops else []
+
+    def submit(self) -> None:
+        """Send without waiting for the results (see ``KVBackend.submit``)."""
+        ops, self.ops = self.ops, []
+        if ops:
+            self.backend.submit(ops)
+
+
+class KVBackend(ABC):
+    """Key-value store for state shared by several bot instances.
+
+    ``get`` returns bytes or ``None``; ``set`` and ``cas`` take an optional
+    TTL in seconds; ``cas`` writes only if the current value equals
+    ``expected`` and reports whether it did. Operations issued on one
+    backend reach the store in the order they were issued.
+
+    Inside ``session`` (one per update, see :class:`KVSessionMiddleware`)
+    the keys an update needs are read in a single round trip, later ``get``
+    calls are answered from that snapshot, and ``submit``-ted writes are
+    sent together when the update is done, without waiting for the reply.
+    """
+
+    def __init__(self, timeout: float = DEFAULT_TIMEOUT) -> None:
+        self.timeout = timeout
+        self.round_trips = 0
+        self.ops = 0
+        self.session_hits = 0
+        self.failed_writes = 0
+        self.cas_conflicts = 0
+
+    @abstractmethod
+    def _send(self, ops: Sequence[Op]) -> asyncio.Future[list[Any]]:
+        """Put ``ops`` on the way to the store now and return their results' future."""
+
+    async def close(self) -> None:
+        return None
+
+    def pipeline(self) -> Pipeline:
+        return Pipeline(self)
+
+    async def execute(self, ops: Sequence[Op]) -> list[Any]:
+        """Run ``ops`` in one round trip; results come back in the same order."""
+        self.round_trips += 1
+        self.ops += len(ops)
+        future = self._send(ops)
+        try:
+            results = await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError as exc:
+            raise KVError(f"State backend did not answer in {self.timeout}s") from exc
+        session = _session.get()
+        if session is not None and session.backend is self:
+            _remember(session, ops, results)
+        return results
+
+    def submit(self, ops: Sequence[Op]) -> None:
+        """Write without waiting for the result; failures are logged.
+
+        During a session the writes are held until it ends; reads in the
+        same session already see them.
+        """
+        session = _session.get()
+        if session is not None and session.backend is self:
+            session.writes.extend(ops)
+            _remember(session, ops, [True] * len(ops))
+            return
+        self._send_in_background(ops)
+
+    def _send_in_background(self, ops: Sequence[Op]) -> None:
+        self.round_trips += 1
+        self.ops += len(ops)
+        self._send(ops).add_done_callback(lambda future: self._check_writes(ops, future))
+
+    def _check_writes(self, ops: Sequence[Op], future: asyncio.Future[list[Any]]) -> None:
+        if future.cancelled():
+            return
+        exc = future.exception()
+        if exc is not None:
+            self.failed_writes += 1
+            logger.warning("State backend write failed: %s", exc)
+            return
+        conflicts = sum(
+            1 for op, swapped in zip(ops, future.result()) if op[0] == "cas" and not swapped
+        )
+        if conflicts:
+            self.cas_conflicts += conflicts
+            logger.info("%s state writes lost a compare-and-set race", conflicts)
+
+    async def get(self, key: str) -> bytes | None:
+        session = _session.get()
+        if session is not None and session.backend is self and key in session.values:
+            self.session_hits += 1
+            return session.values[key]
+        (value,) = await self.execute([("get", key)])
+        return value
+
+    async def set(self, key: str, value: bytes | str, ttl: float | None = None) -> None:
+        await self.pipeline().set(key, value, ttl).execute()
+
+    async def delete(self, key: str) -> bool:
+        (deleted,) = await self.pipeline().delete(key).execute()
+        return bool(deleted)
+
+    async def cas(
+        self,
+        key: str,
+        expected: bytes | str | None,
+        value: bytes | str,
+        ttl: float | None = None,
+    ) -> bool:
+        (swapped,) = await self.pipeline().cas(key, expected, value, ttl).execute()
+        return bool(swapped)
+
+    @contextlib.asynccontextmanager
+    async def session(self, keys: Iterable[str] = ()) -> AsyncIterator[None]:
+        keys = list(dict.fromkeys(keys))
+        session = _Session(self)
+        token = _session.set(session)
+        try:
+            if keys:
+                await self.execute([("get", key) for key in keys])
+            yield
+        finally:
+            _session.reset(token)
+            if session.writes:
+                self._send_in_background(session.writes)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "round_trips": self.round_trips,
+            "ops": self.ops,
+            "session_hits": self.session_hits,
+            "failed_writes": self.failed_writes,
+            "cas_conflicts": self.cas_conflicts,
+        }
+
+
+def _remember(session: _Session, ops: Sequence[Op], results: Sequence[Any]) -> None:
+    for op, result in zip(ops, results):
+        kind, key = op[0], op[1]
+        if kind == "get":
+            session.values[key] = result
+        elif kind == "set" or (kind == "cas" and result):
+            session.values[key] = op[-2]
+        elif kind == "delete":
+            session.values[key] = None
+
+
+class MemoryKV(KVBackend):
+    """In-process backend: for a single instance and for development."""
+
+    def __init__(self, timeout: float = DEFAULT_TIMEOUT) -> None:
+        super().__init__(timeout)
+        # key -> (value, monotonic expiry or None)
+        self._data: dict[str, tuple[bytes, float | None]] = {}
+        self._writes = 0
+
+    def _send(self, ops: Sequence[Op]) -> asyncio.Future[list[Any]]:
+        future: asyncio.Future[list[Any]] = asyncio.get_running_loop().create_future()
+        now = time.monotonic()
+        future.set_result([self._apply(op, now) for op in ops])
+        return future
+
+    def _get(self, key: str, now: float) -> bytes | None:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires is not None and expires <= now:
+            del self._data[key]
+            return None
+        return value
+
+    def _apply(self, op: Op, now: float) -> Any:
+        kind, key = op[0], op[1]
+        if kind == "get":
+            return self._get(key, now)
+        self._writes += 1
+        if self._writes % _MEMORY_SWEEP_EVERY == 0:
+            self._sweep(now)
+        if kind == "delete":
+            return self._data.pop(key, None) is not None
+        if kind == "cas":
+            if self._get(key, now) != op[2]:
+                return False
+        value, ttl = op[-2], op[-1]
+        self._data[key] = (value, now + ttl if ttl is not None else None)
+        return True
+
+    def _sweep(self, now: float) -> None:
+        expired = [
+            key for key, (_, expires) in self._data.items() if expires is not None and expires <= now
+        ]
+        for key in expired:
+            del self._data[key]
+
+    def stats(self) -> dict[str, int]:
+        stats = super().stats()
+        stats["keys"] = len(self._data)
+        return stats
+
+
+# KEYS[1]; ARGV: 1 if the key must be missing, expected value, new value, TTL in ms (0: none).
+_CAS_SCRIPT = b"""
+local current = redis.call('GET', KEYS[1])
+if ARGV[1] == '1' then
+  if current then return 0 end
+elseif current ~= ARGV[2] then
+  return 0
+end
+if ARGV[4] == '0' then
+  redis.call('SET', KEYS[1], ARGV[3])
+else
+  redis.call('SET', KEYS[1], ARGV[3], 'PX', ARGV[4])
+end
+return 1
+"""
+
+
+def _ttl_ms(ttl: float | None) -> int:
+    return max(1, int(ttl * 1000)) if ttl is not None else 0
+
+
+def _command(op: Op) -> list[bytes]:
+    kind, key = op[0], op[1].encode()
+    if kind == "get":
+        return [b"GET", key]
+    if kind == "delete":
+        return [b"DEL", key]
+    if kind == "set":
+        value, ttl = op[2], op[3]
+        if ttl is None:
+            return [b"SET", key, value]
+        return [b"SET", key, value, b"PX", str(_ttl_ms(ttl)).encode()]
+    expected, value, ttl = op[2], op[3], op[4]
+    return [
+        b"EVAL",
+        _CAS_SCRIPT,
+        b"1",
+        key,
+        b"1" if expected is None else b"0",
+        expected or b"",
+        value,
+        str(_ttl_ms(ttl)).encode(),
+    ]
+
+
+def _encode(args: Sequence[bytes]) -> bytes:
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+class _ErrorReply(KVError):
+    pass
+
+
+async def _read_reply(reader: asyncio.StreamReader) -> Any:
+    line = await reader.readuntil(b"\r\n")
+    kind, body = line[:1], line[1:-2]
+    if kind == b"+":
+        return body.decode()
+    if kind == b"-":
+        return _ErrorReply(body.decode(errors="replace"))
+    if kind == b":":
+        return int(body)
+    if kind == b"$":
+        size = int(body)
+        if size < 0:
+            return None
+        return (await reader.readexactly(size + 2))[:-2]
+    if kind == b"*":
+        size = int(body)
+        if size < 0:
+            return None
+        return [await _read_reply(reader) for _ in range(size)]
+    raise KVError(f"Unexpected reply from the state backend: {line[:64]!r}")
+
+
+def _result(op: Op, reply: Any) -> Any:
+    kind = op[0]
+    if kind == "get":
+        return reply
+    if kind == "set":
+        return reply == "OK"
+    return bool(reply)
+
+
+class RedisKV(KVBackend):
+    """Backend speaking the Redis protocol (RESP2) over one connection.
+
+    Commands from all callers are written to the same connection as they
+    are issued and their replies are matched in order, so a batch costs one
+    round trip and nobody waits for anyone else's reply before sending.
+    ``cas`` runs as a small Lua script. The connection is opened on first
+    use and reopened on the next call after it breaks; operations that were
+    waiting for replies on a broken connection fail with :class:`KVError`.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 6379,
+        db: int = 0,
+        password: str | None = None,
+        timeout: float = DEFAULT_TIMEOUT,
+    ) -> None:
+        super().__init__(timeout)
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        # Sent batches waiting for their replies, oldest first.
+        self._replies: deque[tuple[Sequence[Op], asyncio.Future[list[Any]]]] = deque()
+        # Batches issued while the connection is being opened.
+        self._backlog: list[tuple[Sequence[Op], asyncio.Future[list[Any]]]] = []
+        self._connecting: asyncio.Task[None] | None = None
+        self._read_task: asyncio.Task[None] | None = None
+        self._closed = False
+        self.connects = 0
+
+    def _send(self, ops: Sequence[Op]) -> asyncio.Future[list[Any]]:
+        future: asyncio.Future[list[Any]] = asyncio.get_running_loop().create_future()
+        if self._closed:
+            future.set_exception(KVError("State backend is closed"))
+        elif self._writer is not None:
+            self._write(ops, future)
+        else:
+            self._backlog.append((ops, future))
+            if self._connecting is None:
+                self._connecting = asyncio.create_task(self._connect(), name="kv-connect")
+        return future
+
+    def _write(self, ops: Sequence[Op], future: asyncio.Future[list[Any]]) -> None:
+        assert self._writer is not None
+        self._writer.write(b"".join(_encode(_command(op)) for op in ops))
+        self._replies.append((ops, future))
+
+    async def _handshake(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        commands = []
+        if self.password:
+            commands.append([b"AUTH", self.password.encode()])
+        if self.db:
+            commands.append([b"SELECT", str(self.db).encode()])
+        if not commands:
+            return
+        writer.write(b"".join(_encode(command) for command in commands))
+        for _ in commands:
+            reply = await _read_reply(reader)
+            if isinstance(reply, KVError):
+                raise reply
+
+    async def _connect(self) -> None:
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), self.timeout
+            )
+            try:
+                await asyncio.wait_for(self._handshake(reader, writer), self.timeout)
+            except BaseException:
+                writer.close()
+                raise
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, KVError) as exc:
+            backlog, self._backlog = self._backlog, []
+            error = KVError(f"Cannot connect to {self.host}:{self.port}: {exc!r}")
+            for _, future in backlog:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        finally:
+            self._connecting = None
+        self.connects += 1
+        self._reader, self._writer = reader, writer
+        self._read_task = asyncio.create_task(self._read_replies(reader), name="kv-replies")
+        backlog, self._backlog = self._backlog, []
+        for ops, future in backlog:
+            self._write(ops, future)
+
+    async def _read_replies(self, reader: asyncio.StreamReader) -> None:
+        try:
+            while True:
+                first = await _read_reply(reader)
+                if not self._replies:
+                    raise KVError("State backend sent a reply nobody asked for")
+                ops, future = self._replies[0]
+                replies = [first]
+                for _ in ops[1:]:
+                    replies.append(await _read_reply(reader))
+                self._replies.popleft()
+                if future.done():
+                    continue
+                error = next((reply for reply in replies if isinstance(reply, KVError)), None)
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result([_result(op, reply) for op, reply in zip(ops, replies)])
+        except (OSError, asyncio.IncompleteReadError, KVError, ValueError) as exc:
+            if not self._closed:
+                logger.warning("State backend connection lost: %r", exc)
+            self._disconnect(KVError(f"Connection to the state backend lost: {exc!r}"))
+
+    def _disconnect(self, error: KVError) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+        replies, self._replies = self._replies, deque()
+        for _, future in replies:
+            if not future.done():
+                future.set_exception(error)
+
+    async def close(self) -> None:
+        """Wait for replies still outstanding, then close the connection."""
+        pending = [future for _, future in (*self._backlog, *self._replies)]
+        if pending:
+            await asyncio.wait(pending, timeout=self.timeout)
+        self._closed = True
+        if self._connecting is not None:
+            self._connecting.cancel()
+        if self._read_task is not None:
+            self._read_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._read_task
+        self._disconnect(KVError("State backend is closed"))
+
+    def stats(self) -> dict[str, int]:
+        stats = super().stats()
+        stats.update(connects=self.connects, awaiting_replies=len(self._replies))
+        return stats
+
+
+def open_kv(url: str) -> KVBackend:
+    """Backend for ``memory://`` or ``redis://[:password@]host[:port][/db]``."""
+    parts = urlsplit(url)
+    if parts.scheme == "memory":
+        return MemoryKV()
+    if parts.scheme == "redis":
+        db = parts.path.strip("/")
+        return RedisKV(
+            host=parts.hostname or "127.0.0.1",
+            port=parts.port or 6379,
+            db=int(db) if db else 0,
+            password=unquote(parts.password) if parts.password else None,
+        )
+    raise ValueError(f"Unsupported state backend: {url!r}")
+
+
+class KVSessionMiddleware(BaseMiddleware):
+    """Outer update middleware: one backend session per update.
+
+    ``keys_for`` name the keys each update will read (menu state, rate
+    bucket, FSM); they are fetched together before the handlers run and
+    the update's writes go out together after them, so a click costs one
+    round trip. Registered after the update executor, so a user's next
+    update reads what the previous one wrote.
+    """
+
+    def __init__(self, backend: KVBackend, keys_for: Sequence[KeysFor]) -> None:
+        self.backend = backend
+        self.keys_for = keys_for
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        keys = [key for keys_for in self.keys_for for key in keys_for(data)]
+        async with self.backend.session(keys):
+            return await handler(event, data)
@@ -5,7 +5,7 @@ from typing import Any
 
 import aiosqlite
 
-from .schema import SCHEMA, SCHEMA_VERSION, IndexDef, TableDef
+from .schema import FTS_TABLES, SCHEMA, SCHEMA_VERSION, FtsTableDef, IndexDef, TableDef
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +24,38 @@ def _create_index_sql(table: str, index: IndexDef) -> str:
     return f"CREATE {unique}INDEX IF NOT EXISTS {index.name} ON {table} ({columns});"
 
 
+def _create_fts_sql(name: str, spec: FtsTableDef) -> str:
+    columns = ", ".join(spec.columns)
+    prefix = " ".join(str(length) for length in spec.prefix)
+    return (
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {name} USING fts5({columns}, "
+        f"content='{spec.content}', content_rowid='{spec.content_rowid}', "
+        f"tokenize='{spec.tokenize}', prefix='{prefix}');"
+    )
+
+
+def _fts_trigger_sql(name: str, spec: FtsTableDef) -> list[str]:
+    columns = ", ".join(spec.columns)
+    new_values = ", ".join(f"new.{column}" for column in spec.columns)
+    old_values = ", ".join(f"old.{column}" for column in spec.columns)
+    insert = (
+        f"INSERT INTO {name} (rowid, {columns}) "
+        f"VALUES (new.{spec.content_rowid}, {new_values});"
+    )
+    delete = (
+        f"INSERT INTO {name} ({name}, rowid, {columns}) "
+        f"VALUES ('delete', old.{spec.content_rowid}, {old_values});"
+    )
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {name}_ai AFTER INSERT ON {spec.content} "
+        f"BEGIN {insert} END;",
+        f"CREATE TRIGGER IF NOT EXISTS {name}_ad AFTER DELETE ON {spec.content} "
+        f"BEGIN {delete} END;",
+        f"CREATE TRIGGER IF NOT EXISTS {name}_au AFTER UPDATE ON {spec.content} "
+        f"BEGIN {delete} {insert} END;",
+    ]
+
+
 async def _get_user_version(conn: aiosqlite.Connection) -> int:
     async with conn.execute("PRAGMA user_version") as cur:
         row = await cur.fetchone()
@@ -67,6 +99,10 @@ async def check_db_health(db_path: str) -> dict[str, Any]:
             if missing_indexes:
                 report["missing_indexes"][table] = missing_indexes
 
+        for name in FTS_TABLES:
+            if name not in existing_tables:
+                report["missing_tables"].append(name)
+
     return report
 
 
@@ -97,20 +133,19 @@ async def run_migrations(db_path: str) -> dict[str, Any]:
             if table not in existing_tables:
                 await conn.execute(_create_table_sql(table, spec))
                 results["created_tables"].append(table)
-                continue
-
-            async with conn.execute(f"PRAGMA table_info({table})") as cur:
-                existing_columns = {row[1] async for row in cur}
-            for column, definition in spec.columns.items():
-                if column in existing_columns:
-                    continue
-                if "PRIMARY KEY" in definition.upper() or "UNIQUE" in definition.upper():
-                    results["manual_actions"].append(
-                        f"Manual action required: add column {table}.{column} with constraints"
-                    )
-                    continue
-                await conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
-                results.setdefault("added_columns", {}).setdefault(table, []).append(column)
+            else:
+                async with conn.execute(f"PRAGMA table_info({table})") as cur:
+                    existing_columns = {row[1] async for row in cur}
+                for column, definition in spec.columns.items():
+                    if column in existing_columns:
+                        continue
+                    if "PRIMARY KEY" in definition.upper() or "UNIQUE" in definition.upper():
+                        results["manual_actions"].append(
+                            f"Manual action required: add column {table}.{column} with constraints"
+                        )
+                        continue
+                    await conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+                    results.setdefault("added_columns", {}).setdefault(table, []).append(column)
 
             async with conn.execute(f"PRAGMA index_list({table})") as cur:
                 existing_indexes = {row[1] async for row in cur}
@@ -128,6 +163,21 @@ async def run_migrations(db_path: str) -> dict[str, Any]:
                         f"({', '.join(index.columns)}): {exc}"
                     )
 
+        for name, spec in FTS_TABLES.items():
+            created = name not in existing_tables
+            try:
+                await conn.execute(_create_fts_sql(name, spec))
+                for trigger_sql in _fts_trigger_sql(name, spec):
+                    await conn.execute(trigger_sql)
+                if created:
+                    await conn.execute(f"INSERT INTO {name} ({name}) VALUES ('rebuild')")
+                    results["created_tables"].append(name)
+            except aiosqlite.Error as exc:
+                results["manual_actions"].append(
+                    f"Manual action required: create full-text index {name} "
+                    f"on {spec.content}: {exc}"
+                )
+
         if current_version != SCHEMA_VERSION:
             await _set_user_version(conn, SCHEMA_VERSION)
 
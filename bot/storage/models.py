@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True, slots=True)
+class Product:
+    id: int
+    code: str
+    title: str
+    description: str | None
+    details: str | None
+    price: int
+    category: str | None
+    category_title: str | None
+    photo_dir: str | None
+    is_popular: bool
+    is_new: bool
+
+
+@dataclass(frozen=True, slots=True)
+class CartItem:
+    product_id: int
+    title: str
+    price: int
+    qty: int
+
+
+@dataclass(frozen=True, slots=True)
+class CartMutation:
+    product_id: int
+    qty: int
+    total_qty: int
+    total_price: int
+
+
+@dataclass(frozen=True, slots=True)
+class CartView:
+    items: list[CartItem]
+    total_qty: int
+    total_price: int
+
+
+@dataclass(frozen=True, slots=True)
+class MenuView:
+    products: tuple[Product, ...]
+    item_index: int
+    product: Product | None
+    item_qty: int
+    cart_qty: int
+    cart_total: int
+    category_label: str | None
+
+
+@dataclass(frozen=True, slots=True)
+class Order:
+    id: int
+    order_id: str | None
+    tg_id: int
+    username: str | None
+    phone: str | None
+    name: str | None
+    delivery_type: str | None
+    address: str | None
+    status: str
+    total: int
+    payment_method: str | None
+    payment_id: str | None
+    created_at: str
+
+
+@dataclass(frozen=True, slots=True)
+class OrderItem:
+    order_id: int
+    item_id: str | None
+    title: str
+    qty: int
+    price: int
+    subtotal: int
+
+
+@dataclass(frozen=True, slots=True)
+class OrderPage:
+    orders: list[Order]
+    items: dict[int, list[OrderItem]]
+    next_cursor: int | None
+
+
+@dataclass(frozen=True, slots=True)
+class Category:
+    code: str
+    title: str
+
+
+@dataclass(frozen=True, slots=True)
+class OrderItemInput:
+    item_id: str | None
+    title: str
+    qty: int
+    price: int
+    subtotal: int
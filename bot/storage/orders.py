@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import aiosqlite
+
+from .models import OrderItem, OrderPage
+from .pool import get_pool
+from .rows import ORDER_COLUMNS, ORDER_ITEM_COLUMNS, fetch_all, order_item_row, order_row
+
+DEFAULT_PAGE_SIZE = 5
+MAX_PAGE_SIZE = 50
+
+
+async def _order_items(
+    conn: aiosqlite.Connection, order_ids: list[int]
+) -> dict[int, list[OrderItem]]:
+    items: dict[int, list[OrderItem]] = {order_id: [] for order_id in order_ids}
+    if not order_ids:
+        return items
+    placeholders = ", ".join("?" for _ in order_ids)
+    rows = await fetch_all(
+        conn,
+        f"""
+        SELECT {ORDER_ITEM_COLUMNS}
+        FROM order_items
+        WHERE order_id IN ({placeholders})
+        ORDER BY order_id, id
+        """,
+        order_ids,
+        order_item_row,
+    )
+    for item in rows:
+        items[item.order_id].append(item)
+    return items
+
+
+async def _order_page(
+    db_path: str,
+    column: str,
+    value: object,
+    limit: int,
+    cursor: int | None,
+) -> OrderPage:
+    """Keyset page over (created_at, id) DESC, served by the (column, created_at, id) index.
+
+    ``cursor`` is the id of the last order on the previous page; the next page
+    starts strictly after it, so pages stay stable while new orders arrive.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = f"SELECT {ORDER_COLUMNS} FROM orders WHERE {column} = ?"
+    params: list[object] = [value]
+    if cursor is not None:
+        query += " AND (created_at, id) < (SELECT created_at, id FROM orders WHERE id = ?)"
+        params.append(cursor)
+    query += " ORDER BY created_at DESC, id DESC LIMIT ?"
+    params.append(limit + 1)
+
+    async with get_pool(db_path).reader() as conn:
+        orders = await fetch_all(conn, query, params, order_row)
+        has_more = len(orders) > limit
+        orders = orders[:limit]
+        items = await _order_items(conn, [order.id for order in orders])
+    return OrderPage(
+        orders=orders,
+        items=items,
+        next_cursor=orders[-1].id if has_more else None,
+    )
+
+
+async def order_history(
+    db_path: str,
+    tg_id: int,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: int | None = None,
+) -> OrderPage:
+    """A customer's orders, newest first, with their items."""
+    return await _order_page(db_path, "tg_id", tg_id, limit, cursor)
+
+
+async def orders_by_status(
+    db_path: str,
+    status: str,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: int | None = None,
+) -> OrderPage:
+    """Shop-wide orders in one status, newest first, with their items."""
+    return await _order_page(db_path, "status", status, limit, cursor)
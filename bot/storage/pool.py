@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 4
+HEALTH_CHECK_INTERVAL = 30.0
+
+
+class _PooledConnection:
+    __slots__ = ("conn", "last_used")
+
+    def __init__(self, conn: aiosqlite.Connection) -> None:
+        self.conn = conn
+        self.last_used = time.monotonic()
+
+
+class ConnectionPool:
+    """Long-lived aiosqlite connections: one dedicated writer plus N readers.
+
+    SQLite allows a single writer at a time, so all writes are funnelled through
+    one connection guarded by a lock, while readers are handed out from a queue.
+    Connections idle longer than ``health_check_interval`` are pinged before reuse
+    and transparently reopened if the ping fails; after ``start()`` the idle ones
+    are also checked every ``health_check_interval`` seconds.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        size: int = DEFAULT_POOL_SIZE,
+        health_check_interval: float = HEALTH_CHECK_INTERVAL,
+    ) -> None:
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+        self.db_path = db_path
+        self.size = size
+        self.health_check_interval = health_check_interval
+        self._idle: asyncio.Queue[_PooledConnection] = asyncio.Queue()
+        self._readers_open = 0
+        self._reader_lock = asyncio.Lock()
+        self._writer: _PooledConnection | None = None
+        self._writer_lock = asyncio.Lock()
+        self._health_task: asyncio.Task[None] | None = None
+        self._closed = False
+
+    async def _connect(self, readonly: bool) -> _PooledConnection:
+        conn = await aiosqlite.connect(self.db_path)
+        await conn.execute("PRAGMA foreign_keys = ON")
+        await conn.execute("PRAGMA busy_timeout = 5000")
+        if readonly:
+            await conn.execute("PRAGMA query_only = ON")
+        else:
+            # A committed write must survive power loss; group commit keeps the fsyncs few.
+            await conn.execute("PRAGMA synchronous = FULL")
+        return _PooledConnection(conn)
+
+    async def _ensure_healthy(self, pooled: _PooledConnection, readonly: bool) -> _PooledConnection:
+        if time.monotonic() - pooled.last_used < self.health_check_interval:
+            return pooled
+        if await self._ping(pooled.conn):
+            return pooled
+        logger.warning("Reopening unhealthy SQLite connection to %s", self.db_path)
+        await self._close_quietly(pooled.conn)
+        return await self._connect(readonly)
+
+    @staticmethod
+    async def _ping(conn: aiosqlite.Connection) -> bool:
+        try:
+            async with conn.execute("SELECT 1") as cur:
+                await cur.fetchone()
+        except (aiosqlite.Error, ValueError):
+            return False
+        return True
+
+    @staticmethod
+    async def _close_quietly(conn: aiosqlite.Connection) -> None:
+        try:
+            await conn.close()
+        except (aiosqlite.Error, ValueError):
+            logger.debug("Failed to close SQLite connection", exc_info=True)
+
+    async def _acquire_reader(self) -> _PooledConnection:
+        if self._closed:
+            raise RuntimeError("Connection pool is closed")
+        if self._idle.empty():
+            async with self._reader_lock:
+                if self._idle.empty() and self._readers_open < self.size:
+                    self._readers_open += 1
+                    try:
+                        return await self._connect(readonly=True)
+                    except BaseException:
+                        self._readers_open -= 1
+                        raise
+        pooled = await self._idle.get()
+        return await self._ensure_healthy(pooled, readonly=True)
+
+    def _release_reader(self, pooled: _PooledConnection) -> None:
+        pooled.last_used = time.monotonic()
+        if self._closed:
+            asyncio.ensure_future(self._close_quietly(pooled.conn))
+            return
+        self._idle.put_nowait(pooled)
+
+    @asynccontextmanager
+    async def reader(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Borrow a read-only connection for the duration of the block."""
+        pooled = await self._acquire_reader()
+        try:
+            yield pooled.conn
+        finally:
+            self._release_reader(pooled)
+
+    @asynccontextmanager
+    async def writer(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Borrow the writer connection; commits on success, rolls back on error."""
+        async with self._writer_lock:
+            if self._closed:
+                raise RuntimeError("Connection pool is closed")
+            if self._writer is None:
+                self._writer = await self._connect(readonly=False)
+            else:
+                self._writer = await self._ensure_healthy(self._writer, readonly=False)
+            conn = self._writer.conn
+            try:
+                yield conn
+            except BaseException:
+                await conn.rollback()
+                raise
+            else:
+                await conn.commit()
+            finally:
+                self._writer.last_used = time.monotonic()
+
+    async def check_health(self) -> bool:
+        """Ping every idle connection, reopening the ones that fail."""
+        healthy = True
+        async with self._writer_lock:
+            if self._writer is not None and not await self._ping(self._writer.conn):
+                healthy = False
+                await self._close_quietly(self._writer.conn)
+                self._writer = await self._connect(readonly=False)
+        idle: list[_PooledConnection] = []
+        while not self._idle.empty():
+            idle.append(self._idle.get_nowait())
+        for pooled in idle:
+            if not await self._ping(pooled.conn):
+                healthy = False
+                await self._close_quietly(pooled.conn)
+                pooled = await self._connect(readonly=True)
+            self._idle.put_nowait(pooled)
+        return healthy
+
+    def start(self) -> None:
+        if self._health_task is None and not self._closed:
+            self._health_task = asyncio.create_task(
+                self._check_periodically(), name=f"sqlite-health:{self.db_path}"
+            )
+
+    async def _check_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            try:
+                if not await self.check_health():
+                    logger.warning("Reopened unhealthy SQLite connections to %s", self.db_path)
+            except Exception:
+                logger.exception("SQLite health check failed for %s", self.db_path)
+
+    async def close(self) -> None:
+        """Close all idle connections; borrowed readers are closed on release."""
+        self._closed = True
+        if self._health_task is not None:
+            self._health_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._health_task
+            self._health_task = None
+        async with self._writer_lock:
+            if self._writer is not None:
+                await self._close_quietly(self._writer.conn)
+                self._writer = None
+        while not self._idle.empty():
+            pooled = self._idle.get_nowait()
+            self._readers_open -= 1
+            await self._close_quietly(pooled.conn)
+
+
+_pools: dict[str, ConnectionPool] = {}
+_pool_size = DEFAULT_POOL_SIZE
+
+
+def configure_pools(size: int) -> None:
+    """Set the reader count used for pools created after this call."""
+    global _pool_size
+    if size < 1:
+        raise ValueError("Pool size must be at least 1")
+    _pool_size = size
+
+
+def get_pool(db_path: str) -> ConnectionPool:
+    """The pool for ``db_path``, created with its health checks on first use."""
+    pool = _pools.get(db_path)
+    if pool is None:
+        pool = ConnectionPool(db_path, size=_pool_size)
+        pool.start()
+        _pools[db_path] = pool
+    return pool
+
+
+async def close_pools() -> None:
+    pools = list(_pools.values())
+    _pools.clear()
+    for pool in pools:
+        await pool.close()
@@ -1,65 +1,31 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
 from datetime import datetime, timezone
+
 import aiosqlite
 
+from .catalog import CatalogSnapshot, find_products, get_catalog, load_catalog
 from .db import ensure_user
-
-
-@dataclass(frozen=True)
-class Product:
-    id: int
-    code: str
-    title: str
-    description: str | None
-    details: str | None
-    price: int
-    category: str | None
-    category_title: str | None
-    photo_dir: str | None
-    is_popular: bool
-    is_new: bool
-
-
-@dataclass(frozen=True)
-class CartItem:
-    product_id: int
-    title: str
-    price: int
-    qty: int
-
-
-@dataclass(frozen=True)
-class Order:
-    id: int
-    order_id: str | None
-    tg_id: int
-    username: str | None
-    phone: str | None
-    name: str | None
-    delivery_type: str | None
-    address: str | None
-    status: str
-    total: int
-    payment_method: str | None
-    payment_id: str | None
-    created_at: str
-
-
-@dataclass(frozen=True)
-class Category:
-    code: str
-    title: str
-
-
-@dataclass(frozen=True)
-class OrderItemInput:
-    item_id: str | None
-    title: str
-    qty: int
-    price: int
-    subtotal: int
+from .models import (
+    CartItem,
+    CartMutation,
+    CartView,
+    Category,
+    MenuView,
+    Order,
+    OrderItemInput,
+    Product,
+)
+from .pool import get_pool
+from .rows import (
+    CART_ITEM_COLUMNS,
+    ORDER_COLUMNS,
+    cart_item_row,
+    fetch_all,
+    fetch_one,
+    order_row,
+)
+from .writer import write
 
 
 SEED_PRODUCTS: tuple[dict[str, object], ...] = (
@@ -131,7 +97,7 @@ def _utc_now() -> str:
 
 
 async def seed_products(db_path: str) -> None:
-    async with aiosqlite.connect(db_path) as conn:
+    async def apply(conn: aiosqlite.Connection) -> None:
         for product in SEED_PRODUCTS:
             await conn.execute(
                 """
@@ -164,7 +130,9 @@ async def seed_products(db_path: str) -> None:
                     _utc_now(),
                 ),
             )
-        await conn.commit()
+
+    await write(db_path, apply)
+    await load_catalog(db_path)
 
 
 async def get_products(
@@ -172,203 +140,135 @@ async def get_products(
     category: str | None = None,
     search: str | None = None,
 ) -> list[Product]:
-    query = (
-        "SELECT id, code, title, description, details, price, category, category_title, "
-        "photo_dir, is_popular, is_new FROM products"
-    )
-    filters: list[str] = []
-    params: list[object] = []
-
-    if category:
-        filters.append("category = ?")
-        params.append(category)
-    if search:
-        pattern = f"%{search.lower()}%"
-        filters.append(
-            "(LOWER(title) LIKE ? OR LOWER(description) LIKE ? OR LOWER(details) LIKE ?)"
-        )
-        params.extend([pattern, pattern, pattern])
-
-    if filters:
-        query += " WHERE " + " AND ".join(filters)
-    query += " ORDER BY id"
-
-    async with aiosqlite.connect(db_path) as conn:
-        items: list[Product] = []
-        async with conn.execute(query, params) as cur:
-            async for row in cur:
-                items.append(
-                    Product(
-                        id=row[0],
-                        code=row[1],
-                        title=row[2],
-                        description=row[3],
-                        details=row[4],
-                        price=row[5],
-                        category=row[6],
-                        category_title=row[7],
-                        photo_dir=row[8],
-                        is_popular=bool(row[9]),
-                        is_new=bool(row[10]),
-                    )
-                )
-        return items
+    return list(await find_products(db_path, category=category, search=search))
 
 
 async def get_product_by_id(db_path: str, product_id: int) -> Product | None:
-    async with aiosqlite.connect(db_path) as conn:
-        async with conn.execute(
-            """
-            SELECT id, code, title, description, details, price, category, category_title,
-                   photo_dir, is_popular, is_new
-            FROM products
-            WHERE id = ?
-            """,
-            (product_id,),
-        ) as cur:
-            row = await cur.fetchone()
-        if not row:
-            return None
-        return Product(
-            id=row[0],
-            code=row[1],
-            title=row[2],
-            description=row[3],
-            details=row[4],
-            price=row[5],
-            category=row[6],
-            category_title=row[7],
-            photo_dir=row[8],
-            is_popular=bool(row[9]),
-            is_new=bool(row[10]),
-        )
+    snapshot = await get_catalog(db_path)
+    return snapshot.by_id.get(product_id)
 
 
 async def get_product_by_code(db_path: str, code: str) -> Product | None:
-    async with aiosqlite.connect(db_path) as conn:
-        async with conn.execute(
-            """
-            SELECT id, code, title, description, details, price, category, category_title,
-                   photo_dir, is_popular, is_new
-            FROM products
-            WHERE code = ?
-            """,
-            (code,),
-        ) as cur:
-            row = await cur.fetchone()
-        if not row:
-            return None
-        return Product(
-            id=row[0],
-            code=row[1],
-            title=row[2],
-            description=row[3],
-            details=row[4],
-            price=row[5],
-            category=row[6],
-            category_title=row[7],
-            photo_dir=row[8],
-            is_popular=bool(row[9]),
-            is_new=bool(row[10]),
-        )
+    snapshot = await get_catalog(db_path)
+    return snapshot.by_code.get(code)
+
+
+async def get_products_by_keys(db_path: str, keys: list[str]) -> dict[str, Product]:
+    """Resolve Mini App item keys (numeric id, falling back to code) in one catalog lookup."""
+    snapshot = await get_catalog(db_path)
+    resolved: dict[str, Product] = {}
+    for key in keys:
+        product = snapshot.by_id.get(int(key)) if key.isdigit() else None
+        if product is None:
+            product = snapshot.by_code.get(key)
+        if product is not None:
+            resolved[key] = product
+    return resolved
 
 
 async def get_categories(db_path: str) -> list[Category]:
-    async with aiosqlite.connect(db_path) as conn:
-        categories: list[Category] = []
-        async with conn.execute(
-            """
-            SELECT DISTINCT category, category_title
-            FROM products
-            WHERE category IS NOT NULL
-            ORDER BY category_title
-            """
-        ) as cur:
-            async for row in cur:
-                categories.append(Category(code=row[0], title=row[1] or row[0]))
-        return categories
+    snapshot = await get_catalog(db_path)
+    return list(snapshot.categories)
+
 
+async def get_category_title(db_path: str, code: str) -> str:
+    snapshot = await get_catalog(db_path)
+    return snapshot.category_title(code)
 
-async def cart_add(db_path: str, tg_id: int, product_id: int, qty: int = 1) -> int:
+
+async def _cart_totals(conn: aiosqlite.Connection, user_id: int) -> tuple[int, int]:
+    async with conn.execute(
+        """
+        SELECT COALESCE(SUM(ci.qty), 0), COALESCE(SUM(ci.qty * p.price), 0)
+        FROM cart_items ci
+        LEFT JOIN products p ON p.id = ci.product_id
+        WHERE ci.user_id = ?
+        """,
+        (user_id,),
+    ) as cur:
+        row = await cur.fetchone()
+    return (int(row[0]), int(row[1])) if row else (0, 0)
+
+
+async def cart_add(db_path: str, tg_id: int, product_id: int, qty: int = 1) -> CartMutation:
     user_id = await ensure_user(db_path, tg_id)
-    async with aiosqlite.connect(db_path) as conn:
+
+    async def apply(conn: aiosqlite.Connection) -> CartMutation:
         async with conn.execute(
-            "SELECT qty FROM cart_items WHERE user_id = ? AND product_id = ?",
-            (user_id, product_id),
+            """
+            INSERT INTO cart_items (user_id, product_id, qty, added_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(user_id, product_id) DO UPDATE SET qty = qty + excluded.qty
+            RETURNING qty
+            """,
+            (user_id, product_id, qty, _utc_now()),
         ) as cur:
             row = await cur.fetchone()
-        if row:
-            new_qty = int(row[0]) + qty
-            await conn.execute(
-                "UPDATE cart_items SET qty = ? WHERE user_id = ? AND product_id = ?",
-                (new_qty, user_id, product_id),
-            )
-        else:
-            new_qty = qty
-            await conn.execute(
-                "INSERT INTO cart_items (user_id, product_id, qty, added_at) VALUES (?, ?, ?, ?)",
-                (user_id, product_id, qty, _utc_now()),
-            )
-        await conn.commit()
-        return new_qty
+        new_qty = int(row[0]) if row else 0
+        total_qty, total_price = await _cart_totals(conn, user_id)
+        return CartMutation(
+            product_id=product_id, qty=new_qty, total_qty=total_qty, total_price=total_price
+        )
+
+    return await write(db_path, apply)
 
 
-async def cart_decrement(db_path: str, tg_id: int, product_id: int) -> int:
+async def cart_decrement(db_path: str, tg_id: int, product_id: int) -> CartMutation:
     user_id = await ensure_user(db_path, tg_id)
-    async with aiosqlite.connect(db_path) as conn:
+
+    async def apply(conn: aiosqlite.Connection) -> CartMutation:
         async with conn.execute(
-            "SELECT qty FROM cart_items WHERE user_id = ? AND product_id = ?",
+            """
+            UPDATE cart_items SET qty = qty - 1
+            WHERE user_id = ? AND product_id = ?
+            RETURNING qty
+            """,
             (user_id, product_id),
         ) as cur:
             row = await cur.fetchone()
-        if not row:
-            return 0
-        current_qty = int(row[0])
-        new_qty = current_qty - 1
-        if new_qty <= 0:
+        new_qty = int(row[0]) if row else 0
+        if row and new_qty <= 0:
             await conn.execute(
-                "DELETE FROM cart_items WHERE user_id = ? AND product_id = ?",
+                "DELETE FROM cart_items WHERE user_id = ? AND product_id = ? AND qty <= 0",
                 (user_id, product_id),
             )
-            await conn.commit()
-            return 0
-        await conn.execute(
-            "UPDATE cart_items SET qty = ? WHERE user_id = ? AND product_id = ?",
-            (new_qty, user_id, product_id),
+            new_qty = 0
+        total_qty, total_price = await _cart_totals(conn, user_id)
+        return CartMutation(
+            product_id=product_id, qty=new_qty, total_qty=total_qty, total_price=total_price
         )
-        await conn.commit()
-        return new_qty
+
+    return await write(db_path, apply)
 
 
 async def cart_get_items(db_path: str, tg_id: int) -> list[CartItem]:
     user_id = await ensure_user(db_path, tg_id)
-    async with aiosqlite.connect(db_path) as conn:
-        items: list[CartItem] = []
-        async with conn.execute(
-            """
-            SELECT p.id, p.title, p.price, ci.qty
+    async with get_pool(db_path).reader() as conn:
+        return await fetch_all(
+            conn,
+            f"""
+            SELECT {CART_ITEM_COLUMNS}
             FROM cart_items ci
             JOIN products p ON p.id = ci.product_id
             WHERE ci.user_id = ?
             ORDER BY p.title
             """,
             (user_id,),
-        ) as cur:
-            async for row in cur:
-                items.append(CartItem(product_id=row[0], title=row[1], price=row[2], qty=row[3]))
-        return items
+            cart_item_row,
+        )
 
 
 async def cart_clear(db_path: str, tg_id: int) -> None:
     user_id = await ensure_user(db_path, tg_id)
-    async with aiosqlite.connect(db_path) as conn:
+
+    async def apply(conn: aiosqlite.Connection) -> None:
         await conn.execute("DELETE FROM cart_items WHERE user_id = ?", (user_id,))
-        await conn.commit()
+
+    await write(db_path, apply)
 
 
 async def cart_total_qty(db_path: str, tg_id: int) -> int:
     user_id = await ensure_user(db_path, tg_id)
-    async with aiosqlite.connect(db_path) as conn:
+    async with get_pool(db_path).reader() as conn:
         async with conn.execute(
             "SELECT COALESCE(SUM(qty), 0) FROM cart_items WHERE user_id = ?",
             (user_id,),
@@ -379,7 +279,7 @@ async def cart_total_qty(db_path: str, tg_id: int) -> int:
 
 async def cart_total_price(db_path: str, tg_id: int) -> int:
     user_id = await ensure_user(db_path, tg_id)
-    async with aiosqlite.connect(db_path) as conn:
+    async with get_pool(db_path).reader() as conn:
         async with conn.execute(
             """
             SELECT COALESCE(SUM(ci.qty * p.price), 0)
@@ -395,7 +295,7 @@ async def cart_total_price(db_path: str, tg_id: int) -> int:
 
 async def cart_item_qty(db_path: str, tg_id: int, product_id: int) -> int:
     user_id = await ensure_user(db_path, tg_id)
-    async with aiosqlite.connect(db_path) as conn:
+    async with get_pool(db_path).reader() as conn:
         async with conn.execute(
             "SELECT qty FROM cart_items WHERE user_id = ? AND product_id = ?",
             (user_id, product_id),
@@ -404,17 +304,85 @@ async def cart_item_qty(db_path: str, tg_id: int, product_id: int) -> int:
         return int(row[0]) if row else 0
 
 
-async def order_create(db_path: str, tg_id: int, total: int, payment_method: str) -> int:
+async def _cart_lines(db_path: str, tg_id: int) -> dict[int, int]:
     user_id = await ensure_user(db_path, tg_id)
-    async with aiosqlite.connect(db_path) as conn:
+    async with get_pool(db_path).reader() as conn:
+        async with conn.execute(
+            "SELECT product_id, qty FROM cart_items WHERE user_id = ?",
+            (user_id,),
+        ) as cur:
+            return {int(row[0]): int(row[1]) async for row in cur}
+
+
+def _build_cart_view(snapshot: CatalogSnapshot, lines: dict[int, int]) -> CartView:
+    items = [
+        CartItem(product_id=product.id, title=product.title, price=product.price, qty=qty)
+        for product_id, qty in lines.items()
+        if (product := snapshot.by_id.get(product_id)) is not None
+    ]
+    items.sort(key=lambda item: item.title)
+    return CartView(
+        items=items,
+        total_qty=sum(item.qty for item in items),
+        total_price=sum(item.price * item.qty for item in items),
+    )
+
+
+async def get_cart_view(db_path: str, tg_id: int) -> CartView:
+    """Cart lines and totals for one user in a single query; prices come from the catalog."""
+    snapshot = await get_catalog(db_path)
+    return _build_cart_view(snapshot, await _cart_lines(db_path, tg_id))
+
+
+async def get_menu_view(
+    db_path: str,
+    tg_id: int,
+    category: str | None,
+    search: str | None,
+    item_index: int,
+    cart: CartMutation | None = None,
+) -> MenuView:
+    """Everything a menu screen needs; at most one cart query, none if ``cart`` covers it."""
+    snapshot = await get_catalog(db_path)
+    products = await find_products(db_path, category=category, search=search)
+    index = item_index % len(products) if products else 0
+    product = products[index] if products else None
+    if cart is not None and (product is None or cart.product_id == product.id):
+        item_qty = cart.qty if product is not None else 0
+        cart_qty, cart_total = cart.total_qty, cart.total_price
+    else:
+        view = _build_cart_view(snapshot, await _cart_lines(db_path, tg_id))
+        item_qty = next(
+            (item.qty for item in view.items if product and item.product_id == product.id), 0
+        )
+        cart_qty, cart_total = view.total_qty, view.total_price
+    return MenuView(
+        products=products,
+        item_index=index,
+        product=product,
+        item_qty=item_qty,
+        cart_qty=cart_qty,
+        cart_total=cart_total,
+        category_label=snapshot.category_title(category) if category else None,
+    )
+
+
+async def order_create(
+    db_path: str, tg_id: int, total: int, payment_method: str, payment_key: str
+) -> int:
+    user_id = await ensure_user(db_path, tg_id)
+
+    async def apply(conn: aiosqlite.Connection) -> int:
         cur = await conn.execute(
-            "INSERT INTO orders (tg_id, user_id, status, total, payment_method, created_at)"
-            " VALUES (?, ?, ?, ?, ?, ?)",
-            (tg_id, user_id, "pending_payment", total, payment_method, _utc_now()),
+            "INSERT INTO orders"
+            " (tg_id, user_id, status, total, payment_method, payment_key, created_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (tg_id, user_id, "pending_payment", total, payment_method, payment_key, _utc_now()),
         )
-        await conn.commit()
         return int(cur.lastrowid)
 
+    return await write(db_path, apply)
+
 
 async def order_create_with_items(
     db_path: str,
@@ -434,7 +402,8 @@ async def order_create_with_items(
         raise ValueError("Order must contain at least one item")
     user_id = await ensure_user(db_path, tg_id)
     created_at = _utc_now()
-    async with aiosqlite.connect(db_path) as conn:
+
+    async def apply(conn: aiosqlite.Connection) -> int:
         cur = await conn.execute(
             """
             INSERT INTO orders (
@@ -457,83 +426,69 @@ async def order_create_with_items(
                 created_at,
             ),
         )
-        order_id = int(cur.lastrowid)
+        row_id = int(cur.lastrowid)
         await conn.executemany(
             """
             INSERT INTO order_items (order_id, item_id, title, qty, price, subtotal, created_at)
             VALUES (?, ?, ?, ?, ?, ?, ?)
             """,
             [
-                (order_id, item.item_id, item.title, item.qty, item.price, item.subtotal, created_at)
+                (row_id, item.item_id, item.title, item.qty, item.price, item.subtotal, created_at)
                 for item in items
             ],
         )
-        await conn.commit()
-        return order_id
+        return row_id
+
+    return await write(db_path, apply)
 
 
 async def order_set_payment(db_path: str, order_id: int, payment_id: str) -> None:
-    async with aiosqlite.connect(db_path) as conn:
+    async def apply(conn: aiosqlite.Connection) -> None:
         await conn.execute(
             "UPDATE orders SET payment_id = ? WHERE id = ?",
             (payment_id, order_id),
         )
-        await conn.commit()
+
+    await write(db_path, apply)
 
 
 async def order_set_status(db_path: str, order_id: int, status: str) -> None:
-    async with aiosqlite.connect(db_path) as conn:
+    async def apply(conn: aiosqlite.Connection) -> None:
         await conn.execute("UPDATE orders SET status = ? WHERE id = ?", (status, order_id))
-        await conn.commit()
+
+    await write(db_path, apply)
 
 
 async def order_set_status_by_order_id(db_path: str, order_id: str, status: str) -> None:
-    async with aiosqlite.connect(db_path) as conn:
+    async def apply(conn: aiosqlite.Connection) -> None:
         await conn.execute("UPDATE orders SET status = ? WHERE order_id = ?", (status, order_id))
-        await conn.commit()
+
+    await write(db_path, apply)
 
 
 async def order_get_latest(db_path: str, tg_id: int) -> Order | None:
-    async with aiosqlite.connect(db_path) as conn:
-        async with conn.execute(
-            """
-            SELECT id, order_id, tg_id, username, phone, name, delivery_type, address,
-                   status, total, payment_method, payment_id, created_at
+    async with get_pool(db_path).reader() as conn:
+        return await fetch_one(
+            conn,
+            f"""
+            SELECT {ORDER_COLUMNS}
             FROM orders
             WHERE tg_id = ?
-            ORDER BY created_at DESC
+            ORDER BY created_at DESC, id DESC
             LIMIT 1
             """,
             (tg_id,),
-        ) as cur:
-            row = await cur.fetchone()
-        if not row:
-            return None
-        return Order(
-            id=row[0],
-            order_id=row[1],
-            tg_id=row[2],
-            username=row[3],
-            phone=row[4],
-            name=row[5],
-            delivery_type=row[6],
-            address=row[7],
-            status=row[8],
-            total=row[9],
-            payment_method=row[10],
-            payment_id=row[11],
-            created_at=row[12],
+            order_row,
         )
 
 
 async def cart_snapshot(db_path: str, tg_id: int) -> tuple[list[CartItem], int]:
-    items = await cart_get_items(db_path, tg_id)
-    total = sum(item.price * item.qty for item in items)
-    return items, total
+    view = await get_cart_view(db_path, tg_id)
+    return view.items, view.total_price
 
 
 async def order_exists_by_order_id(db_path: str, order_id: str) -> bool:
-    async with aiosqlite.connect(db_path) as conn:
+    async with get_pool(db_path).reader() as conn:
         async with conn.execute("SELECT 1 FROM orders WHERE order_id = ? LIMIT 1", (order_id,)) as cur:
             row = await cur.fetchone()
         return row is not None
@@ -571,7 +526,8 @@ async def order_create_webapp(
 
 async def admin_payload_upsert(db_path: str, payload_type: str, payload: str) -> None:
     updated_at = _utc_now()
-    async with aiosqlite.connect(db_path) as conn:
+
+    async def apply(conn: aiosqlite.Connection) -> None:
         await conn.execute(
             """
             INSERT INTO admin_payloads (type, payload, updated_at)
@@ -582,4 +538,49 @@ async def admin_payload_upsert(db_path: str, payload_type: str, payload: str) ->
             """,
             (payload_type, payload, updated_at),
         )
-        await conn.commit()
+
+    await write(db_path, apply)
+
+
+async def media_file_ids_load(db_path: str) -> dict[tuple[str, str], str]:
+    async with get_pool(db_path).reader() as conn:
+        async with conn.execute("SELECT path, content_hash, file_id FROM media_cache") as cur:
+            return {(row[0], row[1]): row[2] async for row in cur}
+
+
+async def media_file_id_get(db_path: str, path: str, content_hash: str) -> str | None:
+    async with get_pool(db_path).reader() as conn:
+        async with conn.execute(
+            "SELECT file_id FROM media_cache WHERE path = ? AND content_hash = ?",
+            (path, content_hash),
+        ) as cur:
+            row = await cur.fetchone()
+    return row[0] if row else None
+
+
+async def media_file_id_save(db_path: str, path: str, content_hash: str, file_id: str) -> None:
+    updated_at = _utc_now()
+
+    async def apply(conn: aiosqlite.Connection) -> None:
+        await conn.execute(
+            """
+            INSERT INTO media_cache (path, content_hash, file_id, updated_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(path, content_hash) DO UPDATE SET
+                file_id = excluded.file_id,
+                updated_at = excluded.updated_at
+            """,
+            (path, content_hash, file_id, updated_at),
+        )
+
+    await write(db_path, apply)
+
+
+async def media_file_id_delete(db_path: str, path: str, content_hash: str) -> None:
+    async def apply(conn: aiosqlite.Connection) -> None:
+        await conn.execute(
+            "DELETE FROM media_cache WHERE path = ? AND content_hash = ?",
+            (path, content_hash),
+        )
+
+    await write(db_path, apply)
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import sqlite3
+from typing import Any, Callable, Iterable, TypeVar
+
+import aiosqlite
+
+from .models import CartItem, Order, OrderItem, Product
+
+T = TypeVar("T")
+RowFactory = Callable[[sqlite3.Cursor, tuple], T]
+
+PRODUCT_COLUMNS = (
+    "id, code, title, description, details, price, category, category_title, "
+    "photo_dir, is_popular, is_new"
+)
+ORDER_COLUMNS = (
+    "id, order_id, tg_id, username, phone, name, delivery_type, address, "
+    "status, total, payment_method, payment_id, created_at"
+)
+ORDER_ITEM_COLUMNS = "order_id, item_id, title, qty, price, subtotal"
+CART_ITEM_COLUMNS = "p.id, p.title, p.price, ci.qty"
+
+# Row factories run inside sqlite3 while rows are fetched, so models are built
+# positionally in the aiosqlite worker thread with no intermediate tuples kept.
+
+
+def product_row(_: sqlite3.Cursor, row: tuple) -> Product:
+    return Product(
+        row[0], row[1], row[2], row[3], row[4], row[5], row[6], row[7], row[8],
+        bool(row[9]), bool(row[10]),
+    )
+
+
+def order_row(_: sqlite3.Cursor, row: tuple) -> Order:
+    return Order(*row)
+
+
+def order_item_row(_: sqlite3.Cursor, row: tuple) -> OrderItem:
+    return OrderItem(*row)
+
+
+def cart_item_row(_: sqlite3.Cursor, row: tuple) -> CartItem:
+    return CartItem(*row)
+
+
+async def fetch_all(
+    conn: aiosqlite.Connection,
+    sql: str,
+    params: Iterable[Any],
+    row_factory: RowFactory[T],
+) -> list[T]:
+    async with conn.execute(sql, params) as cur:
+        cur.row_factory = row_factory
+        return list(await cur.fetchall())
+
+
+async def fetch_one(
+    conn: aiosqlite.Connection,
+    sql: str,
+    params: Iterable[Any],
+    row_factory: RowFactory[T],
+) -> T | None:
+    async with conn.execute(sql, params) as cur:
+        cur.row_factory = row_factory
+        return await cur.fetchone()
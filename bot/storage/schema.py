@@ -17,7 +17,18 @@ class TableDef:
     indexes: tuple[IndexDef, ...] = ()
 
 
-SCHEMA_VERSION = 3
+@dataclass(frozen=True)
+class FtsTableDef:
+    """External-content FTS5 index kept in sync with ``content`` by triggers."""
+
+    content: str
+    columns: tuple[str, ...]
+    content_rowid: str = "id"
+    tokenize: str = "unicode61 remove_diacritics 2"
+    prefix: tuple[int, ...] = (2, 3)
+
+
+SCHEMA_VERSION = 8
 
 SCHEMA: dict[str, TableDef] = {
     "users": TableDef(
@@ -84,6 +95,7 @@ SCHEMA: dict[str, TableDef] = {
             "total": "INTEGER",
             "payment_method": "TEXT",
             "payment_id": "TEXT",
+            "payment_key": "TEXT",
             "created_at": "TEXT",
         },
         indexes=(
@@ -91,6 +103,14 @@ SCHEMA: dict[str, TableDef] = {
             IndexDef(name="idx_orders_tg_id", columns=("tg_id",)),
             IndexDef(name="idx_orders_status", columns=("status",)),
             IndexDef(name="idx_orders_user_id", columns=("user_id",)),
+            IndexDef(
+                name="idx_orders_tg_id_created_at",
+                columns=("tg_id", "created_at", "id"),
+            ),
+            IndexDef(
+                name="idx_orders_status_created_at",
+                columns=("status", "created_at", "id"),
+            ),
         ),
     ),
     "order_items": TableDef(
@@ -108,6 +128,38 @@ SCHEMA: dict[str, TableDef] = {
             IndexDef(name="idx_order_items_order_id", columns=("order_id",)),
         ),
     ),
+    "media_cache": TableDef(
+        columns={
+            "id": "INTEGER PRIMARY KEY",
+            "path": "TEXT",
+            "content_hash": "TEXT",
+            "file_id": "TEXT",
+            "updated_at": "TEXT",
+        },
+        constraints=("UNIQUE(path, content_hash)",),
+        indexes=(
+            IndexDef(
+                name="idx_media_cache_path_hash",
+                columns=("path", "content_hash"),
+                unique=True,
+            ),
+        ),
+    ),
+    "menu_states": TableDef(
+        columns={
+            "tg_id": "INTEGER PRIMARY KEY",
+            "state": "TEXT",
+            "updated_at": "TEXT",
+        },
+    ),
+    "fsm_states": TableDef(
+        columns={
+            "key": "TEXT PRIMARY KEY",
+            "state": "TEXT",
+            "data": "TEXT",
+            "updated_at": "TEXT",
+        },
+    ),
     "admin_payloads": TableDef(
         columns={
             "type": "TEXT PRIMARY KEY",
@@ -116,3 +168,10 @@ SCHEMA: dict[str, TableDef] = {
         },
     ),
 }
+
+FTS_TABLES: dict[str, FtsTableDef] = {
+    "products_fts": FtsTableDef(
+        content="products",
+        columns=("title", "description", "details"),
+    ),
+}
@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import re
+
+from .pool import get_pool
+
+# bm25 column weights for products_fts (title, description, details).
+_RANK_WEIGHTS = (10.0, 3.0, 1.0)
+_TOKEN_RE = re.compile(r"\w+")
+SEARCH_LIMIT = 200
+
+
+def build_match_query(text: str) -> str | None:
+    """Turn free user input into an FTS5 prefix query: every term must match.
+
+    Terms are quoted so punctuation or FTS operators in user input cannot break
+    the MATCH expression; the unicode61 tokenizer folds case for Cyrillic too.
+    """
+    tokens = _TOKEN_RE.findall(text.casefold())
+    if not tokens:
+        return None
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+async def search_product_ids(db_path: str, text: str, limit: int = SEARCH_LIMIT) -> list[int]:
+    """Return ids of the ``limit`` products best matching ``text``, most relevant first."""
+    match = build_match_query(text)
+    if match is None:
+        return []
+    weights = ", ".join(str(weight) for weight in _RANK_WEIGHTS)
+    async with get_pool(db_path).reader() as conn:
+        async with conn.execute(
+            f"""
+            SELECT rowid
+            FROM products_fts
+            WHERE products_fts MATCH ?
+            ORDER BY bm25(products_fts, {weights}), rowid
+            LIMIT ?
+            """,
+            (match, limit),
+        ) as cur:
+            return [int(row[0]) async for row in cur]
@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import json
+from datetime import datetime, timezone
+from typing import Any, Iterable, Mapping
+
+import aiosqlite
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from .kv import KVBackend
+from .pool import get_pool
+from .writer import write
+
+
+def _utc_now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+async def menu_state_load(db_path: str, tg_id: int) -> str | None:
+    async with get_pool(db_path).reader() as conn:
+        async with conn.execute("SELECT state FROM menu_states WHERE tg_id = ?", (tg_id,)) as cur:
+            row = await cur.fetchone()
+    return row[0] if row else None
+
+
+async def menu_states_save(db_path: str, states: Iterable[tuple[int, str]]) -> None:
+    """Upsert serialized menu states in one write."""
+    updated_at = _utc_now()
+    rows = [(tg_id, state, updated_at) for tg_id, state in states]
+    if not rows:
+        return
+
+    async def apply(conn: aiosqlite.Connection) -> None:
+        await conn.executemany(
+            """
+            INSERT INTO menu_states (tg_id, state, updated_at)
+            VALUES (?, ?, ?)
+            ON CONFLICT(tg_id) DO UPDATE SET
+                state = excluded.state,
+                updated_at = excluded.updated_at
+            """,
+            rows,
+        )
+
+    await write(db_path, apply)
+
+
+def _fsm_key(key: StorageKey) -> str:
+    return ":".join(
+        str(part) if part is not None else ""
+        for part in (
+            key.bot_id,
+            key.chat_id,
+            key.user_id,
+            key.thread_id,
+            getattr(key, "business_connection_id", None),
+            key.destiny,
+        )
+    )
+
+
+class SQLiteStorage(BaseStorage):
+    """aiogram FSM storage in the bot database, so FSM state survives restarts."""
+
+    def __init__(self, db_path: str) -> None:
+        self.db_path = db_path
+
+    async def _get(self, key: StorageKey) -> tuple[str | None, str | None]:
+        async with get_pool(self.db_path).reader() as conn:
+            async with conn.execute(
+                "SELECT state, data FROM fsm_states WHERE key = ?", (_fsm_key(key),)
+            ) as cur:
+                row = await cur.fetchone()
+        return (row[0], row[1]) if row else (None, None)
+
+    async def _upsert(self, key: StorageKey, column: str, value: str | None) -> None:
+        storage_key = _fsm_key(key)
+        updated_at = _utc_now()
+
+        async def apply(conn: aiosqlite.Connection) -> None:
+            await conn.execute(
+                f"""
+                INSERT INTO fsm_states (key, {column}, updated_at)
+                VALUES (?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    {column} = excluded.{column},
+                    updated_at = excluded.updated_at
+                """,
+                (storage_key, value, updated_at),
+            )
+            await conn.execute(
+                "DELETE FROM fsm_states WHERE key = ? AND state IS NULL AND data IS NULL",
+                (storage_key,),
+            )
+
+        await write(self.db_path, apply)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        await self._upsert(key, "state", value)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        state, _ = await self._get(key)
+        return state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        value = json.dumps(dict(data), ensure_ascii=False) if data else None
+        await self._upsert(key, "data", value)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        _, data = await self._get(key)
+        return json.loads(data) if data else {}
+
+    async def close(self) -> None:
+        # Connections belong to the shared pool, which main closes.
+        return None
+
+
+class KVStorage(BaseStorage):
+    """aiogram FSM storage in the shared state backend (``bot.storage.kv``).
+
+    State and data live under separate keys, so setting one never needs to
+    read the other. Writes are submitted with the update's other writes;
+    reads within the same update already see them.
+    """
+
+    def __init__(self, backend: KVBackend, prefix: str = "fsm:") -> None:
+        self.backend = backend
+        self.prefix = prefix
+
+    def keys(self, key: StorageKey) -> tuple[str, str]:
+        """Backend keys of ``key``'s state and data."""
+        base = f"{self.prefix}{_fsm_key(key)}"
+        return f"{base}:state", f"{base}:data"
+
+    def _put(self, key: str, value: str | None) -> None:
+        pipeline = self.backend.pipeline()
+        if value is None:
+            pipeline.delete(key)
+        else:
+            pipeline.set(key, value)
+        pipeline.submit()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        self._put(self.keys(key)[0], value)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        raw = await self.backend.get(self.keys(key)[0])
+        return raw.decode() if raw is not None else None
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        value = json.dumps(dict(data), ensure_ascii=False) if data else None
+        self._put(self.keys(key)[1], value)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        raw = await self.backend.get(self.keys(key)[1])
+        return json.loads(raw) if raw else {}
+
+    async def close(self) -> None:
+        # The backend is shared with the menu state and closed by main.
+        return None
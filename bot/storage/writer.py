@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, TypeVar
+
+import aiosqlite
+
+from .pool import ConnectionPool, get_pool
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+WriteOp = Callable[[aiosqlite.Connection], Awaitable[T]]
+
+DEFAULT_MAX_BATCH = 64
+DEFAULT_MAX_LATENCY = 0.005
+_RATE_WINDOW = 60.0
+_HISTOGRAM_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+class WriteQueue:
+    """Group commit: a single writer task applies queued writes in batches.
+
+    Each operation runs in its own savepoint, so one failing write is rolled back
+    without affecting the rest of the batch. Callers are resolved only after the
+    batch transaction has committed.
+    """
+
+    def __init__(
+        self,
+        pool: ConnectionPool,
+        max_batch: int = DEFAULT_MAX_BATCH,
+        max_latency: float = DEFAULT_MAX_LATENCY,
+    ) -> None:
+        if max_batch < 1:
+            raise ValueError("max_batch must be at least 1")
+        self._pool = pool
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self._queue: asyncio.Queue[tuple[WriteOp[Any], asyncio.Future[Any]] | None] = (
+            asyncio.Queue()
+        )
+        self._task: asyncio.Task[None] | None = None
+        self._closed = False
+        self.writes = 0
+        self.failed_writes = 0
+        self.commits = 0
+        self._commit_times: deque[float] = deque()
+        self._histogram: dict[int, int] = {bucket: 0 for bucket in _HISTOGRAM_BUCKETS}
+
+    async def submit(self, op: WriteOp[T]) -> T:
+        if self._closed:
+            raise RuntimeError("Write queue is closed")
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name=f"sqlite-writer:{self._pool.db_path}")
+        future: asyncio.Future[T] = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((op, future))
+        return await future
+
+    async def _collect(self) -> tuple[list[tuple[WriteOp[Any], asyncio.Future[Any]]], bool]:
+        first = await self._queue.get()
+        if first is None:
+            return [], True
+        batch = [first]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_latency
+        while len(batch) < self.max_batch:
+            if self._queue.empty():
+                if loop.time() >= deadline:
+                    break
+                # Let writers that are already running join; with nobody else
+                # writing, the batch goes out right away instead of lingering.
+                await asyncio.sleep(0)
+                if self._queue.empty():
+                    break
+            item = self._queue.get_nowait()
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch, stopping = await self._collect()
+            if batch:
+                await self._apply(batch)
+
+    async def _apply(self, batch: list[tuple[WriteOp[Any], asyncio.Future[Any]]]) -> None:
+        outcomes: list[tuple[bool, Any]] = []
+        try:
+            async with self._pool.writer() as conn:
+                if not conn.in_transaction:
+                    await conn.execute("BEGIN IMMEDIATE")
+                for op, _ in batch:
+                    await conn.execute("SAVEPOINT write_op")
+                    try:
+                        result = await op(conn)
+                    except Exception as exc:
+                        await conn.execute("ROLLBACK TO write_op")
+                        await conn.execute("RELEASE write_op")
+                        outcomes.append((False, exc))
+                    else:
+                        await conn.execute("RELEASE write_op")
+                        outcomes.append((True, result))
+        except Exception as exc:
+            logger.exception("Write batch of %s operations failed to commit", len(batch))
+            self.failed_writes += len(batch)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+
+        self._record_commit(len(batch))
+        for (_, future), (ok, value) in zip(batch, outcomes):
+            if future.done():
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                self.failed_writes += 1
+                future.set_exception(value)
+
+    def _record_commit(self, batch_size: int) -> None:
+        now = time.monotonic()
+        self.commits += 1
+        self.writes += batch_size
+        self._commit_times.append(now)
+        while self._commit_times and now - self._commit_times[0] > _RATE_WINDOW:
+            self._commit_times.popleft()
+        bucket = next((b for b in _HISTOGRAM_BUCKETS if batch_size <= b), _HISTOGRAM_BUCKETS[-1])
+        self._histogram[bucket] += 1
+
+    def stats(self) -> dict[str, Any]:
+        now = time.monotonic()
+        recent = sum(1 for ts in self._commit_times if now - ts <= _RATE_WINDOW)
+        return {
+            "queued": self._queue.qsize(),
+            "writes": self.writes,
+            "failed_writes": self.failed_writes,
+            "commits": self.commits,
+            "commits_per_second": recent / _RATE_WINDOW,
+            "avg_batch_size": self.writes / self.commits if self.commits else 0.0,
+            "batch_size_histogram": {f"<={b}": n for b, n in self._histogram.items()},
+        }
+
+    async def close(self) -> None:
+        """Stop accepting writes and wait until everything queued is committed."""
+        self._closed = True
+        if self._task is None:
+            return
+        self._queue.put_nowait(None)
+        await self._task
+        self._task = None
+
+
+_queues: dict[str, WriteQueue] = {}
+_max_batch = DEFAULT_MAX_BATCH
+_max_latency = DEFAULT_MAX_LATENCY
+
+
+def configure_write_queues(max_batch: int, max_latency: float) -> None:
+    """Set batching limits used for write queues created after this call."""
+    global _max_batch, _max_latency
+    if max_batch < 1:
+        raise ValueError("max_batch must be at least 1")
+    _max_batch = max_batch
+    _max_latency = max(max_latency, 0.0)
+
+
+def get_write_queue(db_path: str) -> WriteQueue:
+    queue = _queues.get(db_path)
+    if queue is None:
+        queue = WriteQueue(get_pool(db_path), max_batch=_max_batch, max_latency=_max_latency)
+        _queues[db_path] = queue
+    return queue
+
+
+async def write(db_path: str, op: WriteOp[T]) -> T:
+    """Run ``op`` on the writer connection as part of the next group commit."""
+    return await get_write_queue(db_path).submit(op)
+
+
+def write_queue_stats() -> dict[str, dict[str, Any]]:
+    return {db_path: queue.stats() for db_path, queue in _queues.items()}
+
+
+async def close_write_queues() -> None:
+    queues = list(_queues.values())
+    _queues.clear()
+    for queue in queues:
+        await queue.close()
@@ -0,0 +1,271 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import json
+import logging
+import secrets
+import signal
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+import aiohttp
+from aiogram import Bot
+from aiohttp import web
+
+from .config import Config
+from .webhook import MAX_WEBHOOK_CONNECTIONS
+
+logger = logging.getLogger(__name__)
+
+POLL_TIMEOUT = 30
+RESTART_DELAY = 1.0
+# Kill workers that have not exited this long after their drain deadline.
+_EXIT_GRACE = 5.0
+_SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+_REPO_ROOT = Path(__file__).resolve().parents[1]
+
+
+def update_user_id(update: dict[str, Any]) -> int | None:
+    """Sender of a raw update: ``from``/``user`` of its payload, else its chat."""
+    for key, payload in update.items():
+        if key == "update_id" or not isinstance(payload, dict):
+            continue
+        for sender in ("from", "user"):
+            user = payload.get(sender)
+            if isinstance(user, dict) and "id" in user:
+                return user["id"]
+        chat = payload.get("chat")
+        if chat is None and isinstance(payload.get("message"), dict):
+            chat = payload["message"].get("chat")
+        if isinstance(chat, dict) and "id" in chat:
+            return chat["id"]
+    return None
+
+
+def worker_for(user_id: int | None, workers: int) -> int:
+    # Telegram ids are spread evenly enough for a plain modulo; updates without
+    # a sender all go to the first worker.
+    return user_id % workers if user_id is not None else 0
+
+
+@dataclass
+class _Worker:
+    index: int
+    process: asyncio.subprocess.Process | None = None
+    alive: asyncio.Event = field(default_factory=asyncio.Event)
+    routed: int = 0
+    restarts: int = 0
+
+
+class Supervisor:
+    """Runs ``workers`` bot processes and routes every update by its sender.
+
+    A user always lands on the same worker, so the per-process menu state,
+    rate limiter and update executor keep working unchanged; the processes
+    share only the SQLite database (WAL). Updates are sent to a worker's
+    stdin as JSON lines. A worker that dies is started again, and updates
+    for it wait meanwhile.
+    """
+
+    def __init__(self, config: Config, workers: int) -> None:
+        self.config = config
+        self.workers = [_Worker(index) for index in range(workers)]
+        self._watchers: list[asyncio.Task[None]] = []
+        self._stopping = False
+        self.dropped = 0
+
+    async def start(self) -> None:
+        for worker in self.workers:
+            await self._spawn(worker)
+            self._watchers.append(
+                asyncio.create_task(self._watch(worker), name=f"worker-watch:{worker.index}")
+            )
+
+    async def _spawn(self, worker: _Worker) -> None:
+        worker.process = await asyncio.create_subprocess_exec(
+            sys.executable,
+            "-m",
+            "bot.worker",
+            str(worker.index),
+            str(len(self.workers)),
+            stdin=asyncio.subprocess.PIPE,
+            cwd=_REPO_ROOT,
+        )
+        worker.alive.set()
+        logger.info("Worker %s started, pid %s", worker.index, worker.process.pid)
+
+    async def _watch(self, worker: _Worker) -> None:
+        while True:
+            assert worker.process is not None
+            code = await worker.process.wait()
+            worker.alive.clear()
+            if self._stopping:
+                return
+            worker.restarts += 1
+            logger.error("Worker %s exited with %s, restarting", worker.index, code)
+            await asyncio.sleep(RESTART_DELAY)
+            await self._spawn(worker)
+
+    async def route(self, update: dict[str, Any]) -> bool:
+        worker = self.workers[worker_for(update_user_id(update), len(self.workers))]
+        line = json.dumps(update, ensure_ascii=False, separators=(",", ":")).encode() + b"\n"
+        while True:
+            await worker.alive.wait()
+            process = worker.process
+            assert process is not None and process.stdin is not None
+            try:
+                process.stdin.write(line)
+                # Waits while the worker is behind, which slows down intake.
+                await process.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                if self._stopping:
+                    self.dropped += 1
+                    logger.warning(
+                        "Worker %s went away, update %s lost",
+                        worker.index,
+                        update.get("update_id"),
+                    )
+                    return False
+                # Died before the watcher noticed: hold the update for the restarted worker.
+                if worker.process is process:
+                    worker.alive.clear()
+                continue
+            worker.routed += 1
+            return True
+
+    async def close(self) -> None:
+        """Let workers finish what they have, then stop them."""
+        self._stopping = True
+        for worker in self.workers:
+            if worker.process is not None and worker.process.stdin is not None:
+                worker.process.stdin.close()
+        deadline = self.config.webhook_drain_seconds + _EXIT_GRACE
+        for worker in self.workers:
+            if worker.process is None:
+                continue
+            try:
+                await asyncio.wait_for(worker.process.wait(), deadline)
+            except asyncio.TimeoutError:
+                logger.warning("Worker %s did not stop in %ss, killing it", worker.index, deadline)
+                with contextlib.suppress(ProcessLookupError):
+                    worker.process.kill()
+                await worker.process.wait()
+        for watcher in self._watchers:
+            watcher.cancel()
+        await asyncio.gather(*self._watchers, return_exceptions=True)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "routed": [worker.routed for worker in self.workers],
+            "restarts": [worker.restarts for worker in self.workers],
+            "dropped": self.dropped,
+        }
+
+
+async def _poll_updates(
+    supervisor: Supervisor, bot: Bot, allowed_updates: list[str], stop: asyncio.Event
+) -> None:
+    """A single getUpdates reader; updates are routed as raw JSON, never parsed into models."""
+    url = bot.session.api.api_url(token=bot.token, method="getUpdates")
+    offset = 0
+    timeout = aiohttp.ClientTimeout(total=POLL_TIMEOUT + 10)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        while not stop.is_set():
+            request = {
+                "offset": offset,
+                "timeout": POLL_TIMEOUT,
+                "allowed_updates": allowed_updates,
+            }
+            try:
+                async with session.post(url, json=request) as resp:
+                    body = await resp.json()
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+                logger.warning("getUpdates failed, retrying", exc_info=True)
+                await asyncio.sleep(RESTART_DELAY)
+                continue
+            if not body.get("ok"):
+                logger.warning("getUpdates refused: %s", body.get("description"))
+                await asyncio.sleep(RESTART_DELAY)
+                continue
+            for update in body["result"]:
+                offset = update["update_id"] + 1
+                await supervisor.route(update)
+
+
+async def _serve_webhook(
+    supervisor: Supervisor, bot: Bot, allowed_updates: list[str], stop: asyncio.Event
+) -> None:
+    config = supervisor.config
+    secret = (config.webhook_secret or "").encode()
+
+    async def handle(request: web.Request) -> web.Response:
+        # Bytes, since compare_digest rejects str with non-ASCII characters.
+        if not secrets.compare_digest(request.headers.get(_SECRET_HEADER, "").encode(), secret):
+            return web.Response(status=401, text="Unauthorized")
+        if stop.is_set():
+            return web.Response(status=503, text="Shutting down")
+        await supervisor.route(await request.json())
+        return web.json_response({})
+
+    app = web.Application()
+    app.router.add_post(config.webhook_path, handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, config.webhook_host, config.webhook_port).start()
+        await bot.set_webhook(
+            url=config.webhook_url,
+            secret_token=config.webhook_secret,
+            max_connections=min(config.webhook_max_concurrency, MAX_WEBHOOK_CONNECTIONS),
+            allowed_updates=allowed_updates,
+        )
+        logger.info(
+            "Webhook front listening on %s:%s%s",
+            config.webhook_host,
+            config.webhook_port,
+            config.webhook_path,
+        )
+        await stop.wait()
+    finally:
+        await runner.cleanup()
+
+
+async def run_supervisor(config: Config, allowed_updates: list[str]) -> None:
+    """Front process for BOT_WORKERS > 1: receive updates and fan them out.
+
+    ``allowed_updates`` are the update types the workers' dispatcher handles;
+    Telegram is asked for those only.
+    """
+    supervisor = Supervisor(config, config.bot_workers)
+    bot = Bot(token=config.bot_token)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        with contextlib.suppress(NotImplementedError):
+            loop.add_signal_handler(sig, stop.set)
+
+    started = time.monotonic()
+    await supervisor.start()
+    try:
+        if config.bot_mode == "webhook":
+            await _serve_webhook(supervisor, bot, allowed_updates, stop)
+        else:
+            await bot.delete_webhook()
+            poller = asyncio.create_task(_poll_updates(supervisor, bot, allowed_updates, stop), name="poll")
+            await stop.wait()
+            poller.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await poller
+    finally:
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            with contextlib.suppress(NotImplementedError):
+                loop.remove_signal_handler(sig)
+        await supervisor.close()
+        await bot.session.close()
+        logger.info(
+            "Supervisor stopped after %.0fs: %s", time.monotonic() - started, supervisor.stats()
+        )
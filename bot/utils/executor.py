@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+DEFAULT_WORKERS = 64
+
+
+@dataclass(slots=True)
+class _UserQueue:
+    # Updates of this user that are waiting for their turn, oldest first.
+    waiters: deque[tuple[bool, asyncio.Future[None]]] = field(default_factory=deque)
+    running: int = 0
+    # Whether the running updates are ones that may overlap each other.
+    shared: bool = False
+
+
+class UpdateExecutor(BaseMiddleware):
+    """Outer update middleware: one user's updates in order, users in parallel.
+
+    Each user's updates run one at a time in arrival order, and at most
+    ``workers`` updates run at once across all users. Updates for which
+    ``may_overlap`` is true (navigation clicks, whose handlers coalesce among
+    themselves) may run alongside each other, but never alongside any other
+    update of the same user. Updates without a sender only take a worker.
+    """
+
+    def __init__(
+        self,
+        workers: int = DEFAULT_WORKERS,
+        may_overlap: Callable[[Update], bool] | None = None,
+    ) -> None:
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        self.workers = workers
+        self.may_overlap = may_overlap
+        self._slots = asyncio.Semaphore(workers)
+        self._users: dict[int, _UserQueue] = {}
+        self.running = 0
+        self.waiting_for_worker = 0
+        self.processed = 0
+        self.max_user_depth = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        started = time.monotonic()
+        user = data.get("event_from_user")
+        user_id = user.id if user is not None else None
+        if user_id is not None:
+            shared = self.may_overlap is not None and isinstance(event, Update)
+            await self._acquire(user_id, shared and self.may_overlap(event))
+        try:
+            self.waiting_for_worker += 1
+            try:
+                await self._slots.acquire()
+            finally:
+                self.waiting_for_worker -= 1
+            waited = time.monotonic() - started
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            self.running += 1
+            try:
+                return await handler(event, data)
+            finally:
+                self.running -= 1
+                self.processed += 1
+                self._slots.release()
+        finally:
+            if user_id is not None:
+                self._release(user_id)
+
+    async def _acquire(self, user_id: int, shared: bool) -> None:
+        queue = self._users.get(user_id)
+        if queue is None:
+            queue = self._users[user_id] = _UserQueue()
+        if not queue.waiters and (queue.running == 0 or (shared and queue.shared)):
+            queue.running += 1
+            queue.shared = shared
+            return
+        entry = (shared, asyncio.get_running_loop().create_future())
+        queue.waiters.append(entry)
+        self.max_user_depth = max(self.max_user_depth, len(queue.waiters))
+        try:
+            await entry[1]
+        except asyncio.CancelledError:
+            if entry[1].done() and not entry[1].cancelled():
+                # Our turn came just as we were cancelled: pass it on.
+                self._release(user_id)
+            else:
+                with contextlib.suppress(ValueError):
+                    queue.waiters.remove(entry)
+                self._forget_if_idle(user_id, queue)
+            raise
+
+    def _release(self, user_id: int) -> None:
+        queue = self._users[user_id]
+        queue.running -= 1
+        if queue.running == 0:
+            self._wake(queue)
+        self._forget_if_idle(user_id, queue)
+
+    @staticmethod
+    def _wake(queue: _UserQueue) -> None:
+        # Let in the next update, and with it any run of overlapping ones.
+        while queue.waiters:
+            shared, future = queue.waiters[0]
+            if future.cancelled():
+                queue.waiters.popleft()
+                continue
+            if queue.running and not (shared and queue.shared):
+                return
+            queue.waiters.popleft()
+            queue.running += 1
+            queue.shared = shared
+            future.set_result(None)
+
+    def _forget_if_idle(self, user_id: int, queue: _UserQueue) -> None:
+        if queue.running == 0 and not queue.waiters:
+            del self._users[user_id]
+
+    def stats(self) -> dict[str, int | float]:
+        waiting_for_user = sum(len(queue.waiters) for queue in self._users.values())
+        return {
+            "workers": self.workers,
+            "running": self.running,
+            "waiting_for_worker": self.waiting_for_worker,
+            "waiting_for_user": waiting_for_user,
+            "active_users": len(self._users),
+            "max_user_depth": self.max_user_depth,
+            "processed": self.processed,
+            "wait_avg_ms": self.wait_total / self.processed * 1000 if self.processed else 0.0,
+            "wait_max_ms": self.wait_max * 1000,
+        }
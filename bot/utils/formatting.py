@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import html
 
+from bot.storage.models import OrderPage
 from bot.storage.repos import CartItem, Product
 
 
@@ -70,3 +71,28 @@ def format_admin_order(tg_id: int, items: list[CartItem], total: int, method: st
     lines.append(f"Итого: {total} ₽")
     lines.append(f"Оплата: {method}")
     return "\n".join(lines)
+
+
+ORDER_STATUS_LABELS = {
+    "new": "🆕 Новый",
+    "pending_payment": "⏳ Ожидает оплаты",
+    "paid": "✅ Оплачен",
+    "canceled": "❌ Отменен",
+}
+
+
+def format_order_history(page: OrderPage, first_page: bool = True) -> str:
+    if not page.orders:
+        return "У вас пока нет заказов." if first_page else "Больше заказов нет."
+    lines = ["<b>Ваши заказы</b>"] if first_page else []
+    for order in page.orders:
+        number = html.escape(order.order_id) if order.order_id else str(order.id)
+        created = order.created_at[:16].replace("T", " ")
+        status = ORDER_STATUS_LABELS.get(order.status, html.escape(order.status or "-"))
+        if lines:
+            lines.append("")
+        lines.append(f"Заказ #{number} от {created}")
+        lines.append(f"{status} • {order.total} ₽")
+        for item in page.items.get(order.id, []):
+            lines.append(f"• {html.escape(item.title)} x{item.qty} — {item.subtotal} ₽")
+    return "\n".join(lines)
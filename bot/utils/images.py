@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable
+
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+MAX_SIDE = 1280
+JPEG_QUALITY = 85
+# Bump when encoding settings change so old derivatives are not reused.
+PIPELINE_VERSION = 1
+
+_digests: dict[Path, tuple[int, int, str]] = {}
+
+
+def file_digest(path: Path) -> str:
+    """SHA-256 of the file contents, recomputed only when size or mtime change."""
+    stat = path.stat()
+    cached = _digests.get(path)
+    if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        return cached[2]
+    digest = hashlib.sha256(path.read_bytes()).hexdigest()
+    _digests[path] = (stat.st_mtime_ns, stat.st_size, digest)
+    return digest
+
+
+def _encode(source: str, target: str, max_side: int, quality: int) -> int:
+    """Write a resized progressive JPEG without metadata; runs in a worker process."""
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+            rgba = image.convert("RGBA")
+            image = Image.new("RGB", rgba.size, (255, 255, 255))
+            image.paste(rgba, mask=rgba.getchannel("A"))
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        partial = f"{target}.{os.getpid()}.tmp"
+        image.save(
+            partial,
+            "JPEG",
+            quality=quality,
+            optimize=True,
+            progressive=True,
+        )
+    os.replace(partial, target)
+    return os.path.getsize(target)
+
+
+@dataclass
+class PipelineReport:
+    sources: int = 0
+    encoded: int = 0
+    reused: int = 0
+    kept_original: int = 0
+    failed: int = 0
+    source_bytes: int = 0
+    served_bytes: int = 0
+    seconds: float = 0.0
+
+    @property
+    def saved_bytes(self) -> int:
+        return self.source_bytes - self.served_bytes
+
+    @property
+    def saved_ratio(self) -> float:
+        return self.saved_bytes / self.source_bytes if self.source_bytes else 0.0
+
+
+class ImagePipeline:
+    """Telegram-sized JPEG derivatives in a content-addressed directory.
+
+    ``prepare`` encodes sources in a process pool; ``resolve`` maps a source to
+    its derivative with a dict lookup, so render paths never encode or hash.
+    A derivative is named after the source hash and the encoding settings,
+    which makes it valid for as long as the file exists.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Path,
+        max_side: int = MAX_SIDE,
+        quality: int = JPEG_QUALITY,
+        workers: int | None = None,
+    ) -> None:
+        self.cache_dir = cache_dir
+        self.max_side = max_side
+        self.quality = quality
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self._executor: ProcessPoolExecutor | None = None
+        self._derivatives: dict[Path, Path] = {}
+        self.report = PipelineReport()
+
+    def _target(self, digest: str) -> Path:
+        name = f"{digest}-v{PIPELINE_VERSION}-{self.max_side}-q{self.quality}.jpg"
+        return self.cache_dir / digest[:2] / name
+
+    def resolve(self, source: Path) -> Path:
+        return self._derivatives.get(source, source)
+
+    def adopt(self, sources: Iterable[Path]) -> int:
+        """Map sources whose derivative already exists, without encoding anything.
+
+        For processes that leave encoding to another one. Hashes changed
+        files, so run it in a thread. Returns how many sources got a new
+        derivative.
+        """
+        adopted = 0
+        for source in sources:
+            try:
+                source_size = source.stat().st_size
+                target = self._target(file_digest(source))
+                if not target.exists():
+                    continue
+                served = target.stat().st_size
+            except OSError:
+                continue
+            if served < source_size:
+                if self._derivatives.get(source) != target:
+                    adopted += 1
+                self._derivatives[source] = target
+            else:
+                self._derivatives.pop(source, None)
+        return adopted
+
+    async def _prepare_one(self, source: Path, report: PipelineReport) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            source_size = source.stat().st_size
+            target = self._target(file_digest(source))
+            if target.exists():
+                served = target.stat().st_size
+                report.reused += 1
+            else:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                served = await loop.run_in_executor(
+                    self._executor, _encode, str(source), str(target), self.max_side, self.quality
+                )
+                report.encoded += 1
+        except Exception:
+            logger.warning("Failed to build derivative for %s", source, exc_info=True)
+            report.failed += 1
+            return
+        report.source_bytes += source_size
+        if served < source_size:
+            self._derivatives[source] = target
+            report.served_bytes += served
+        else:
+            # Re-encoding would make the file bigger; keep sending the original.
+            self._derivatives.pop(source, None)
+            report.kept_original += 1
+            report.served_bytes += source_size
+
+    async def prepare(self, sources: Iterable[Path]) -> PipelineReport:
+        """Build missing derivatives for ``sources`` and log bytes saved."""
+        started = time.monotonic()
+        unique = list(dict.fromkeys(path for path in sources if path.is_file()))
+        report = PipelineReport(sources=len(unique))
+        await asyncio.gather(*(self._prepare_one(source, report) for source in unique))
+        report.seconds = time.monotonic() - started
+        self.report = report
+        logger.info(
+            "Image derivatives ready in %.1fs: %s sources, %s encoded, %s reused, %s kept, "
+            "%s failed; %s -> %s bytes (%.0f%% saved)",
+            report.seconds,
+            report.sources,
+            report.encoded,
+            report.reused,
+            report.kept_original,
+            report.failed,
+            report.source_bytes,
+            report.served_bytes,
+            report.saved_ratio * 100,
+        )
+        return report
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+
+def _default_cache_dir() -> Path:
+    return Path(__file__).resolve().parents[2] / ".media_cache"
+
+
+image_pipeline = ImagePipeline(_default_cache_dir())
+
+
+def configure_images(cache_dir: str | None) -> None:
+    """Point the pipeline at ``cache_dir`` (default: <repo>/.media_cache)."""
+    image_pipeline.cache_dir = Path(cache_dir) if cache_dir else _default_cache_dir()
@@ -1,10 +1,23 @@
 from __future__ import annotations
 
+import json
+import logging
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Iterable
 
-from aiogram.types import FSInputFile, InputMediaPhoto
+from aiogram.types import FSInputFile, InputMediaPhoto, Message
 
-from bot.storage.repos import Product
+from bot.storage.repos import (
+    Product,
+    media_file_id_delete,
+    media_file_id_get,
+    media_file_id_save,
+    media_file_ids_load,
+)
+from bot.utils.images import file_digest, image_pipeline
+
+logger = logging.getLogger(__name__)
 
 PHOTO_EXTENSIONS = {".jpg", ".jpeg", ".png"}
 
@@ -25,21 +38,284 @@ def collect_photos(directory: Path) -> list[Path]:
     )
 
 
-def get_product_photos(product: Product) -> list[Path]:
+_SKIP_DIRS = {"node_modules", "venv", "__pycache__"}
+
+
+def _find_placeholder() -> Path | None:
+    fallback = repo_root() / "margarita" / "margarita_01.jpg"
+    if fallback.is_file():
+        return fallback
+    root = repo_root()
+    for path in sorted(root.rglob("*.jpg")):
+        parts = path.relative_to(root).parts[:-1]
+        if any(part.startswith(".") or part in _SKIP_DIRS for part in parts):
+            continue
+        if path.is_file():
+            return path
+    return None
+
+
+@dataclass
+class _PhotoDir:
+    mtime_ns: int
+    files: dict[str, tuple[int, int]]  # file name -> (mtime_ns, size)
+
+
+class PhotoManifest:
+    """Sorted photo lists per ``photo_dir``, scanned once and kept in memory.
+
+    Lookups never touch the filesystem. ``refresh`` re-stats the known
+    directories (and their files, to catch in-place overwrites) and rescans
+    only the ones that changed; it is meant to run off the event loop.
+    """
+
+    def __init__(self) -> None:
+        self._dirs: dict[str, _PhotoDir] = {}
+        self._photos: dict[str, tuple[Path, ...]] = {}
+        self._placeholder: Path | None = None
+        self._placeholder_resolved = False
+
+    def photos(self, photo_dir: str) -> tuple[Path, ...]:
+        return self._photos.get(photo_dir, ())
+
+    def placeholder(self) -> Path | None:
+        if not self._placeholder_resolved:
+            self._placeholder = _find_placeholder()
+            self._placeholder_resolved = True
+        return self._placeholder
+
+    def _scan(self, photo_dir: str) -> _PhotoDir | None:
+        directory = repo_root() / photo_dir
+        try:
+            mtime_ns = directory.stat().st_mtime_ns
+        except OSError:
+            return None
+        files: dict[str, tuple[int, int]] = {}
+        for path in collect_photos(directory):
+            stat = path.stat()
+            files[path.name] = (stat.st_mtime_ns, stat.st_size)
+        return _PhotoDir(mtime_ns=mtime_ns, files=files)
+
+    def _is_current(self, photo_dir: str, entry: _PhotoDir) -> bool:
+        directory = repo_root() / photo_dir
+        try:
+            if directory.stat().st_mtime_ns != entry.mtime_ns:
+                return False
+            for name, (mtime_ns, size) in entry.files.items():
+                stat = (directory / name).stat()
+                if stat.st_mtime_ns != mtime_ns or stat.st_size != size:
+                    return False
+        except OSError:
+            return False
+        return True
+
+    def refresh(self, photo_dirs: Iterable[str]) -> set[Path]:
+        """Bring ``photo_dirs`` up to date; return added, changed or removed files."""
+        changed: set[Path] = set()
+        wanted = set(photo_dirs)
+        for photo_dir in list(self._dirs):
+            if photo_dir not in wanted:
+                changed.update(self._photos.pop(photo_dir, ()))
+                del self._dirs[photo_dir]
+        for photo_dir in wanted:
+            old = self._dirs.get(photo_dir)
+            if old is not None and self._is_current(photo_dir, old):
+                continue
+            new = self._scan(photo_dir)
+            old_files = old.files if old else {}
+            new_files = new.files if new else {}
+            directory = repo_root() / photo_dir
+            for name in old_files.keys() | new_files.keys():
+                if old_files.get(name) != new_files.get(name):
+                    changed.add(directory / name)
+            if new is None:
+                self._dirs.pop(photo_dir, None)
+                self._photos.pop(photo_dir, None)
+            else:
+                self._dirs[photo_dir] = new
+                self._photos[photo_dir] = tuple(directory / name for name in sorted(new.files))
+        if changed or not self._placeholder_resolved:
+            self._placeholder = _find_placeholder()
+            self._placeholder_resolved = True
+        return changed
+
+    def load(self, path: Path) -> None:
+        """Seed from a JSON dump; ``refresh`` then only rescans what changed."""
+        try:
+            text = path.read_text(encoding="utf-8")
+        except OSError:
+            return
+        dirs: dict[str, _PhotoDir] = {}
+        try:
+            for photo_dir, entry in json.loads(text)["dirs"].items():
+                files = {
+                    name: (int(value[0]), int(value[1])) for name, value in entry["files"].items()
+                }
+                dirs[photo_dir] = _PhotoDir(mtime_ns=int(entry["mtime_ns"]), files=files)
+        except (ValueError, LookupError, TypeError, AttributeError) as exc:
+            logger.warning("Ignoring corrupt photo manifest %s: %r", path, exc)
+            return
+        for photo_dir, photo_entry in dirs.items():
+            self._dirs[photo_dir] = photo_entry
+            directory = repo_root() / photo_dir
+            self._photos[photo_dir] = tuple(directory / name for name in sorted(photo_entry.files))
+
+    def save(self, path: Path) -> None:
+        data = {
+            "dirs": {
+                photo_dir: {"mtime_ns": entry.mtime_ns, "files": entry.files}
+                for photo_dir, entry in sorted(self._dirs.items())
+            }
+        }
+        partial = path.with_suffix(path.suffix + ".tmp")
+        partial.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        partial.replace(path)
+
+
+photo_manifest = PhotoManifest()
+
+
+def get_product_source_photos(product: Product) -> list[Path]:
     if not product.photo_dir:
         return []
-    return collect_photos(repo_root() / product.photo_dir)
+    return list(photo_manifest.photos(product.photo_dir))
+
+
+def get_product_photos(product: Product) -> list[Path]:
+    """Photos to send for ``product``: optimized derivatives where they exist."""
+    return [image_pipeline.resolve(path) for path in get_product_source_photos(product)]
 
 
 def get_placeholder_photo() -> Path:
-    fallback = repo_root() / "margarita" / "margarita_01.jpg"
-    if fallback.exists():
-        return fallback
-    files = sorted(repo_root().rglob("*.jpg"))
-    if files:
-        return files[0]
-    raise FileNotFoundError("No placeholder images found")
+    placeholder = photo_manifest.placeholder()
+    if placeholder is None:
+        raise FileNotFoundError("No placeholder images found")
+    return placeholder
+
+
+def _cache_path(path: Path) -> str:
+    resolved = path.resolve()
+    try:
+        return resolved.relative_to(repo_root()).as_posix()
+    except ValueError:
+        return resolved.as_posix()
+
+
+class MediaCache:
+    """Telegram file_id per (photo path, content hash), persisted in SQLite.
+
+    After a photo has been uploaded once, later renders send the returned
+    file_id instead of the bytes; editing the file changes its hash, so a new
+    upload happens automatically.
+    """
+
+    def __init__(self) -> None:
+        self._db_path: str | None = None
+        self._file_ids: dict[tuple[str, str], str] = {}
+        # path -> (cache path, content hash); cleared by invalidate() when files change.
+        self._keys: dict[Path, tuple[str, str] | None] = {}
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.stale = 0
+
+    async def load(self, db_path: str) -> None:
+        self._db_path = db_path
+        self._file_ids = await media_file_ids_load(db_path)
+        logger.info("Media cache loaded: %s file ids", len(self._file_ids))
+
+    def _key(self, path: Path) -> tuple[str, str] | None:
+        if path in self._keys:
+            return self._keys[path]
+        try:
+            key = (_cache_path(path), file_digest(path))
+        except OSError:
+            key = None
+        self._keys[path] = key
+        return key
+
+    def invalidate(self, paths: Iterable[Path]) -> None:
+        for path in paths:
+            self._keys.pop(path, None)
+
+    def lookup(self, path: Path) -> str | None:
+        key = self._key(path)
+        file_id = self._file_ids.get(key) if key else None
+        if file_id is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return file_id
+
+    def contains(self, path: Path) -> bool:
+        key = self._key(path)
+        return key is not None and key in self._file_ids
+
+    async def fetch(self, path: Path) -> bool:
+        """Pick up a file_id another process stored after ``load``."""
+        key = self._key(path)
+        if key is None or self._db_path is None:
+            return False
+        file_id = await media_file_id_get(self._db_path, key[0], key[1])
+        if file_id is None:
+            return False
+        self._file_ids[key] = file_id
+        return True
+
+    async def remember(self, path: Path, message: Message | bool | None) -> None:
+        """Store the file_id Telegram assigned to an uploaded photo."""
+        if not isinstance(message, Message) or not message.photo:
+            return
+        key = self._key(path)
+        if key is None:
+            return
+        file_id = message.photo[-1].file_id
+        if self._file_ids.get(key) == file_id:
+            return
+        self._file_ids[key] = file_id
+        self.stored += 1
+        if self._db_path:
+            await media_file_id_save(self._db_path, key[0], key[1], file_id)
+
+    async def forget(self, path: Path) -> None:
+        """Drop a file_id Telegram rejected so the next render re-uploads."""
+        key = self._key(path)
+        if key is None or self._file_ids.pop(key, None) is None:
+            return
+        self.stale += 1
+        if self._db_path:
+            await media_file_id_delete(self._db_path, key[0], key[1])
+
+    def stats(self) -> dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._file_ids),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "stored": self.stored,
+            "stale": self.stale,
+        }
+
+
+media_cache = MediaCache()
+
+
+def build_media(photo_path: Path, caption: str, use_cache: bool = True) -> InputMediaPhoto:
+    photo_path = image_pipeline.resolve(photo_path)
+    file_id = media_cache.lookup(photo_path) if use_cache else None
+    media = file_id or FSInputFile(photo_path)
+    return InputMediaPhoto(media=media, caption=caption, parse_mode="HTML")
+
+
+def is_cached_media(media: InputMediaPhoto) -> bool:
+    return isinstance(media.media, str)
+
+
+_STALE_FILE_MARKERS = ("file identifier", "file reference", "wrong remote file", "wrong file_id")
 
 
-def build_media(photo_path: Path, caption: str) -> InputMediaPhoto:
-    return InputMediaPhoto(media=FSInputFile(photo_path), caption=caption, parse_mode="HTML")
+def is_stale_file_error(exc: Exception) -> bool:
+    """True when Telegram refused a cached file_id rather than the request itself."""
+    text = str(exc).lower()
+    return any(marker in text for marker in _STALE_FILE_MARKERS)
@@ -0,0 +1,349 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import time
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any, Iterator
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (
+    EditMessageCaption,
+    EditMessageMedia,
+    EditMessageReplyMarkup,
+    EditMessageText,
+    Response,
+    TelegramMethod,
+)
+
+from bot.utils.throttle import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Telegram: ~30 messages/s overall, ~1/s per private chat, 20/min per group.
+GLOBAL_RATE = 30.0
+CHAT_RATE = 1.0
+CHAT_BURST = 5.0
+GROUP_RATE = 20 / 60
+GROUP_BURST = 5.0
+MAX_RETRIES = 2
+_BUCKET_SWEEP_INTERVAL = 60.0
+
+# Parts of a message each edit method overwrites; a pending edit is dropped
+# when a newer edit of the same message overwrites everything it would change.
+_EDIT_COVERAGE: dict[type, frozenset[str]] = {
+    EditMessageMedia: frozenset({"media", "caption", "markup"}),
+    EditMessageCaption: frozenset({"caption", "markup"}),
+    EditMessageText: frozenset({"text", "markup"}),
+    EditMessageReplyMarkup: frozenset({"markup"}),
+}
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    ADMIN = 1
+    BULK = 2
+
+
+_priority: ContextVar[Priority] = ContextVar("outbound_priority", default=Priority.INTERACTIVE)
+
+
+@contextlib.contextmanager
+def outbound_priority(priority: Priority) -> Iterator[None]:
+    """Send the requests made inside this block with ``priority``."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+@dataclass(eq=False)
+class _Entry:
+    priority: Priority
+    chat_id: int | str
+    edit_key: tuple[int | str, int] | None
+    coverage: frozenset[str]
+    enqueued_at: float
+    # Resolves to None when the request may go out, or to the entry that superseded it.
+    ready: asyncio.Future[_Entry | None]
+    done: asyncio.Future[Any] = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.done = self.ready.get_loop().create_future()
+        # Superseded callers may never look at the outcome; keep asyncio quiet about it.
+        self.done.add_done_callback(lambda future: future.cancelled() or future.exception())
+
+
+@dataclass
+class _WaitStats:
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """Session middleware that paces chat-bound Bot API calls.
+
+    Requests wait in per-priority FIFO queues; a single pump releases them in
+    priority order as the global and per-chat token buckets allow, skipping
+    over chats that are still throttled. A ``retry_after`` answer puts the
+    chat's bucket into debt and the request is queued again. A pending edit
+    is dropped when a newer edit of the same message replaces all of it; its
+    caller waits for the newer edit and then gets ``None``, not the newer
+    edit's result.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = GLOBAL_RATE,
+        chat_rate: float = CHAT_RATE,
+        chat_burst: float = CHAT_BURST,
+        group_rate: float = GROUP_RATE,
+        group_burst: float = GROUP_BURST,
+        max_retries: int = MAX_RETRIES,
+    ) -> None:
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats: dict[int | str, TokenBucket] = {}
+        self._queues: dict[Priority, deque[_Entry]] = {priority: deque() for priority in Priority}
+        self._pending_edits: dict[tuple[int | str, int], list[_Entry]] = {}
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task[None] | None = None
+        self._last_sweep = time.monotonic()
+        self.dispatched = 0
+        self.coalesced = 0
+        self.retry_after = 0
+        self._waits: dict[Priority, _WaitStats] = {priority: _WaitStats() for priority in Priority}
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[Any],
+        bot: Bot,
+        method: TelegramMethod[Any],
+    ) -> Response[Any]:
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            return await make_request(bot, method)
+        done: asyncio.Future[Any] | None = None
+        attempt = 0
+        while True:
+            entry = self._enqueue(method, chat_id, done)
+            done = entry.done
+            try:
+                superseded_by = await entry.ready
+            except asyncio.CancelledError:
+                self._discard(entry)
+                # Callers this entry superseded wait on ``done``; the request never goes out.
+                done.cancel()
+                raise
+            if superseded_by is not None:
+                return await self._follow(entry, superseded_by)
+            try:
+                response = await make_request(bot, method)
+            except TelegramRetryAfter as exc:
+                self.retry_after += 1
+                self._bucket(chat_id).penalize(time.monotonic(), exc.retry_after)
+                if attempt < self.max_retries:
+                    attempt += 1
+                    logger.warning(
+                        "Flood control for chat %s, retrying in %ss", chat_id, exc.retry_after
+                    )
+                    continue
+                done.set_exception(exc)
+                raise
+            except asyncio.CancelledError:
+                done.cancel()
+                raise
+            except Exception as exc:
+                done.set_exception(exc)
+                raise
+            done.set_result(response)
+            return response
+
+    async def _follow(self, entry: _Entry, newer: _Entry) -> Response[Any]:
+        try:
+            await asyncio.shield(newer.done)
+        except asyncio.CancelledError:
+            entry.done.cancel()
+            raise
+        except Exception as exc:
+            entry.done.set_exception(exc)
+            raise
+        # The newer edit's Message describes other content; callers must not take it for theirs.
+        response: Response[Any] = Response(ok=True, result=None)
+        entry.done.set_result(response)
+        return response
+
+    def _bucket(self, chat_id: int | str) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            if is_group:
+                bucket = TokenBucket(self.group_rate, self.group_burst)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def _enqueue(
+        self,
+        method: TelegramMethod[Any],
+        chat_id: int | str,
+        done: asyncio.Future[Any] | None,
+    ) -> _Entry:
+        loop = asyncio.get_running_loop()
+        coverage = _EDIT_COVERAGE.get(type(method), frozenset())
+        message_id = getattr(method, "message_id", None)
+        edit_key = (chat_id, message_id) if coverage and message_id is not None else None
+        entry = _Entry(
+            priority=_priority.get(),
+            chat_id=chat_id,
+            edit_key=edit_key,
+            coverage=coverage,
+            enqueued_at=time.monotonic(),
+            ready=loop.create_future(),
+        )
+        if done is not None:
+            # A retry keeps the original outcome future: superseded callers wait on it.
+            entry.done = done
+        if edit_key is not None:
+            pending = self._pending_edits.setdefault(edit_key, [])
+            superseded = [older for older in pending if older.coverage <= coverage]
+            for older in superseded:
+                self._discard(older)
+                older.ready.set_result(entry)
+                self.coalesced += 1
+            if superseded and not self._pending_edits.get(edit_key):
+                # Nothing older stays queued for this message, so the newcomer
+                # can take the earliest superseded slot without reordering edits.
+                first = min(superseded, key=lambda older: older.enqueued_at)
+                entry.priority = min(entry.priority, first.priority)
+                entry.enqueued_at = first.enqueued_at
+            self._pending_edits.setdefault(edit_key, []).append(entry)
+        self._insert(entry)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="outbound-scheduler")
+        self._wakeup.set()
+        return entry
+
+    def _insert(self, entry: _Entry) -> None:
+        queue = self._queues[entry.priority]
+        if not queue or queue[-1].enqueued_at <= entry.enqueued_at:
+            queue.append(entry)
+            return
+        for index, queued in enumerate(queue):
+            if queued.enqueued_at > entry.enqueued_at:
+                queue.insert(index, entry)
+                return
+        queue.append(entry)
+
+    def _discard(self, entry: _Entry) -> None:
+        with contextlib.suppress(ValueError):
+            self._queues[entry.priority].remove(entry)
+        if entry.edit_key is None:
+            return
+        pending = self._pending_edits.get(entry.edit_key)
+        if pending is not None and entry in pending:
+            pending.remove(entry)
+            if not pending:
+                del self._pending_edits[entry.edit_key]
+
+    def _next_ready(self, now: float) -> tuple[_Entry | None, float | None]:
+        wait: float | None = None
+        throttled: set[int | str] = set()
+        for priority in Priority:
+            for entry in self._queues[priority]:
+                if entry.chat_id in throttled:
+                    continue
+                delay = self._bucket(entry.chat_id).ready_in(now)
+                if delay <= 0:
+                    return entry, None
+                throttled.add(entry.chat_id)
+                wait = delay if wait is None else min(wait, delay)
+        return None, wait
+
+    async def _run(self) -> None:
+        while True:
+            now = time.monotonic()
+            entry, wait = self._next_ready(now)
+            if entry is None:
+                if wait is None:
+                    self._sweep(now)
+                self._wakeup.clear()
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                continue
+            global_wait = self._global.ready_in(now)
+            if global_wait > 0:
+                # Re-pick afterwards: a higher-priority request may arrive meanwhile.
+                await asyncio.sleep(global_wait)
+                continue
+            self._global.take(now)
+            self._bucket(entry.chat_id).take(now)
+            self._discard(entry)
+            self._waits[entry.priority].add(now - entry.enqueued_at)
+            self.dispatched += 1
+            if not entry.ready.done():
+                entry.ready.set_result(None)
+
+    def _sweep(self, now: float) -> None:
+        if now - self._last_sweep < _BUCKET_SWEEP_INTERVAL:
+            return
+        self._last_sweep = now
+        for chat_id in [chat_id for chat_id, bucket in self._chats.items() if bucket.is_full(now)]:
+            del self._chats[chat_id]
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "queued": {priority.name.lower(): len(queue) for priority, queue in self._queues.items()},
+            "dispatched": self.dispatched,
+            "coalesced": self.coalesced,
+            "retry_after": self.retry_after,
+            "tracked_chats": len(self._chats),
+            "wait_ms": {
+                priority.name.lower(): {
+                    "count": wait.count,
+                    "avg": wait.total / wait.count * 1000 if wait.count else 0.0,
+                    "max": wait.max * 1000,
+                }
+                for priority, wait in self._waits.items()
+            },
+        }
+
+    def set_global_rate(self, rate: float) -> None:
+        """Replace the global bucket; ``rate`` is both the refill rate and the burst."""
+        self._global = TokenBucket(rate, rate)
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+
+outbound_scheduler = OutboundScheduler()
+
+
+def configure_outbound(processes: int) -> None:
+    """Give this process its share of the global send rate when ``processes`` bots run."""
+    outbound_scheduler.set_global_rate(GLOBAL_RATE / processes)
@@ -1,17 +1,254 @@
 from __future__ import annotations
 
+import logging
 import time
+from collections import Counter
+from typing import Any, Awaitable, Callable
 
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
 
-class Throttle:
-    def __init__(self, min_interval: float = 0.3) -> None:
-        self.min_interval = min_interval
-        self._last_action: dict[int, float] = {}
+from bot.storage.kv import KVBackend
 
-    def allow(self, user_id: int) -> bool:
+logger = logging.getLogger(__name__)
+
+USER_RATE = 3.0
+USER_BURST = 8.0
+GLOBAL_RATE = 300.0
+GLOBAL_BURST = 600.0
+SWEEP_INTERVAL = 60.0
+REJECT_TEXT = "Слишком быстро."
+
+# (callback data prefix, route, cost); first match wins. Costs roughly follow
+# how much database and Bot API work a route does.
+CALLBACK_COSTS: tuple[tuple[str, str, float], ...] = (
+    ("m:i:", "menu_nav", 1.0),
+    ("m:p:", "menu_nav", 1.0),
+    ("m:add", "cart_write", 2.0),
+    ("c:inc:", "cart_write", 2.0),
+    ("c:dec:", "cart_write", 2.0),
+    ("c:clear", "cart_write", 2.0),
+    ("c:checkout", "payment", 3.0),
+    ("pay:", "payment", 5.0),
+    ("payment:check", "payment", 5.0),
+    ("o:more:", "orders", 2.0),
+)
+
+
+class TokenBucket:
+    """``rate`` tokens per second, holding at most ``capacity``.
+
+    Tokens may go negative: ``penalize`` pushes the bucket into debt so that
+    nothing is allowed until the debt has been refilled.
+    """
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float, now: float | None = None) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic() if now is None else now
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def ready_in(self, now: float, cost: float = 1.0) -> float:
+        """Seconds until ``cost`` tokens are available (0 when they are now)."""
+        self._refill(now)
+        missing = cost - self.tokens
+        if missing <= 0:
+            return 0.0
+        return missing / self.rate
+
+    def take(self, now: float, cost: float = 1.0) -> bool:
+        if self.ready_in(now, cost) > 0:
+            return False
+        self.tokens -= cost
+        return True
+
+    def penalize(self, now: float, seconds: float) -> None:
+        """Allow nothing for ``seconds`` (e.g. a Telegram retry_after)."""
+        self._refill(now)
+        self.tokens = min(self.tokens, 1.0 - seconds * self.rate)
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+def route_cost(update: Update) -> tuple[str, float]:
+    """Route name and token cost of an incoming update."""
+    query = update.callback_query
+    if query is not None:
+        data = query.data or ""
+        for prefix, route, cost in CALLBACK_COSTS:
+            if data.startswith(prefix):
+                return route, cost
+        return "callback", 1.0
+    message = update.message
+    if message is not None:
+        if message.web_app_data is not None:
+            return "webapp_order", 5.0
+        if message.text and not message.text.startswith("/"):
+            # Free text is a menu search.
+            return "search", 2.0
+        return "message", 1.0
+    return "other", 1.0
+
+
+class RateLimiter:
+    """Per-user and global token buckets with idle-bucket sweeping."""
+
+    def __init__(
+        self,
+        user_rate: float = USER_RATE,
+        user_burst: float = USER_BURST,
+        global_rate: float = GLOBAL_RATE,
+        global_burst: float = GLOBAL_BURST,
+        sweep_interval: float = SWEEP_INTERVAL,
+    ) -> None:
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.sweep_interval = sweep_interval
+        self._global = TokenBucket(global_rate, global_burst)
+        self._users: dict[int, TokenBucket] = {}
+        self._last_sweep = time.monotonic()
+        self.allowed = 0
+        self.rejected: Counter[str] = Counter()
+
+    def allow(self, user_id: int | None, route: str = "other", cost: float = 1.0) -> bool:
         now = time.monotonic()
-        last = self._last_action.get(user_id, 0.0)
-        if now - last < self.min_interval:
+        if now - self._last_sweep >= self.sweep_interval:
+            self.sweep(now)
+        bucket = None
+        if user_id is not None:
+            bucket = self._users.get(user_id)
+            if bucket is None:
+                bucket = self._users[user_id] = TokenBucket(self.user_rate, self.user_burst, now)
+            if bucket.ready_in(now, cost) > 0:
+                self.rejected[route] += 1
+                return False
+        if not self._global.take(now, cost):
+            self.rejected["global"] += 1
             return False
-        self._last_action[user_id] = now
+        if bucket is not None:
+            bucket.take(now, cost)
+        self.allowed += 1
         return True
+
+    def sweep(self, now: float | None = None) -> int:
+        """Drop buckets of users who have been idle long enough to refill."""
+        now = time.monotonic() if now is None else now
+        self._last_sweep = now
+        idle = [user_id for user_id, bucket in self._users.items() if bucket.is_full(now)]
+        for user_id in idle:
+            del self._users[user_id]
+        return len(idle)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "tracked_users": len(self._users),
+            "allowed": self.allowed,
+            "rejected": dict(self.rejected),
+        }
+
+
+class RateLimitMiddleware(BaseMiddleware):
+    """Outer update middleware: drop updates beyond the sender's rate.
+
+    Rejected callback queries are still answered so the client stops its
+    spinner; other rejected updates are dropped silently.
+    """
+
+    def __init__(self, limiter: RateLimiter) -> None:
+        self.limiter = limiter
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        if not isinstance(event, Update):
+            return await handler(event, data)
+        user = data.get("event_from_user")
+        route, cost = route_cost(event)
+        if self.limiter.allow(user.id if user else None, route, cost):
+            return await handler(event, data)
+        await _reject(event, data)
+        return None
+
+
+async def _reject(event: Update, data: dict[str, Any]) -> None:
+    if event.callback_query is not None:
+        try:
+            await data["bot"].answer_callback_query(event.callback_query.id, text=REJECT_TEXT)
+        except Exception:
+            logger.debug("Failed to answer rate-limited callback", exc_info=True)
+
+
+class SharedRateLimitMiddleware(BaseMiddleware):
+    """Outer update middleware: per-user buckets kept in the shared state backend.
+
+    With several instances behind a load balancer a user's updates may reach
+    any of them, so the per-user limit has to be counted in one place. The
+    bucket is read with the update's other prefetched keys and written back
+    with its other writes; wall-clock time is used since instances do not
+    share a monotonic clock. Two instances handling the same user at the
+    same moment may both spend the same tokens, which only lets a burst
+    through slightly early. Must run inside a :class:`KVSessionMiddleware`.
+    """
+
+    def __init__(
+        self,
+        backend: KVBackend,
+        user_rate: float = USER_RATE,
+        user_burst: float = USER_BURST,
+        prefix: str = "rl:",
+    ) -> None:
+        self.backend = backend
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.prefix = prefix
+        # A bucket left alone this long is full again and need not be stored.
+        self.ttl = user_burst / user_rate + 1.0
+        self.allowed = 0
+        self.rejected: Counter[str] = Counter()
+
+    def key(self, user_id: int) -> str:
+        return f"{self.prefix}{user_id}"
+
+    def prefetch_keys(self, data: dict[str, Any]) -> list[str]:
+        user = data.get("event_from_user")
+        return [self.key(user.id)] if user is not None else []
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if not isinstance(event, Update) or user is None:
+            return await handler(event, data)
+        route, cost = route_cost(event)
+        now = time.time()
+        key = self.key(user.id)
+        bucket = TokenBucket(self.user_rate, self.user_burst, now)
+        raw = await self.backend.get(key)
+        if raw:
+            tokens, updated = raw.split(b":")
+            bucket.tokens, bucket.updated = float(tokens), float(updated)
+        if not bucket.take(now, cost):
+            self.rejected[route] += 1
+            await _reject(event, data)
+            return None
+        self.allowed += 1
+        self.backend.pipeline().set(key, f"{bucket.tokens:.3f}:{now:.3f}", self.ttl).submit()
+        return await handler(event, data)
+
+    def stats(self) -> dict[str, Any]:
+        return {"allowed": self.allowed, "rejected": dict(self.rejected)}
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from pathlib import Path
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+from aiogram.types import FSInputFile
+
+from bot.storage.catalog import get_catalog
+from bot.utils.images import image_pipeline
+from bot.utils.media import (
+    get_placeholder_photo,
+    get_product_source_photos,
+    media_cache,
+    photo_manifest,
+)
+from bot.utils.outbound import Priority, outbound_priority
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = 4
+_MAX_ATTEMPTS = 3
+
+
+async def catalog_source_photos(db_path: str) -> list[Path]:
+    """Every distinct original photo in the catalog, plus the placeholder."""
+    snapshot = await get_catalog(db_path)
+    photos: dict[Path, None] = {}
+    for product in snapshot.products:
+        for photo in get_product_source_photos(product):
+            photos[photo] = None
+    try:
+        photos[get_placeholder_photo()] = None
+    except FileNotFoundError:
+        pass
+    return list(photos)
+
+
+async def catalog_photos(db_path: str) -> list[Path]:
+    """Every distinct photo a render can send: derivatives where they exist."""
+    sources = await catalog_source_photos(db_path)
+    return list(dict.fromkeys(image_pipeline.resolve(photo) for photo in sources))
+
+
+async def refresh_photos(db_path: str, manifest_path: Path | None = None) -> set[Path]:
+    """Re-check the photo directories of the current catalog off the event loop."""
+    snapshot = await get_catalog(db_path)
+    photo_dirs = {product.photo_dir for product in snapshot.products if product.photo_dir}
+    changed = await asyncio.to_thread(photo_manifest.refresh, photo_dirs)
+    if changed:
+        media_cache.invalidate(changed)
+        if manifest_path is not None:
+            await asyncio.to_thread(photo_manifest.save, manifest_path)
+    return changed
+
+
+async def watch_photos(db_path: str, interval: float, manifest_path: Path | None = None) -> None:
+    """Poll photo directories and build derivatives for new or edited files."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            changed = await refresh_photos(db_path, manifest_path)
+            if changed:
+                logger.info("Photo manifest updated: %s files changed", len(changed))
+                await image_pipeline.prepare(path for path in changed if path.is_file())
+        except Exception:
+            logger.exception("Photo manifest refresh failed")
+
+
+async def follow_photos(db_path: str, interval: float) -> None:
+    """Track photo changes in a process that does not build derivatives itself.
+
+    Picks up manifest changes and the derivatives the primary process has
+    written since the last pass.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await refresh_photos(db_path)
+            sources = await catalog_source_photos(db_path)
+            adopted = await asyncio.to_thread(image_pipeline.adopt, sources)
+            if adopted:
+                logger.info("Picked up %s new image derivatives", adopted)
+        except Exception:
+            logger.exception("Photo refresh failed")
+
+
+async def _upload(bot: Bot, chat_id: int, photo: Path) -> bool:
+    for _ in range(_MAX_ATTEMPTS):
+        try:
+            sent = await bot.send_photo(
+                chat_id=chat_id,
+                photo=FSInputFile(photo),
+                disable_notification=True,
+            )
+        except TelegramRetryAfter as exc:
+            await asyncio.sleep(exc.retry_after)
+            continue
+        except (TelegramAPIError, OSError):
+            logger.warning("Media warm-up failed to upload %s", photo, exc_info=True)
+            return False
+        await media_cache.remember(photo, sent)
+        try:
+            await bot.delete_message(chat_id=chat_id, message_id=sent.message_id)
+        except TelegramAPIError:
+            pass
+        return True
+    logger.warning("Media warm-up gave up on %s after %s attempts", photo, _MAX_ATTEMPTS)
+    return False
+
+
+async def warm_media_cache(
+    bot: Bot,
+    db_path: str,
+    chat_id: int,
+    concurrency: int = DEFAULT_CONCURRENCY,
+) -> dict[str, int]:
+    """Upload every catalog photo whose file_id is not cached yet.
+
+    Each file_id is persisted as soon as its upload finishes, so an interrupted
+    warm-up resumes where it stopped; files whose content hash is already
+    cached are skipped. Uploads go to ``chat_id`` and are deleted right away.
+    """
+    started = time.monotonic()
+    photos = await catalog_photos(db_path)
+    pending = [photo for photo in photos if photo.is_file() and not media_cache.contains(photo)]
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+    async def upload(photo: Path) -> bool:
+        async with semaphore:
+            with outbound_priority(Priority.BULK):
+                return await _upload(bot, chat_id, photo)
+
+    results = await asyncio.gather(*(upload(photo) for photo in pending))
+    stats = {
+        "photos": len(photos),
+        "skipped": len(photos) - len(pending),
+        "uploaded": sum(results),
+        "failed": len(results) - sum(results),
+    }
+    logger.info(
+        "Media warm-up done in %.1fs: %s photos, %s cached, %s uploaded, %s failed",
+        time.monotonic() - started,
+        stats["photos"],
+        stats["skipped"],
+        stats["uploaded"],
+        stats["failed"],
+    )
+    return stats
@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import secrets
+import signal
+import time
+from typing import Any
+
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+# Telegram accepts 1..100 simultaneous webhook connections.
+MAX_WEBHOOK_CONNECTIONS = 100
+_SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    """Webhook handler that processes at most ``max_concurrency`` updates at once.
+
+    Each update is acknowledged as soon as a worker slot is free and then
+    fed to the dispatcher in a task of its own. When every slot is busy the
+    request waits, which holds the connection open and makes Telegram slow
+    down instead of piling up tasks. During shutdown new updates get 503, so
+    Telegram delivers them again after the restart.
+    """
+
+    def __init__(
+        self,
+        dispatcher: Dispatcher,
+        bot: Bot,
+        secret_token: str | None,
+        max_concurrency: int,
+        **data: Any,
+    ) -> None:
+        super().__init__(dispatcher=dispatcher, bot=bot, secret_token=secret_token, **data)
+        self.max_concurrency = max_concurrency
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._tasks: set[asyncio.Task[None]] = set()
+        self._draining = False
+        self._in_flight = 0
+        self.received = 0
+        self.rejected = 0
+        self.failed = 0
+        self.peak_in_flight = 0
+        self.slot_wait_max = 0.0
+
+    def verify_secret(self, telegram_secret_token: str, bot: Bot) -> bool:
+        if not self.secret_token:
+            return True
+        # Bytes, since compare_digest rejects str with non-ASCII characters.
+        return secrets.compare_digest(telegram_secret_token.encode(), self.secret_token.encode())
+
+    async def handle(self, request: web.Request) -> web.Response:
+        bot = await self.resolve_bot(request)
+        if not self.verify_secret(request.headers.get(_SECRET_HEADER, ""), bot):
+            return web.Response(body="Unauthorized", status=401)
+        if self._draining:
+            self.rejected += 1
+            return web.Response(status=503, text="Shutting down")
+        started = time.monotonic()
+        await self._slots.acquire()
+        self.slot_wait_max = max(self.slot_wait_max, time.monotonic() - started)
+        self._in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self._in_flight)
+        try:
+            update = await request.json(loads=bot.session.json_loads)
+        except BaseException:
+            # No task will run for this request, so nobody else releases the slot.
+            self._release()
+            raise
+        task = asyncio.create_task(self._process(bot, update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        self.received += 1
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    __call__ = handle
+
+    def _release(self) -> None:
+        self._in_flight -= 1
+        self._slots.release()
+
+    async def _process(self, bot: Bot, update: dict[str, Any]) -> None:
+        try:
+            result = await self.dispatcher.feed_raw_update(bot=bot, update=update, **self.data)
+            # The webhook was already answered, so a handler's reply method is sent as a call.
+            if isinstance(result, TelegramMethod):
+                await self.dispatcher.silent_call_request(bot=bot, result=result)
+        except Exception:
+            self.failed += 1
+            logger.exception("Failed to process update %s", update.get("update_id"))
+        finally:
+            self._release()
+
+    async def drain(self, timeout: float) -> int:
+        """Stop taking updates and wait up to ``timeout`` for running ones.
+
+        Returns how many updates had to be cancelled.
+        """
+        self._draining = True
+        tasks = set(self._tasks)
+        if not tasks:
+            return 0
+        logger.info("Waiting for %s updates to finish", len(tasks))
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+            logger.warning("Cancelled %s updates still running after %ss", len(pending), timeout)
+        return len(pending)
+
+    def stats(self) -> dict[str, int | float]:
+        return {
+            "received": self.received,
+            "rejected": self.rejected,
+            "failed": self.failed,
+            "in_flight": self._in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "max_concurrency": self.max_concurrency,
+            "slot_wait_max_ms": self.slot_wait_max * 1000,
+        }
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher, config: Config) -> None:
+    """Serve updates on a local aiohttp server until SIGINT/SIGTERM.
+
+    TLS is expected to be terminated by a reverse proxy in front of
+    ``webhook_host:webhook_port`` that forwards ``webhook_url`` to
+    ``webhook_path``.
+    """
+    handler = BoundedRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=config.webhook_secret,
+        max_concurrency=config.webhook_max_concurrency,
+    )
+    app = web.Application()
+    handler.register(app, path=config.webhook_path)
+    setup_application(app, dp, bot=bot)
+    runner = web.AppRunner(app)
+    await runner.setup()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        with contextlib.suppress(NotImplementedError):
+            loop.add_signal_handler(sig, stop.set)
+
+    try:
+        await web.TCPSite(runner, config.webhook_host, config.webhook_port).start()
+        await bot.set_webhook(
+            url=config.webhook_url,
+            secret_token=config.webhook_secret,
+            max_connections=min(config.webhook_max_concurrency, MAX_WEBHOOK_CONNECTIONS),
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+        logger.info(
+            "Webhook listening on %s:%s%s",
+            config.webhook_host,
+            config.webhook_port,
+            config.webhook_path,
+        )
+        await stop.wait()
+    finally:
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            with contextlib.suppress(NotImplementedError):
+                loop.remove_signal_handler(sig)
+        # The webhook stays registered: Telegram queues updates until we are back.
+        await handler.drain(config.webhook_drain_seconds)
+        logger.info("Webhook stopped: %s", handler.stats())
+        await runner.cleanup()
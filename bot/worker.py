@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import signal
+import sys
+
+from aiogram import Bot, Dispatcher
+from aiogram.enums import ParseMode
+
+from .config import load_config
+from .main import (
+    build_dispatcher,
+    configure_logging,
+    open_state,
+    prepare_media,
+    setup_storage,
+    shutdown,
+)
+from .storage.pool import close_pools
+from .storage.writer import close_write_queues
+from .utils.outbound import configure_outbound, outbound_scheduler
+
+logger = logging.getLogger(__name__)
+
+# Longest update line accepted from the supervisor.
+_MAX_LINE = 1 << 22
+
+
+async def _stdin_reader() -> tuple[asyncio.ReadTransport, asyncio.StreamReader]:
+    reader = asyncio.StreamReader(limit=_MAX_LINE)
+    protocol = asyncio.StreamReaderProtocol(reader)
+    transport, _ = await asyncio.get_running_loop().connect_read_pipe(
+        lambda: protocol, sys.stdin.buffer
+    )
+    return transport, reader
+
+
+async def _feed(dp: Dispatcher, bot: Bot, line: bytes, slots: asyncio.Semaphore) -> None:
+    try:
+        await dp.feed_raw_update(bot, json.loads(line))
+    except Exception:
+        logger.exception("Failed to process update")
+    finally:
+        slots.release()
+
+
+async def run_worker(index: int, workers: int) -> None:
+    """One of ``workers`` bot processes: handle the updates the supervisor sends.
+
+    Updates arrive as JSON lines on stdin; EOF means shut down after the
+    updates in flight finish. Migrations have already run in the supervisor,
+    and only worker 0 builds image derivatives, warms the media cache and
+    writes the photo manifest.
+    """
+    configure_logging(prefix=f"[worker {index}] ")
+    # The supervisor stops workers by closing stdin; terminal and service
+    # manager signals reach the whole process group and are its business.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    config = load_config()
+    primary = index == 0
+    try:
+        manifest_path = await setup_storage(config, migrate=False, owns_manifest=primary)
+    except BaseException:
+        # Open SQLite threads would otherwise keep a failed worker alive.
+        await close_write_queues()
+        await close_pools()
+        raise
+    configure_outbound(workers)
+    bot = Bot(token=config.bot_token, parse_mode=ParseMode.HTML)
+    bot.session.middleware(outbound_scheduler)
+    kv, menu_state = open_state(config)
+    dp = build_dispatcher(config, menu_state, processes=workers, kv=kv)
+    menu_state.start()
+    media_task = asyncio.create_task(
+        prepare_media(bot, config, manifest_path, primary=primary), name="media-prepare"
+    )
+
+    slots = asyncio.Semaphore(config.webhook_max_concurrency)
+    tasks: set[asyncio.Task[None]] = set()
+    try:
+        transport, reader = await _stdin_reader()
+        while line := await reader.readline():
+            if slots.locked():
+                # Stop reading while busy, so the pipe fills up and the supervisor
+                # waits. The reader alone would buffer megabytes of updates,
+                # all of them lost if the worker dies.
+                transport.pause_reading()
+                await slots.acquire()
+                transport.resume_reading()
+            else:
+                await slots.acquire()
+            task = asyncio.create_task(_feed(dp, bot, line, slots))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            logger.info("Waiting for %s updates to finish", len(tasks))
+            _, pending = await asyncio.wait(set(tasks), timeout=config.webhook_drain_seconds)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+    finally:
+        await shutdown(media_task, menu_state, kv)
+        await bot.session.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(run_worker(int(sys.argv[1]), int(sys.argv[2])))
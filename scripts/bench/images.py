@@ -0,0 +1,86 @@
+"""Measure the photo derivative pipeline on synthetic phone-sized JPEGs.
+
+Usage: python scripts/bench/images.py [--photos N] [--mbit RATE]
+
+Writes N noisy JPEGs (q95, 1280-4032 px, with EXIF) to a temporary
+directory, prepares their derivatives, and reports the bytes saved, the
+encoding time, the worst event-loop lag while encoding and the upload
+time at RATE Mbit/s before and after.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from PIL import Image, ImageFilter
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from bot.utils.images import ImagePipeline  # noqa: E402
+
+SIZES = ((4032, 3024), (3000, 4000), (2048, 1536), (1280, 960))
+
+
+def make_photos(directory: Path, count: int) -> list[Path]:
+    rnd = random.Random(1)
+    photos = []
+    for index in range(count):
+        width, height = rnd.choice(SIZES)
+        image = Image.effect_noise((width // 8, height // 8), 60).convert("RGB")
+        image = image.resize((width, height)).filter(ImageFilter.GaussianBlur(2))
+        exif = Image.Exif()
+        exif[0x010F] = "Phone"
+        exif[0x0132] = "2024:01:01 00:00:00"
+        path = directory / f"{index}.jpg"
+        image.save(path, quality=95, exif=exif)
+        photos.append(path)
+    return photos
+
+
+async def main(count: int, mbit: float) -> None:
+    root = Path(tempfile.mkdtemp())
+    source_dir = root / "src"
+    source_dir.mkdir()
+    photos = make_photos(source_dir, count)
+
+    lags: list[float] = []
+
+    async def watch_loop() -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(0.005)
+            lags.append(time.perf_counter() - started - 0.005)
+
+    pipeline = ImagePipeline(root / "cache")
+    watcher = asyncio.create_task(watch_loop())
+    try:
+        report = await pipeline.prepare(photos)
+    finally:
+        watcher.cancel()
+        pipeline.close()
+
+    bytes_per_second = mbit * 1e6 / 8
+    print(
+        f"size: {report.source_bytes / 1e6:.1f} MB -> {report.served_bytes / 1e6:.1f} MB"
+        f" ({report.saved_ratio:.0%} saved), encoded {report.encoded} in"
+        f" {report.seconds:.1f} s on {pipeline.workers} workers"
+    )
+    print(f"max event-loop lag while encoding: {max(lags, default=0) * 1000:.0f} ms")
+    print(
+        f"upload at {mbit:g} Mbit/s: {report.source_bytes / bytes_per_second:.1f} s"
+        f" -> {report.served_bytes / bytes_per_second:.1f} s"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--photos", type=int, default=24)
+    parser.add_argument("--mbit", type=float, default=20.0)
+    args = parser.parse_args()
+    asyncio.run(main(args.photos, args.mbit))
@@ -0,0 +1,65 @@
+"""Soak MenuStateStore with many distinct users and watch the process RSS.
+
+Usage: python scripts/bench/menu_state_soak.py [REPO_ROOT] [--users N]
+
+Each synthetic user marks its state in use (takes its lock, on trees
+from before the update executor), reads it and changes it once.
+RSS growth since the start (Linux only, from /proc) is printed every
+fifth of the run. REPO_ROOT
+defaults to this checkout; point it at a worktree of an older commit to
+compare before and after.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+parser.add_argument("root", nargs="?", default=str(Path(__file__).resolve().parents[2]))
+parser.add_argument("--users", type=int, default=1_000_000)
+args = parser.parse_args()
+sys.path.insert(0, args.root)
+
+from bot.features.menu.state import MenuStateStore  # noqa: E402
+
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def touch(store: MenuStateStore, user_id: int) -> None:
+    state = store.get(user_id)
+    state.item_index = user_id % 7
+    state.message_id = user_id
+
+
+async def main() -> None:
+    store = MenuStateStore()
+    step = max(args.users // 5, 1)
+    samples = []
+    base = rss_mb()
+    started = time.perf_counter()
+    for user_id in range(args.users):
+        if hasattr(store, "in_use"):
+            with store.in_use(user_id):
+                touch(store, user_id)
+        else:
+            async with store.get_lock(user_id):
+                touch(store, user_id)
+        if user_id % step == 0:
+            samples.append(f"{user_id // 1000}k: +{rss_mb() - base:.0f} MB")
+    elapsed = time.perf_counter() - started
+    samples.append(f"{args.users // 1000}k: +{rss_mb() - base:.0f} MB")
+    print(", ".join(samples))
+    print(f"{elapsed / args.users * 1e6:.2f} us per user")
+    if hasattr(store, "stats"):
+        print(store.stats())
+
+
+asyncio.run(main())
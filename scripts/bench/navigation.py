@@ -0,0 +1,137 @@
+"""Compare lock-serialized and coalesced menu navigation under rapid clicks.
+
+Usage: python scripts/bench/navigation.py [--clicks N] [--gap MS] [--latency MS]
+
+Every user clicks "next item" N times, GAP ms apart, against a fake bot
+whose every API call takes LATENCY ms. The serialized path is the handler
+as it was before coalescing: per-user lock, apply the click, render,
+answer. The coalesced path is today's item_next_handler.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Awaitable, Callable
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from bot.features.menu import handlers  # noqa: E402
+from bot.features.menu.handlers import item_next_handler, render_menu  # noqa: E402
+from bot.features.menu.navigation import NavDelta, navigation  # noqa: E402
+from bot.features.menu.state import MenuStateStore  # noqa: E402
+from bot.storage import repos  # noqa: E402
+from bot.storage.db import init_db  # noqa: E402
+from bot.storage.pool import close_pools  # noqa: E402
+from bot.storage.writer import close_write_queues  # noqa: E402
+from bot.utils.media import media_cache  # noqa: E402
+
+Handler = Callable[[Any, Any, MenuStateStore], Awaitable[None]]
+
+
+class FakeBot:
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+        self.calls = 0
+
+    async def _call(self, **kwargs: Any) -> Any:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return SimpleNamespace(message_id=1, photo=None)
+
+    edit_message_media = edit_message_caption = edit_message_reply_markup = _call
+    send_photo = _call
+
+
+def make_query(bot: FakeBot, user_id: int, answered: list[float]) -> Any:
+    async def answer(*args: Any, **kwargs: Any) -> None:
+        answered.append(time.perf_counter())
+
+    return SimpleNamespace(
+        from_user=SimpleNamespace(id=user_id),
+        message=SimpleNamespace(chat=SimpleNamespace(id=user_id)),
+        bot=bot,
+        answer=answer,
+    )
+
+
+def serialized_handler() -> Handler:
+    locks: defaultdict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+    async def handle(query: Any, config: Any, menu_state: MenuStateStore) -> None:
+        user_id = query.from_user.id
+        async with locks[user_id]:
+            NavDelta.item(1).apply(menu_state.get(user_id))
+            await render_menu(query.bot, query.message.chat.id, user_id, config, menu_state)
+        await query.answer()
+
+    return handle
+
+
+async def run(
+    handler: Handler, config: Any, users: int, clicks: int, gap: float, latency: float
+) -> dict[str, Any]:
+    store = MenuStateStore()
+    bot = FakeBot(latency)
+    for user_id in range(1, users + 1):
+        await render_menu(bot, user_id, user_id, config, store)
+    bot.calls = 0
+    answered: list[float] = []
+    tasks = []
+    started = time.perf_counter()
+    for _ in range(clicks):
+        for user_id in range(1, users + 1):
+            query = make_query(bot, user_id, answered)
+            tasks.append(asyncio.create_task(handler(query, config, store)))
+        await asyncio.sleep(gap)
+    last_click = time.perf_counter()
+    await asyncio.gather(*tasks)
+    finished = time.perf_counter()
+    positions = {store.get(user_id).item_index for user_id in range(1, users + 1)}
+    return {
+        "renders": bot.calls,
+        "answered": f"{len(answered)}/{len(tasks)}",
+        "total_ms": round((finished - started) * 1000),
+        "after_last_click_ms": round((finished - last_click) * 1000),
+        "item_index": sorted(positions),
+    }
+
+
+async def main(clicks: int, gap: float, latency: float) -> None:
+    db_path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    await init_db(db_path)
+    await repos.seed_products(db_path)
+    await media_cache.load(db_path)
+    # Seed products have no photos and no placeholder ships; the fake bot never reads it.
+    placeholder = Path(db_path).with_name("placeholder.jpg")
+    placeholder.write_bytes(b"")
+    handlers.get_placeholder_photo = lambda: placeholder
+    config = SimpleNamespace(db_path=db_path, webapp_url="https://example.com")
+    try:
+        for users in (1, 50):
+            for name, handler in (
+                ("serialized", serialized_handler()),
+                ("coalesced", item_next_handler),
+            ):
+                result = await run(handler, config, users, clicks, gap, latency)
+                print(f"{users} users, {name}: {result}")
+        print(navigation.stats())
+    finally:
+        await close_write_queues()
+        await close_pools()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clicks", type=int, default=10)
+    parser.add_argument("--gap", type=float, default=10.0)
+    parser.add_argument("--latency", type=float, default=50.0)
+    args = parser.parse_args()
+    asyncio.run(main(args.clicks, args.gap / 1000, args.latency / 1000))
@@ -0,0 +1,105 @@
+"""Compare the old LIKE scan with the FTS5 product search on a large catalog.
+
+Usage: python scripts/bench/search.py [--products N] [--runs N]
+
+Adds N synthetic products to a seeded database in a temporary directory,
+then times each query both ways. The LIKE query is the one the search
+used before the FTS5 index.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from bot.storage import repos  # noqa: E402
+from bot.storage.db import init_db  # noqa: E402
+from bot.storage.pool import close_pools  # noqa: E402
+from bot.storage.search import search_product_ids  # noqa: E402
+from bot.storage.writer import close_write_queues  # noqa: E402
+
+TITLES = (
+    "Маргарита", "Пепперони", "Сырная", "Гавайская", "Мясная",
+    "Грибная", "Острая", "Барбекю", "Цезарь", "Вегетарианская",
+)  # fmt: skip
+INGREDIENTS = (
+    "моцарелла", "бекон", "ветчина", "грибы", "ананас", "халапеньо",
+    "томаты", "базилик", "пармезан", "салями", "курица", "лук",
+)  # fmt: skip
+QUERIES = ("гавайская 123", "пепперони 4999", "грибы ананас", "халап")
+LIKE_SQL = (
+    "SELECT id FROM products"
+    " WHERE LOWER(title) LIKE ? OR LOWER(description) LIKE ? OR LOWER(details) LIKE ?"
+    " ORDER BY id"
+)
+
+
+def add_products(db_path: str, count: int) -> None:
+    rnd = random.Random(1)
+    rows = [
+        (
+            f"p{index}",
+            f"{rnd.choice(TITLES)} {index}",
+            ", ".join(rnd.sample(INGREDIENTS, 4)),
+            " ".join(rnd.sample(INGREDIENTS, 6)) + " 30 см",
+            500,
+            "pizza",
+            "Пицца",
+            None,
+            0,
+            0,
+            "",
+        )
+        for index in range(count)
+    ]
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany(
+            "INSERT INTO products (code, title, description, details, price, category,"
+            " category_title, photo_dir, is_popular, is_new, created_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+
+
+async def main(products: int, runs: int) -> None:
+    db_path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    await init_db(db_path)
+    await repos.seed_products(db_path)
+    add_products(db_path, products)
+    conn = sqlite3.connect(db_path)
+    try:
+        for query in QUERIES:
+            pattern = f"%{query}%"
+            started = time.perf_counter()
+            for _ in range(runs):
+                like_rows = conn.execute(LIKE_SQL, (pattern,) * 3).fetchall()
+            like_ms = (time.perf_counter() - started) / runs * 1000
+            started = time.perf_counter()
+            for _ in range(runs):
+                fts_rows = await search_product_ids(db_path, query)
+            fts_ms = (time.perf_counter() - started) / runs * 1000
+            print(
+                f"{query!r}: LIKE {like_ms:.1f} ms ({len(like_rows)} rows),"
+                f" FTS5 {fts_ms:.1f} ms ({len(fts_rows)} rows)"
+            )
+    finally:
+        conn.close()
+        await close_write_queues()
+        await close_pools()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=50_000)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.products, args.runs))
@@ -0,0 +1,78 @@
+"""Time the storage calls behind one menu click and one cart click.
+
+Usage: python scripts/bench/storage_flow.py [REPO_ROOT] [--clicks N]
+
+REPO_ROOT defaults to this checkout; point it at a worktree of an older
+commit to compare before and after. A seeded database is created in a
+temporary directory.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+parser.add_argument("root", nargs="?", default=str(Path(__file__).resolve().parents[2]))
+parser.add_argument("--clicks", type=int, default=500)
+args = parser.parse_args()
+sys.path.insert(0, args.root)
+
+from bot.storage import repos  # noqa: E402
+from bot.storage.db import init_db  # noqa: E402
+
+USERS = 50
+
+
+async def menu_click(db_path: str, tg_id: int) -> None:
+    await repos.get_products(db_path)
+    await repos.cart_total_qty(db_path, tg_id)
+    await repos.get_categories(db_path)
+    await repos.cart_item_qty(db_path, tg_id, 1)
+
+
+async def cart_click(db_path: str, tg_id: int) -> None:
+    await repos.cart_add(db_path, tg_id, 1)
+    await repos.cart_get_items(db_path, tg_id)
+    await repos.cart_total_price(db_path, tg_id)
+
+
+async def close_storage() -> None:
+    # Older trees have neither the write queue nor the pool.
+    try:
+        from bot.storage.writer import close_write_queues
+
+        await close_write_queues()
+    except ImportError:
+        pass
+    try:
+        from bot.storage.pool import close_pools
+
+        await close_pools()
+    except ImportError:
+        pass
+
+
+async def main() -> None:
+    db_path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    await init_db(db_path)
+    await repos.seed_products(db_path)
+    try:
+        for name, click in (("menu", menu_click), ("cart", cart_click)):
+            for _ in range(20):
+                await click(db_path, 1)
+            started = time.perf_counter()
+            for index in range(args.clicks):
+                await click(db_path, 1 + index % USERS)
+            elapsed = (time.perf_counter() - started) / args.clicks
+            print(f"{name} click: {elapsed * 1000:.2f} ms")
+    finally:
+        await close_storage()
+
+
+asyncio.run(main())
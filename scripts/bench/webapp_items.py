@@ -0,0 +1,68 @@
+"""Time the price recalculation of a Mini App order.
+
+Usage: python scripts/bench/webapp_items.py [REPO_ROOT] [--runs N]
+
+Runs _recalculate_webapp_items on orders of 15 and 100 lines whose keys
+mix product ids and codes. REPO_ROOT defaults to this checkout; point it
+at a worktree of an older commit to compare before and after.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+parser.add_argument("root", nargs="?", default=str(Path(__file__).resolve().parents[2]))
+parser.add_argument("--runs", type=int, default=50)
+args = parser.parse_args()
+sys.path.insert(0, args.root)
+
+from bot.features.cart.handlers import _recalculate_webapp_items  # noqa: E402
+from bot.storage import repos  # noqa: E402
+from bot.storage.db import init_db  # noqa: E402
+
+KEYS = ("margarita", "four_cheese", "cheese_bacon", "sausage", "meat", "1", "2", "3")
+
+
+async def close_storage() -> None:
+    # Older trees have neither the write queue nor the pool.
+    try:
+        from bot.storage.writer import close_write_queues
+
+        await close_write_queues()
+    except ImportError:
+        pass
+    try:
+        from bot.storage.pool import close_pools
+
+        await close_pools()
+    except ImportError:
+        pass
+
+
+async def main() -> None:
+    db_path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    await init_db(db_path)
+    await repos.seed_products(db_path)
+    try:
+        for lines in (15, 100):
+            items = [
+                {"item_id": KEYS[index % len(KEYS)], "qty": 1 + index % 3, "client_price": None}
+                for index in range(lines)
+            ]
+            started = time.perf_counter()
+            for _ in range(args.runs):
+                _, total = await _recalculate_webapp_items(db_path, "bench", items, None)
+            elapsed = (time.perf_counter() - started) / args.runs
+            print(f"{lines} lines: {elapsed * 1000:.2f} ms, total {total}")
+    finally:
+        await close_storage()
+
+
+asyncio.run(main())
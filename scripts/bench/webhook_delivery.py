@@ -0,0 +1,231 @@
+"""Compare long polling with the bounded webhook handler on a fake Bot API.
+
+Usage: python scripts/bench/webhook_delivery.py [--latency MS] [--cap N] [--connections N]
+
+A local aiohttp server plays the Bot API: it queues updates for
+getUpdates and records when each echo arrives via sendMessage. Every
+call waits LATENCY ms each way. The bot echoes each message after 10 ms
+of work. For each mode the script sends 300 updates 5 ms apart, then a
+burst of 1000, and reports the update-to-reply latency and throughput.
+Webhook requests go over at most N connections, like setWebhook's
+max_connections.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+import aiohttp
+from aiogram import Bot, Dispatcher, Router
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import Message
+from aiohttp import web
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from bot.webhook import BoundedRequestHandler  # noqa: E402
+
+TOKEN = "42:TEST"
+SECRET = "s3cret"
+USERS = 50
+
+
+class FakeBotAPI:
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+        self.updates: list[dict[str, Any]] = []
+        self.new_updates = asyncio.Event()
+        self.sent_at: dict[int, float] = {}
+        self.latencies: list[float] = []
+        self.url = ""
+        self._runner: web.AppRunner | None = None
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]  # type: ignore[union-attr]
+        self.url = f"http://127.0.0.1:{port}"
+
+    async def close(self) -> None:
+        assert self._runner is not None
+        await self._runner.cleanup()
+
+    def make_bot(self) -> Bot:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(self.url))
+        return Bot(TOKEN, session=session)
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        if request.content_type == "application/json":
+            data = await request.json()
+        else:
+            data = dict(await request.post())
+        await asyncio.sleep(self.latency)
+        if method == "getUpdates":
+            result: Any = await self._get_updates(
+                int(data.get("offset") or 0), int(data.get("timeout") or 0)
+            )
+        elif method == "sendMessage":
+            self.latencies.append(time.perf_counter() - self.sent_at[int(data["text"])])
+            result = {
+                "message_id": 1,
+                "date": 0,
+                "chat": {"id": int(data["chat_id"]), "type": "private"},
+                "text": data["text"],
+            }
+        elif method == "getMe":
+            result = {"id": 42, "is_bot": True, "first_name": "bench", "username": "bench"}
+        else:
+            result = True
+        await asyncio.sleep(self.latency)
+        return web.json_response({"ok": True, "result": result})
+
+    async def _get_updates(self, offset: int, timeout: int) -> list[dict[str, Any]]:
+        self.updates = [update for update in self.updates if update["update_id"] >= offset]
+        if not self.updates:
+            self.new_updates.clear()
+            try:
+                await asyncio.wait_for(self.new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.updates[:100]
+
+
+def make_update(update_id: int) -> dict[str, Any]:
+    user_id = 1000 + update_id % USERS
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "u"},
+            "text": str(update_id),
+        },
+    }
+
+
+def make_dispatcher() -> Dispatcher:
+    dp = Dispatcher()
+    router = Router()
+
+    @router.message()
+    async def echo(message: Message) -> None:
+        await asyncio.sleep(0.01)
+        await message.answer(message.text or "")
+
+    dp.include_router(router)
+    return dp
+
+
+class Load:
+    def __init__(self, api: FakeBotAPI) -> None:
+        self.api = api
+        self.next_id = 0
+
+    async def run(
+        self, push: Callable[[dict[str, Any]], Awaitable[None]], count: int, gap: float
+    ) -> str:
+        self.api.latencies.clear()
+        started = time.perf_counter()
+        for _ in range(count):
+            self.next_id += 1
+            self.api.sent_at[self.next_id] = time.perf_counter()
+            await push(make_update(self.next_id))
+            if gap:
+                await asyncio.sleep(gap)
+        while len(self.api.latencies) < count:
+            await asyncio.sleep(0.005)
+        total = time.perf_counter() - started
+        latencies = sorted(self.api.latencies)
+        return (
+            f"n={count} p50={latencies[count // 2] * 1000:.1f} ms"
+            f" p95={latencies[int(count * 0.95)] * 1000:.1f} ms"
+            f" max={latencies[-1] * 1000:.1f} ms, {count / total:.0f} updates/s"
+        )
+
+
+async def bench_polling(api: FakeBotAPI, load: Load) -> None:
+    bot, dp = api.make_bot(), make_dispatcher()
+
+    async def push(update: dict[str, Any]) -> None:
+        api.updates.append(update)
+        api.new_updates.set()
+
+    polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False, polling_timeout=10))
+    await asyncio.sleep(0.3)
+    try:
+        print("polling:", await load.run(push, 300, 0.005))
+        print("polling:", await load.run(push, 1000, 0))
+        # Let the last sendMessage calls get their answers before the session closes.
+        await asyncio.sleep(2 * api.latency + 0.1)
+    finally:
+        await dp.stop_polling()
+        await polling
+        await bot.session.close()
+
+
+async def bench_webhook(api: FakeBotAPI, load: Load, cap: int, connections: int) -> None:
+    bot, dp = api.make_bot(), make_dispatcher()
+    handler = BoundedRequestHandler(dp, bot, secret_token=SECRET, max_concurrency=cap)
+    app = web.Application()
+    handler.register(app, path="/webhook")
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]  # type: ignore[union-attr]
+    url = f"http://127.0.0.1:{port}/webhook"
+    headers = {"X-Telegram-Bot-Api-Secret-Token": SECRET}
+    client = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=connections))
+    posts: set[asyncio.Task[None]] = set()
+
+    async def post(update: dict[str, Any]) -> None:
+        await asyncio.sleep(api.latency)
+        async with client.post(url, json=update, headers=headers) as resp:
+            assert resp.status == 200, resp.status
+
+    async def push(update: dict[str, Any]) -> None:
+        task = asyncio.create_task(post(update))
+        posts.add(task)
+        task.add_done_callback(posts.discard)
+
+    try:
+        print("webhook:", await load.run(push, 300, 0.005))
+        print("webhook:", await load.run(push, 1000, 0))
+        print("webhook handler:", handler.stats())
+    finally:
+        await handler.drain(1)
+        await client.close()
+        await runner.cleanup()
+        await bot.session.close()
+
+
+async def main(latency: float, cap: int, connections: int) -> None:
+    api = FakeBotAPI(latency)
+    await api.start()
+    load = Load(api)
+    try:
+        await bench_polling(api, load)
+        await bench_webhook(api, load, cap, connections)
+    finally:
+        await api.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency", type=float, default=20.0)
+    parser.add_argument("--cap", type=int, default=64)
+    parser.add_argument("--connections", type=int, default=40)
+    args = parser.parse_args()
+    asyncio.run(main(args.latency / 1000, args.cap, args.connections))
@@ -0,0 +1,243 @@
+"""Measure update throughput of the single-process bot and of BOT_WORKERS > 1.
+
+Usage: python scripts/bench/workers.py [--updates N] [--users N] [--workers 1,2,4] [--kill]
+
+Runs ``python -m bot.main`` against a fake Bot API served by this script.
+The fake API holds back updates until every worker has had time to
+start. It then serves N /start updates from the given number of users
+through getUpdates and counts the replies. Throughput is measured from
+the first update served to the last reply. With --kill, one worker gets
+SIGKILL once half the updates are answered. Updates already in its
+pipe or in the supervisor's write buffer are lost. Later ones wait for
+the restarted worker. A run ends when every update is answered, or when
+nothing has been answered for 10 s after the last update was served.
+
+The bot processes load a generated sitecustomize module. It points
+aiogram at the fake API and lifts the Telegram rate limits, so the
+script measures routing overhead only. Linux only: --kill finds worker
+processes through /proc.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import signal
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+from aiohttp import web
+
+ROOT = Path(__file__).resolve().parents[2]
+
+SITECUSTOMIZE = '''
+import os
+
+from aiogram.client.session import base
+from aiogram.client.telegram import TelegramAPIServer
+
+_init = base.BaseSession.__init__
+
+
+def _session_init(self, *args, **kwargs):
+    kwargs.setdefault("api", TelegramAPIServer.from_base(os.environ["BENCH_API"]))
+    _init(self, *args, **kwargs)
+
+
+base.BaseSession.__init__ = _session_init
+
+import bot.utils.outbound as outbound  # noqa: E402
+import bot.utils.throttle as throttle  # noqa: E402
+
+throttle.GLOBAL_RATE = throttle.GLOBAL_BURST = 1e9
+outbound.GLOBAL_RATE = 1e9
+outbound.outbound_scheduler = outbound.OutboundScheduler(
+    global_rate=1e9, chat_rate=1e9, chat_burst=1e9
+)
+
+try:
+    # Newer aiogram takes parse_mode through DefaultBotProperties only.
+    from aiogram import Bot
+    from aiogram.client.default import DefaultBotProperties
+except ImportError:
+    pass
+else:
+    _bot_init = Bot.__init__
+
+    def _bot_init_parse_mode(self, *args, parse_mode=None, **kwargs):
+        if parse_mode is not None and "default" not in kwargs:
+            kwargs["default"] = DefaultBotProperties(parse_mode=parse_mode)
+        _bot_init(self, *args, **kwargs)
+
+    Bot.__init__ = _bot_init_parse_mode
+'''
+
+
+def start_update(update_id: int, users: int) -> dict[str, Any]:
+    user_id = 1000 + update_id % users
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "u"},
+            "text": "/start",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+        },
+    }
+
+
+class FakeBotAPI:
+    def __init__(self, updates: int, users: int, hold: float) -> None:
+        self.updates = [start_update(index + 1, users) for index in range(updates)]
+        self.hold = hold
+        self.booted: float | None = None
+        self.first: float | None = None
+        self.last: float | None = None
+        self.served = 0
+        self.sent = 0
+        self.all_sent = asyncio.Event()
+        self.url = ""
+        self._runner: web.AppRunner | None = None
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]  # type: ignore[union-attr]
+        self.url = f"http://127.0.0.1:{port}"
+
+    async def close(self) -> None:
+        assert self._runner is not None
+        await self._runner.cleanup()
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        if request.content_type == "application/json":
+            data = await request.json()
+        else:
+            data = dict(await request.post())
+        result: Any = True
+        if method == "getUpdates":
+            result = await self._get_updates(int(data.get("offset") or 0), data.get("timeout"))
+        elif method == "sendMessage":
+            self.sent += 1
+            self.last = time.perf_counter()
+            if self.sent >= len(self.updates):
+                self.all_sent.set()
+            result = {
+                "message_id": 1,
+                "date": 0,
+                "chat": {"id": int(data["chat_id"]), "type": "private"},
+                "text": "ok",
+            }
+        elif method == "getMe":
+            result = {"id": 42, "is_bot": True, "first_name": "bench", "username": "bench"}
+        return web.json_response({"ok": True, "result": result})
+
+    async def _get_updates(self, offset: int, timeout: Any) -> list[dict[str, Any]]:
+        now = time.perf_counter()
+        self.booted = self.booted or now
+        if now - self.booted < self.hold:
+            await asyncio.sleep(0.5)
+            return []
+        batch = self.updates[max(offset - 1, 0) :][:100]
+        if not batch:
+            await asyncio.sleep(min(int(timeout or 0), 1))
+            return []
+        self.first = self.first or now
+        self.served = max(self.served, batch[-1]["update_id"])
+        return batch
+
+
+def worker_pids(parent: int) -> list[int]:
+    pids = []
+    for entry in Path("/proc").iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = (entry / "stat").read_text()
+            cmdline = (entry / "cmdline").read_bytes()
+        except OSError:
+            continue
+        ppid = int(stat.rsplit(")", 1)[1].split()[1])
+        if ppid == parent and b"bot.worker" in cmdline:
+            pids.append(int(entry.name))
+    return sorted(pids)
+
+
+async def run(workers: int, updates: int, users: int, kill: bool, site_dir: str) -> None:
+    api = FakeBotAPI(updates, users, hold=4 + 3 * workers)
+    await api.start()
+    env = dict(
+        os.environ,
+        BOT_TOKEN="42:TEST",
+        MINIAPP_URL="https://example.com",
+        ADMIN_CHAT_ID="1",
+        DB_PATH=os.path.join(tempfile.mkdtemp(), "bench.db"),
+        MEDIA_WARMUP="false",
+        PHOTO_REFRESH_SECONDS="0",
+        BOT_MODE="polling",
+        STATE_BACKEND_URL="",
+        BOT_WORKERS=str(workers),
+        BENCH_API=api.url,
+        PYTHONPATH=os.pathsep.join([site_dir, str(ROOT)]),
+    )
+    bot = await asyncio.create_subprocess_exec(
+        sys.executable,
+        "-m",
+        "bot.main",
+        cwd=ROOT,
+        env=env,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    killed = None
+    try:
+        deadline = time.perf_counter() + 120
+        while not api.all_sent.is_set() and time.perf_counter() < deadline:
+            idle = time.perf_counter() - max(api.last or 0, api.first or 0)
+            if api.served == updates and idle > 10:
+                break
+            if kill and killed is None and workers > 1 and api.sent >= updates // 2:
+                pids = worker_pids(bot.pid)
+                if pids:
+                    killed = pids[-1]
+                    os.kill(killed, signal.SIGKILL)
+            await asyncio.sleep(0.05)
+    finally:
+        bot.send_signal(signal.SIGTERM)
+        code = await asyncio.wait_for(bot.wait(), 60)
+        await api.close()
+    elapsed = (api.last or 0) - (api.first or 0)
+    line = f"workers={workers}: answered {api.sent}/{updates}"
+    if elapsed > 0:
+        line += f" in {elapsed:.2f} s, {api.sent / elapsed:.0f} updates/s"
+    if killed is not None:
+        line += f", killed worker pid {killed}"
+    print(f"{line}, exit code {code}", flush=True)
+
+
+async def main(updates: int, users: int, workers: list[int], kill: bool) -> None:
+    with tempfile.TemporaryDirectory() as site_dir:
+        Path(site_dir, "sitecustomize.py").write_text(SITECUSTOMIZE)
+        for count in workers:
+            await run(count, updates, users, kill, site_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=3000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--kill", action="store_true")
+    args = parser.parse_args()
+    counts = [int(count) for count in args.workers.split(",")]
+    asyncio.run(main(args.updates, args.users, counts, args.kill))
@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+from aiogram import Dispatcher
+
+from bot.config import Config, load_config
+from bot.features.menu.state import KVMenuStateStore, PersistentMenuStateStore
+from bot.main import build_dispatcher
+from bot.storage.kv import MemoryKV
+
+
+@pytest.fixture
+def config(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> Config:
+    monkeypatch.setenv("BOT_TOKEN", "42:TEST")
+    monkeypatch.setenv("MINIAPP_URL", "https://example.com")
+    monkeypatch.setenv("ADMIN_CHAT_ID", "1")
+    monkeypatch.setenv("DB_PATH", str(tmp_path / "bot.db"))
+    return load_config()
+
+
+def outer_middlewares(dp: Dispatcher) -> list[str]:
+    # Feature routers are module globals; detach them so the next test can build again.
+    for router in dp.sub_routers:
+        router._parent_router = None
+    return [type(middleware).__name__ for middleware in dp.update.outer_middleware]
+
+
+def test_sqlite_middleware_order(config: Config) -> None:
+    dp = build_dispatcher(config, PersistentMenuStateStore(config.db_path))
+    assert outer_middlewares(dp) == [
+        "ErrorsMiddleware",
+        "UserContextMiddleware",
+        "RateLimitMiddleware",
+        "UpdateExecutor",
+        "FSMContextMiddleware",
+        "MenuStateMiddleware",
+    ]
+
+
+def test_kv_middleware_order(config: Config) -> None:
+    kv = MemoryKV()
+    dp = build_dispatcher(config, KVMenuStateStore(kv), kv=kv)
+    assert outer_middlewares(dp) == [
+        "ErrorsMiddleware",
+        "UserContextMiddleware",
+        "RateLimitMiddleware",
+        "UpdateExecutor",
+        "KVSessionMiddleware",
+        "SharedRateLimitMiddleware",
+        "FSMContextMiddleware",
+        "MenuStateMiddleware",
+    ]
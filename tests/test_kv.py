@@ -0,0 +1,344 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable
+
+import pytest
+
+from bot.storage.kv import (
+    KVBackend,
+    KVError,
+    MemoryKV,
+    RedisKV,
+    _ErrorReply,
+    _read_reply,
+    open_kv,
+)
+
+
+def run(coro: Awaitable[Any]) -> Any:
+    return asyncio.run(coro)
+
+
+async def parse(data: bytes) -> Any:
+    reader = asyncio.StreamReader()
+    reader.feed_data(data)
+    reader.feed_eof()
+    return await _read_reply(reader)
+
+
+class FakeRedis:
+    """Just enough of a RESP2 server for RedisKV: GET, SET [PX], DEL, EVAL (the CAS script)."""
+
+    def __init__(self) -> None:
+        self.data: dict[bytes, tuple[bytes, float | None]] = {}
+        self.commands: list[list[bytes]] = []
+        self.port = 0
+        self._server: asyncio.Server | None = None
+        self._writers: list[asyncio.StreamWriter] = []
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    def drop_connections(self) -> None:
+        for writer in self._writers:
+            writer.transport.abort()
+        self._writers.clear()
+
+    async def close(self) -> None:
+        assert self._server is not None
+        self._server.close()
+        self.drop_connections()
+        await self._server.wait_closed()
+
+    def _get(self, key: bytes) -> bytes | None:
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires is not None and expires <= time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    def _run(self, args: list[bytes]) -> bytes:
+        self.commands.append(args)
+        command = args[0].upper()
+        if command in (b"AUTH", b"SELECT"):
+            return b"+OK\r\n"
+        if args[1:2] == [b"broken"]:
+            return b"-WRONGTYPE Operation against a key holding the wrong kind of value\r\n"
+        if command == b"GET":
+            value = self._get(args[1])
+            return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+        if command == b"SET":
+            expires = time.monotonic() + int(args[4]) / 1000 if len(args) > 3 else None
+            self.data[args[1]] = (args[2], expires)
+            return b"+OK\r\n"
+        if command == b"DEL":
+            return b":%d\r\n" % (self.data.pop(args[1], None) is not None)
+        if command == b"EVAL":
+            key, missing, expected, value, ttl = args[3], args[4], args[5], args[6], int(args[7])
+            current = self._get(key)
+            swapped = current is None if missing == b"1" else current == expected
+            if swapped:
+                self.data[key] = (value, time.monotonic() + ttl / 1000 if ttl else None)
+            return b":%d\r\n" % swapped
+        return b"-ERR unknown command\r\n"
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._writers.append(writer)
+        try:
+            while True:
+                line = await reader.readuntil(b"\r\n")
+                args = []
+                for _ in range(int(line[1:-2])):
+                    size = int((await reader.readuntil(b"\r\n"))[1:-2])
+                    args.append((await reader.readexactly(size + 2))[:-2])
+                writer.write(self._run(args))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+def with_backend(
+    kind: str, test: Callable[[KVBackend, FakeRedis | None], Awaitable[None]]
+) -> None:
+    async def main() -> None:
+        if kind == "memory":
+            await test(MemoryKV(), None)
+            return
+        server = FakeRedis()
+        await server.start()
+        backend = RedisKV(port=server.port, timeout=1.0)
+        try:
+            await test(backend, server)
+        finally:
+            await backend.close()
+            await server.close()
+
+    run(main())
+
+
+BACKENDS = pytest.mark.parametrize("kind", ["memory", "redis"])
+
+
+def test_read_reply_simple_types() -> None:
+    assert run(parse(b"+OK\r\n")) == "OK"
+    assert run(parse(b":42\r\n")) == 42
+    assert run(parse(b"$5\r\nhello\r\n")) == b"hello"
+    assert run(parse(b"$0\r\n\r\n")) == b""
+
+
+def test_read_reply_bulk_may_contain_crlf() -> None:
+    assert run(parse(b"$4\r\na\r\nb\r\n")) == b"a\r\nb"
+
+
+def test_read_reply_nil() -> None:
+    assert run(parse(b"$-1\r\n")) is None
+    assert run(parse(b"*-1\r\n")) is None
+
+
+def test_read_reply_arrays() -> None:
+    reply = run(parse(b"*4\r\n$1\r\na\r\n:1\r\n$-1\r\n*2\r\n+x\r\n$0\r\n\r\n"))
+    assert reply == [b"a", 1, None, ["x", b""]]
+    assert run(parse(b"*0\r\n")) == []
+
+
+def test_read_reply_error_is_returned_not_raised() -> None:
+    reply = run(parse(b"-ERR wrong number of arguments\r\n"))
+    assert isinstance(reply, _ErrorReply)
+    assert isinstance(reply, KVError)
+    assert str(reply) == "ERR wrong number of arguments"
+
+
+def test_read_reply_rejects_unknown_type() -> None:
+    with pytest.raises(KVError):
+        run(parse(b"?what\r\n"))
+
+
+def test_read_reply_truncated() -> None:
+    with pytest.raises(asyncio.IncompleteReadError):
+        run(parse(b"$5\r\nhel"))
+
+
+@BACKENDS
+def test_pipeline_results_in_order(kind: str) -> None:
+    async def test(backend: KVBackend, server: FakeRedis | None) -> None:
+        results = await (
+            backend.pipeline()
+            .get("a")
+            .set("a", "1")
+            .get("a")
+            .cas("a", "1", "2")
+            .get("a")
+            .delete("a")
+            .delete("a")
+            .get("a")
+            .execute()
+        )
+        assert results == [None, True, b"1", True, b"2", True, False, None]
+        assert backend.stats()["round_trips"] == 1
+        assert backend.stats()["ops"] == 8
+
+    with_backend(kind, test)
+
+
+@BACKENDS
+def test_concurrent_batches_get_their_own_results(kind: str) -> None:
+    async def test(backend: KVBackend, server: FakeRedis | None) -> None:
+        async def batch(index: int) -> list[Any]:
+            key = f"k{index}"
+            return await backend.pipeline().set(key, str(index)).get(key).execute()
+
+        results = await asyncio.gather(*(batch(index) for index in range(50)))
+        assert results == [[True, str(index).encode()] for index in range(50)]
+
+    with_backend(kind, test)
+
+
+@BACKENDS
+def test_cas(kind: str) -> None:
+    async def test(backend: KVBackend, server: FakeRedis | None) -> None:
+        assert await backend.cas("c", None, "1")
+        assert not await backend.cas("c", None, "2")
+        assert not await backend.cas("c", "0", "2")
+        assert await backend.get("c") == b"1"
+        assert await backend.cas("c", "1", "2")
+        assert await backend.get("c") == b"2"
+
+    with_backend(kind, test)
+
+
+@BACKENDS
+def test_submitted_cas_conflicts_are_counted(kind: str) -> None:
+    async def test(backend: KVBackend, server: FakeRedis | None) -> None:
+        await backend.set("c", "1")
+        backend.pipeline().cas("c", "0", "2").cas("c", "1", "3").delete("missing").submit()
+        # A later round trip is answered after the submitted batch.
+        assert await backend.get("c") == b"3"
+        await asyncio.sleep(0)  # Let the done callback run.
+        stats = backend.stats()
+        assert stats["cas_conflicts"] == 1
+        assert stats["failed_writes"] == 0
+
+    with_backend(kind, test)
+
+
+@BACKENDS
+def test_ttl(kind: str) -> None:
+    async def test(backend: KVBackend, server: FakeRedis | None) -> None:
+        await backend.set("t", "1", ttl=0.05)
+        await backend.set("p", "1")
+        assert await backend.get("t") == b"1"
+        await asyncio.sleep(0.1)
+        assert await backend.get("t") is None
+        assert await backend.get("p") == b"1"
+
+    with_backend(kind, test)
+
+
+@BACKENDS
+def test_session_prefetches_and_defers_writes(kind: str) -> None:
+    async def test(backend: KVBackend, server: FakeRedis | None) -> None:
+        await backend.set("a", "1")
+        before = backend.stats()["round_trips"]
+        async with backend.session(["a", "b"]):
+            assert await backend.get("a") == b"1"
+            assert await backend.get("b") is None
+            backend.pipeline().set("b", "2").cas("a", "1", "3").submit()
+            assert await backend.get("b") == b"2"
+            assert await backend.get("a") == b"3"
+            # Held until the session ends.
+            assert backend.stats()["round_trips"] == before + 1
+        assert await backend.get("a") == b"3"
+        assert await backend.get("b") == b"2"
+        assert backend.stats()["round_trips"] == before + 4
+        assert backend.stats()["session_hits"] == 4
+
+    with_backend(kind, test)
+
+
+def test_redis_error_reply_fails_only_its_batch() -> None:
+    async def test(backend: KVBackend, server: FakeRedis | None) -> None:
+        with pytest.raises(KVError, match="WRONGTYPE"):
+            await backend.pipeline().set("a", "1").get("broken").execute()
+        # The rest of that batch was still applied and the connection is fine.
+        assert await backend.get("a") == b"1"
+        assert backend.stats()["connects"] == 1
+
+    with_backend("redis", test)
+
+
+def test_redis_commands_on_the_wire() -> None:
+    async def test(backend: KVBackend, server: FakeRedis | None) -> None:
+        assert server is not None
+        await backend.pipeline().set("a", "1", ttl=1.5).set("b", "2").delete("b").execute()
+        assert server.commands == [
+            [b"SET", b"a", b"1", b"PX", b"1500"],
+            [b"SET", b"b", b"2"],
+            [b"DEL", b"b"],
+        ]
+
+    with_backend("redis", test)
+
+
+def test_redis_handshake() -> None:
+    async def main() -> None:
+        server = FakeRedis()
+        await server.start()
+        backend = open_kv(f"redis://:p%40ss@127.0.0.1:{server.port}/3")
+        try:
+            assert await backend.get("a") is None
+            assert server.commands[:2] == [[b"AUTH", b"p@ss"], [b"SELECT", b"3"]]
+        finally:
+            await backend.close()
+            await server.close()
+
+    run(main())
+
+
+def test_redis_reconnects_after_the_connection_drops() -> None:
+    async def test(backend: KVBackend, server: FakeRedis | None) -> None:
+        assert server is not None and isinstance(backend, RedisKV)
+        await backend.set("a", "1")
+        server.drop_connections()
+        for _ in range(100):
+            if backend._writer is None:
+                break
+            await asyncio.sleep(0.01)
+        assert await backend.get("a") == b"1"
+        assert backend.stats()["connects"] == 2
+
+    with_backend("redis", test)
+
+
+def test_redis_unreachable() -> None:
+    async def main() -> None:
+        server = FakeRedis()
+        await server.start()
+        port = server.port
+        await server.close()
+        backend = RedisKV(port=port, timeout=1.0)
+        with pytest.raises(KVError, match="Cannot connect"):
+            await backend.get("a")
+        await backend.close()
+
+    run(main())
+
+
+def test_open_kv() -> None:
+    assert isinstance(open_kv("memory://"), MemoryKV)
+    backend = open_kv("redis://example.com")
+    assert isinstance(backend, RedisKV)
+    assert (backend.host, backend.port, backend.db, backend.password) == (
+        "example.com",
+        6379,
+        0,
+        None,
+    )
+    with pytest.raises(ValueError):
+        open_kv("memcached://localhost")
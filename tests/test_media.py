@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from bot.utils.media import PhotoManifest
+
+
+def test_manifest_round_trip(tmp_path: Path) -> None:
+    path = tmp_path / "manifest.json"
+    path.write_text(json.dumps({"dirs": {"photos/a": {"mtime_ns": 1, "files": {"2.jpg": [3, 4]}}}}))
+    manifest = PhotoManifest()
+    manifest.load(path)
+    assert [photo.name for photo in manifest.photos("photos/a")] == ["2.jpg"]
+    manifest.save(path)
+    assert json.loads(path.read_text())["dirs"]["photos/a"]["files"] == {"2.jpg": [3, 4]}
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        "{not json",
+        [],
+        {},
+        {"dirs": {"photos/a": {"files": {}}}},
+        {"dirs": {"photos/a": {"mtime_ns": 1}}},
+        {"dirs": {"photos/a": {"mtime_ns": 1, "files": {"1.jpg": []}}}},
+        {"dirs": {"photos/a": {"mtime_ns": "x", "files": {}}}},
+    ],
+)
+def test_corrupt_manifest_starts_empty(
+    tmp_path: Path, data: Any, caplog: pytest.LogCaptureFixture
+) -> None:
+    path = tmp_path / "manifest.json"
+    path.write_text(data if isinstance(data, str) else json.dumps(data))
+    manifest = PhotoManifest()
+    manifest.load(path)
+    assert manifest.photos("photos/a") == ()
+    assert "corrupt photo manifest" in caplog.text
+
+
+def test_missing_manifest_starts_empty(tmp_path: Path) -> None:
+    manifest = PhotoManifest()
+    manifest.load(tmp_path / "missing.json")
+    assert manifest.photos("photos/a") == ()
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any
+
+import pytest
+from aiogram.methods import EditMessageReplyMarkup, Response, SendMessage, TelegramMethod
+
+from bot.utils.outbound import OutboundScheduler
+
+
+class FakeAPI:
+    def __init__(self) -> None:
+        self.sent: list[TelegramMethod[Any]] = []
+
+    async def __call__(self, bot: Any, method: TelegramMethod[Any]) -> Response[Any]:
+        self.sent.append(method)
+        return Response[Any](ok=True, result=len(self.sent))
+
+
+def edit(message_id: int = 5) -> EditMessageReplyMarkup:
+    return EditMessageReplyMarkup(chat_id=1, message_id=message_id)
+
+
+async def throttled(scheduler: OutboundScheduler, api: FakeAPI) -> None:
+    """Use up chat 1's burst, so the next requests for it stay queued."""
+    await scheduler(api, None, SendMessage(chat_id=1, text="hi"))  # type: ignore[arg-type]
+
+
+def run(test: Any) -> None:
+    async def main() -> None:
+        scheduler = OutboundScheduler(chat_rate=0.01, chat_burst=1)
+        try:
+            await test(scheduler, FakeAPI())
+        finally:
+            await scheduler.close()
+
+    asyncio.run(main())
+
+
+def test_cancelled_newest_edit_releases_superseded_callers() -> None:
+    async def test(scheduler: OutboundScheduler, api: FakeAPI) -> None:
+        await throttled(scheduler, api)
+        older = asyncio.create_task(scheduler(api, None, edit()))  # type: ignore[arg-type]
+        await asyncio.sleep(0)
+        newer = asyncio.create_task(scheduler(api, None, edit()))  # type: ignore[arg-type]
+        await asyncio.sleep(0)
+        newer.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await asyncio.wait_for(older, 1)
+        assert len(api.sent) == 1
+        assert scheduler.stats()["queued"]["interactive"] == 0
+
+    run(test)
+
+
+def test_superseded_edit_gets_no_result() -> None:
+    async def test(scheduler: OutboundScheduler, api: FakeAPI) -> None:
+        # Both enqueue before the scheduler's pump first runs.
+        older = asyncio.create_task(scheduler(api, None, edit()))  # type: ignore[arg-type]
+        newer = asyncio.create_task(scheduler(api, None, edit()))  # type: ignore[arg-type]
+        responses = await asyncio.gather(older, newer)
+        assert [response.result for response in responses] == [None, 1]
+        assert scheduler.stats()["coalesced"] == 1
+
+    run(test)
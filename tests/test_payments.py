@@ -0,0 +1,268 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+from typing import Any, Awaitable, Callable
+
+import pytest
+from aiohttp import web
+
+from bot import payments
+from bot.payments import YooKassaClient, YooKassaError
+
+PAYMENT = {
+    "id": "2d9a-pay",
+    "status": "pending",
+    "confirmation": {"type": "redirect", "confirmation_url": "https://pay.example/2d9a"},
+}
+
+Reply = Callable[[], web.StreamResponse | Awaitable[web.StreamResponse]]
+
+
+def reply(status: int = 200, body: Any = PAYMENT, **headers: str) -> Reply:
+    return lambda: web.json_response(body, status=status, headers=headers)
+
+
+def hang(seconds: float) -> Reply:
+    async def respond() -> web.StreamResponse:
+        # Not asyncio.sleep, which the delays fixture replaces.
+        with contextlib.suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(asyncio.Event().wait(), seconds)
+        return web.json_response(PAYMENT)
+
+    return respond
+
+
+class FakeYooKassa:
+    """Answers each request with the next scripted reply and records what it got."""
+
+    def __init__(self, replies: list[Reply]) -> None:
+        self.replies = list(replies)
+        self.requests: list[tuple[str, str, dict[str, str], Any]] = []
+        self.url = ""
+        self._runner: web.AppRunner | None = None
+
+    async def _handle(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json() if request.can_read_body else None
+        self.requests.append((request.method, request.path, dict(request.headers), body))
+        response = self.replies.pop(0)()
+        if asyncio.iscoroutine(response):
+            response = await response
+        return response
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_route("*", "/v3/{tail:.*}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]  # type: ignore[union-attr]
+        self.url = f"http://127.0.0.1:{port}/v3"
+
+    async def close(self) -> None:
+        assert self._runner is not None
+        await self._runner.cleanup()
+
+
+@pytest.fixture
+def delays(monkeypatch: pytest.MonkeyPatch) -> list[float]:
+    """Record the client's backoff delays instead of sleeping through them."""
+    recorded: list[float] = []
+    sleep = asyncio.sleep
+
+    async def fake_sleep(delay: float, *args: Any) -> Any:
+        if delay:  # aiohttp itself yields with sleep(0).
+            recorded.append(delay)
+        return await sleep(0, *args)
+
+    monkeypatch.setattr(payments.asyncio, "sleep", fake_sleep)
+    return recorded
+
+
+def with_client(
+    replies: list[Reply],
+    test: Callable[[YooKassaClient, FakeYooKassa], Awaitable[None]],
+    **options: Any,
+) -> FakeYooKassa:
+    server = FakeYooKassa(replies)
+
+    async def main() -> None:
+        await server.start()
+        client = YooKassaClient("shop", "secret", api_url=server.url, **options)
+        try:
+            await test(client, server)
+        finally:
+            await client.close()
+            await server.close()
+
+    asyncio.run(main())
+    return server
+
+
+def test_create_payment(delays: list[float]) -> None:
+    async def test(client: YooKassaClient, server: FakeYooKassa) -> None:
+        assert await client.create_payment({"amount": 1}, "key-1") == PAYMENT
+
+    server = with_client([reply()], test)
+    ((method, path, headers, body),) = server.requests
+    assert (method, path, body) == ("POST", "/v3/payments", {"amount": 1})
+    assert headers["Idempotence-Key"] == "key-1"
+    assert headers["Authorization"].startswith("Basic ")
+    assert delays == []
+
+
+def test_retries_keep_the_idempotence_key(delays: list[float]) -> None:
+    async def test(client: YooKassaClient, server: FakeYooKassa) -> None:
+        assert await client.create_payment({}, "key-1") == PAYMENT
+        assert client.stats()["create_payment"]["retries"] == 2
+
+    server = with_client([reply(500, {}), reply(503, {}), reply()], test)
+    assert [headers["Idempotence-Key"] for _, _, headers, _ in server.requests] == ["key-1"] * 3
+    assert len(delays) == 2
+
+
+def test_retry_after_202(delays: list[float]) -> None:
+    async def test(client: YooKassaClient, server: FakeYooKassa) -> None:
+        assert await client.create_payment({}, "key-1") == PAYMENT
+
+    accepted = reply(202, {"type": "processing", "retry_after": 1800})
+    server = with_client([accepted, reply()], test)
+    assert len(server.requests) == 2
+    assert delays == [1.8]
+
+
+def test_retry_after_header(delays: list[float]) -> None:
+    async def test(client: YooKassaClient, server: FakeYooKassa) -> None:
+        assert await client.get_payment("2d9a-pay") == PAYMENT
+
+    server = with_client([reply(429, {}, **{"Retry-After": "3"}), reply()], test)
+    assert [(method, path) for method, path, _, _ in server.requests] == [
+        ("GET", "/v3/payments/2d9a-pay"),
+    ] * 2
+    assert delays == [3.0]
+
+
+def test_timeouts_are_retried(delays: list[float]) -> None:
+    async def test(client: YooKassaClient, server: FakeYooKassa) -> None:
+        assert await client.create_payment({}, "key-1") == PAYMENT
+
+    server = with_client([hang(1.0), reply()], test, timeout=0.2)
+    assert len(server.requests) == 2
+    assert len(delays) == 1
+
+
+def test_errors_are_not_retried(delays: list[float]) -> None:
+    async def test(client: YooKassaClient, server: FakeYooKassa) -> None:
+        with pytest.raises(YooKassaError) as error:
+            await client.create_payment({}, "key-1")
+        assert error.value.status == 400
+        assert error.value.code == "invalid_request"
+        assert str(error.value) == "Bad amount"
+        assert client.stats()["create_payment"]["failures"] == 1
+
+    body = {"type": "error", "code": "invalid_request", "description": "Bad amount"}
+    server = with_client([reply(400, body), reply()], test)
+    assert len(server.requests) == 1
+    assert delays == []
+
+
+def test_gives_up_after_retries(delays: list[float]) -> None:
+    async def test(client: YooKassaClient, server: FakeYooKassa) -> None:
+        with pytest.raises(YooKassaError, match="after 3 attempts: HTTP 502"):
+            await client.create_payment({}, "key-1")
+
+    server = with_client([reply(502, {})] * 3, test, retries=2)
+    assert len(server.requests) == 3
+    assert len(delays) == 2
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        {"status": "pending"},
+        {"id": "2d9a-pay"},
+        {"id": 1, "status": "pending"},
+        "not json",
+    ],
+)
+def test_malformed_payment(body: Any, delays: list[float]) -> None:
+    async def test(client: YooKassaClient, server: FakeYooKassa) -> None:
+        with pytest.raises(YooKassaError, match="Malformed"):
+            await client.get_payment("2d9a-pay")
+
+    with_client([reply(200, body)], test)
+
+
+def run_create(
+    monkeypatch: pytest.MonkeyPatch,
+    body: Any,
+    create: Callable[[], Awaitable[payments.YooKassaPayment]],
+) -> tuple[payments.YooKassaPayment, FakeYooKassa]:
+    result: list[payments.YooKassaPayment] = []
+
+    async def test(client: YooKassaClient, server: FakeYooKassa) -> None:
+        monkeypatch.setattr(payments, "_client", client)
+        result.append(await create())
+
+    server = with_client([reply(200, body)], test)
+    return result[0], server
+
+
+def test_create_payment_card(monkeypatch: pytest.MonkeyPatch) -> None:
+    payment, server = run_create(
+        monkeypatch,
+        PAYMENT,
+        lambda: payments.create_payment_card(7, 1500, "Order 7", "key-7", "https://t.me/shop"),
+    )
+    assert payment == payments.YooKassaPayment("2d9a-pay", "https://pay.example/2d9a", "pending")
+    ((_, _, headers, body),) = server.requests
+    assert headers["Idempotence-Key"] == "key-7"
+    assert body["amount"] == {"value": "1500", "currency": "RUB"}
+    assert body["confirmation"]["return_url"] == "https://t.me/shop"
+    assert body["metadata"] == {"order_id": "7"}
+
+
+def test_create_payment_sbp_uses_qr_data(monkeypatch: pytest.MonkeyPatch) -> None:
+    body = {
+        "id": "2d9a-pay",
+        "status": "pending",
+        "confirmation": {"type": "qr", "confirmation_data": "https://qr.nspk.ru/2d9a"},
+    }
+    payment, _ = run_create(
+        monkeypatch, body, lambda: payments.create_payment_sbp(7, 1500, "Order 7", "key-7")
+    )
+    assert payment.confirmation_url == "https://qr.nspk.ru/2d9a"
+
+
+@pytest.mark.parametrize("confirmation", [None, {}, {"type": "redirect"}])
+def test_create_payment_without_confirmation(
+    monkeypatch: pytest.MonkeyPatch, confirmation: Any
+) -> None:
+    body = {"id": "2d9a-pay", "status": "pending", "confirmation": confirmation}
+    with pytest.raises(YooKassaError, match="confirmation_url"):
+        run_create(
+            monkeypatch, body, lambda: payments.create_payment_card(7, 1500, "Order 7", "key-7")
+        )
+    with pytest.raises(YooKassaError, match="confirmation_url or confirmation_data"):
+        run_create(
+            monkeypatch, body, lambda: payments.create_payment_sbp(7, 1500, "Order 7", "key-7")
+        )
+
+
+@pytest.mark.parametrize(
+    "first",
+    [
+        reply(202, {"type": "processing"}),
+        reply(202, {"type": "processing", "retry_after": "soon"}),
+        reply(429, {"retry_after": None}),
+        reply(503, {"retry_after": [1]}),
+    ],
+)
+def test_bad_retry_after_falls_back_to_backoff(first: Reply, delays: list[float]) -> None:
+    async def test(client: YooKassaClient, server: FakeYooKassa) -> None:
+        assert await client.create_payment({}, "key-1") == PAYMENT
+
+    server = with_client([first, reply()], test)
+    assert len(server.requests) == 2
+    assert len(delays) == 1 and 0 < delays[0] <= payments._BACKOFF
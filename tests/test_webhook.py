@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Message
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from bot.webhook import BoundedRequestHandler
+
+SECRET = "s3cret"
+UPDATE = {
+    "update_id": 1,
+    "message": {
+        "message_id": 1,
+        "date": 0,
+        "chat": {"id": 1000, "type": "private"},
+        "from": {"id": 1000, "is_bot": False, "first_name": "u"},
+        "text": "hi",
+    },
+}
+
+
+def post_update(secret: str) -> tuple[int, list[str]]:
+    seen: list[str] = []
+
+    async def main() -> int:
+        dp = Dispatcher()
+        router = Router()
+
+        @router.message()
+        async def record(message: Message) -> None:
+            seen.append(message.text or "")
+
+        dp.include_router(router)
+        bot = Bot("42:TEST")
+        handler = BoundedRequestHandler(dp, bot, secret_token=SECRET, max_concurrency=4)
+        app = web.Application()
+        handler.register(app, path="/webhook")
+        client = TestClient(TestServer(app))
+        await client.start_server()
+        try:
+            headers = {"X-Telegram-Bot-Api-Secret-Token": secret}
+            async with client.post("/webhook", json=UPDATE, headers=headers) as resp:
+                status = resp.status
+            await handler.drain(1)
+        finally:
+            await client.close()
+            await bot.session.close()
+        return status
+
+    return asyncio.run(main()), seen
+
+
+def test_accepts_the_secret() -> None:
+    assert post_update(SECRET) == (200, ["hi"])
+
+
+@pytest.mark.parametrize("secret", ["", "wrong", "sécret"])
+def test_rejects_other_secrets(secret: str) -> None:
+    assert post_update(secret) == (401, [])
@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from pathlib import Path
+from typing import Any
+
+import aiosqlite
+
+from bot.storage.pool import close_pools, get_pool
+from bot.storage.writer import WriteQueue
+
+
+def with_queue(tmp_path: Path, test: Any, **options: Any) -> None:
+    async def main() -> None:
+        queue = WriteQueue(get_pool(str(tmp_path / "bot.db")), **options)
+        try:
+            await queue.submit(lambda conn: conn.execute("CREATE TABLE t (v INTEGER)"))
+            await test(queue)
+        finally:
+            await queue.close()
+            await close_pools()
+
+    asyncio.run(main())
+
+
+def insert(value: int) -> Any:
+    async def op(conn: aiosqlite.Connection) -> int:
+        await conn.execute("INSERT INTO t VALUES (?)", (value,))
+        return value
+
+    return op
+
+
+def test_isolated_write_does_not_wait_for_company(tmp_path: Path) -> None:
+    async def test(queue: WriteQueue) -> None:
+        started = time.perf_counter()
+        assert await queue.submit(insert(1)) == 1
+        # Far below max_latency: a lone write must not linger for a batch.
+        assert time.perf_counter() - started < 0.5
+
+    with_queue(tmp_path, test, max_latency=2.0)
+
+
+def test_concurrent_writes_share_a_commit(tmp_path: Path) -> None:
+    async def test(queue: WriteQueue) -> None:
+        commits = queue.commits
+        values = await asyncio.gather(*(queue.submit(insert(value)) for value in range(10)))
+        assert values == list(range(10))
+        assert queue.commits == commits + 1
+
+    with_queue(tmp_path, test)